@@ -0,0 +1,343 @@
+
+# Streaming parser of EyeLink ASC files (edf2asc output) to memory mapped columns
+#
+# Sample lines are parsed per chunk with array operations, event lines one by one, and
+# the columns appended to .npy files as they go. Usage (numpy only):
+#
+#     import AscParser
+#     stats = AscParser.parseAsc('subject1.asc', 'subject1_columns')
+#     data = AscParser.loadColumns('subject1_columns') # memory mapped, nothing read yet
+#     t, x = data['samples']['time'], data['samples']['gaze_x']
+#     onsets = data['fixations']['start'][data['fixations']['eye'] == AscParser.RIGHT_EYE]
+#
+# Output directory: one table per subdirectory, one .npy per column:
+#   samples      time, gaze_x, gaze_y, pupil (monocular recording) or time, gaze_x_l,
+#                gaze_y_l, pupil_l, gaze_x_r, gaze_y_r, pupil_r (binocular), missing gaze NaN
+#   fixations    eye, start, end, duration, gaze_x, gaze_y, pupil (average gaze)
+#   saccades     eye, start, end, duration, start_x, start_y, end_x, end_y, amplitude, peak_velocity
+#   blinks       eye, start, end, duration
+#   messages     time, text_start, text_length, and text: the UTF-8 bytes of all the texts
+#                one after the other (see messageText)
+#   recordings   time, eye, rate of each SAMPLES line
+# Times are tracker ms, eye is LEFT_EYE, RIGHT_EYE or BINOCULAR as in pylink.
+
+import os
+import struct
+import time
+import numpy as np
+
+LEFT_EYE, RIGHT_EYE, BINOCULAR = 0, 1, 2
+
+_eyeCodes = {b'L': LEFT_EYE, b'R': RIGHT_EYE}
+_eventTables = {b'EFIX': 'fixations', b'ESACC': 'saccades', b'EBLINK': 'blinks'}
+
+tables = {
+    'fixations': [('eye', 'i1'), ('start', 'f8'), ('end', 'f8'), ('duration', 'f4'), ('gaze_x', 'f4'),
+                  ('gaze_y', 'f4'), ('pupil', 'f4')],
+    'saccades': [('eye', 'i1'), ('start', 'f8'), ('end', 'f8'), ('duration', 'f4'), ('start_x', 'f4'),
+                 ('start_y', 'f4'), ('end_x', 'f4'), ('end_y', 'f4'), ('amplitude', 'f4'), ('peak_velocity', 'f4')],
+    'blinks': [('eye', 'i1'), ('start', 'f8'), ('end', 'f8'), ('duration', 'f4')],
+    'messages': [('time', 'f8'), ('text_start', 'i8'), ('text_length', 'i4')],
+    'recordings': [('time', 'f8'), ('eye', 'i1'), ('rate', 'f4')],
+}
+
+
+def sampleColumns(eye):
+    ''' names of the sample columns of a recording of eye'''
+    names = ['gaze_x', 'gaze_y', 'pupil']
+    if eye == BINOCULAR:
+        names = [name + '_l' for name in names] + [name + '_r' for name in names]
+    return ['time'] + names
+
+
+class _ColumnWriter(object):
+    '''
+    .npy file written in pieces. The header is written first with room for any length
+    and rewritten with the final length by close(), so the file is never rewritten.
+    '''
+    header_bytes = 128
+
+    def __init__(self, filename, dtype):
+        self.dtype = np.dtype(dtype)
+        self.count = 0
+        self._file = open(filename, 'wb')
+        self._file.write(self._header())
+
+    def _header(self):
+        header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }"%(self.dtype.str, self.count)
+        header = header.ljust(self.header_bytes - 11) + '\n'
+        return b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header.encode('latin1')
+
+    def append(self, values):
+        values = np.ascontiguousarray(values, dtype=self.dtype)
+        self._file.write(values.tobytes())
+        self.count += len(values)
+
+    def close(self):
+        self._file.seek(0)
+        self._file.write(self._header())
+        self._file.close()
+
+
+class _TableWriter(object):
+
+    def __init__(self, directory, columns):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.columns = [name for name, dtype in columns]
+        self._writers = dict((name, _ColumnWriter(os.path.join(directory, name + '.npy'), dtype)) for name, dtype in columns)
+
+    def __len__(self):
+        return self._writers[self.columns[0]].count
+
+    def append(self, rows):
+        ''' rows: list of tuples, or one 2D array, of the columns in order'''
+        if not len(rows):
+            return
+        if isinstance(rows, np.ndarray):
+            columns = rows.T
+        else:
+            columns = list(zip(*rows))
+        for name, values in zip(self.columns, columns):
+            self._writers[name].append(values)
+
+    def add_column(self, name, dtype):
+        ''' a column not in the table rows (of its own length)'''
+        self._writers[name] = _ColumnWriter(os.path.join(self.directory, name + '.npy'), dtype)
+        return self._writers[name]
+
+    def close(self):
+        for writer in self._writers.values():
+            writer.close()
+
+
+_numberBytes = np.zeros(256, dtype=bool) # bytes of the numbers and separators np.fromstring parses
+_numberBytes[np.frombuffer(b'0123456789.-+eE \t\r\n', dtype=np.uint8)] = True
+
+
+def _keepMask(size, starts, cuts):
+    ''' bool mask of the bytes [start, cut] of each line'''
+    keep = np.zeros(size + 1, dtype=np.int8)
+    keep[cuts + 1] = -1
+    keep[starts] += 1
+    return np.cumsum(keep[:-1], dtype=np.int8).view(bool)
+
+
+def _number(token):
+    return np.nan if token == b'.' else float(token)
+
+
+def _eventRow(fields, columns):
+    ''' ['EFIX', 'R', t0, t1, ...] -> (eye, t0, t1, ...) with the first columns - 1 numbers'''
+    values = [_number(token) for token in fields[2:len(columns) + 1]]
+    values += [np.nan] * (len(columns) - 1 - len(values))
+    return tuple([_eyeCodes.get(fields[1], -1)] + values)
+
+
+def _recordingEye(fields):
+    left, right = b'LEFT' in fields, b'RIGHT' in fields
+    return BINOCULAR if left and right else LEFT_EYE if left else RIGHT_EYE
+
+
+class _Parser(object):
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.writers = dict((name, _TableWriter(os.path.join(directory, name), columns)) for name, columns in tables.items())
+        self.text = self.writers['messages'].add_column('text', 'u1')
+        self.rows = dict((name, []) for name in tables) # events of the chunk, written together
+        self.texts, self.textBytes = [], 0
+        self.samples = None # created with the columns of the first recording
+        self.fields = None # numbers kept per sample line
+        self.eye = None # eye of the sample columns
+        self.recordingEye = None # eye of the current recording
+        self.startTime = np.nan # of the last START line
+        self.stats = dict(bytes=0, lines=0, samples=0, skipped=0, slow_lines=0, slow_groups=0)
+
+    def _openSamples(self, eye):
+        self.eye = eye
+        columns = sampleColumns(eye)
+        self.fields = len(columns)
+        self.samples = _TableWriter(os.path.join(self.directory, 'samples'), [(name, 'f8' if name == 'time' else 'f4') for name in columns])
+
+    def chunk(self, buf):
+        ''' buf: bytearray of whole lines (ending with a newline), modified in place'''
+        a = np.frombuffer(buf, dtype=np.uint8)
+        ends = np.flatnonzero(a == 10)
+        starts = np.concatenate([[0], ends[:-1] + 1])
+        first = a[starts]
+        is_sample = (first >= 48) & (first <= 57)
+        self.stats['bytes'] += len(a)
+        self.stats['lines'] += len(ends)
+        # event lines first, noting where the recording eye changes (SAMPLES lines)
+        changes, eyes = [0], [self.recordingEye]
+        for i in np.flatnonzero(~is_sample & (starts < ends)):
+            if self._event(bytes(buf[starts[i]:ends[i]])):
+                changes.append(i)
+                eyes.append(self.recordingEye)
+        for name, rows in self.rows.items():
+            self.writers[name].append(rows)
+            del rows[:]
+        if self.texts:
+            self.text.append(np.frombuffer(b''.join(self.texts), dtype=np.uint8))
+            del self.texts[:]
+            self.textBytes = 0
+        lines = np.flatnonzero(is_sample)
+        if not len(lines):
+            return
+        if self.samples is None: # the first recording, or no SAMPLES line at all
+            self._openSamples(next((eye for eye in eyes if eye is not None), RIGHT_EYE))
+        # samples of a binocular recording in monocular columns or the reverse are skipped
+        matching = np.array([eye is None or (eye == BINOCULAR) == (self.eye == BINOCULAR) for eye in eyes])
+        same = matching[np.searchsorted(changes, lines, side='right') - 1]
+        self.stats['skipped'] += int(np.count_nonzero(~same))
+        lines = lines[same]
+        tabs = np.flatnonzero(a == 9)
+        first_tab = np.searchsorted(tabs, starts[lines])
+        counts = np.searchsorted(tabs, ends[lines]) - first_tab
+        parts = [] # (line starts, values) of each group, written back in line order
+        for count in np.unique(counts):
+            group = counts == count
+            parts.append(self._samples(a, starts[lines[group]], ends[lines[group]], tabs, first_tab[group], int(count)))
+        if len(parts) > 1:
+            order = np.argsort(np.concatenate([first for first, values in parts]), kind='stable')
+            parts = [(None, np.concatenate([values for first, values in parts])[order])]
+        for first, values in parts:
+            self.samples.append(values)
+            self.stats['samples'] += len(values)
+
+    def _event(self, line):
+        ''' queues the event or message of line, returns True for a SAMPLES line'''
+        fields = line.split()
+        key = fields[0]
+        if key == b'MSG' and len(fields) > 1:
+            parts = line.split(None, 2)
+            text = parts[2].rstrip(b'\r') if len(parts) > 2 else b''
+            self.rows['messages'].append((_number(parts[1]), self.text.count + self.textBytes, len(text)))
+            self.texts.append(text)
+            self.textBytes += len(text)
+        elif key in _eventTables:
+            table = _eventTables[key]
+            self.rows[table].append(_eventRow(fields, tables[table]))
+        elif key == b'SAMPLES':
+            eye = _recordingEye(fields)
+            rate = float(fields[fields.index(b'RATE') + 1]) if b'RATE' in fields[:-1] else np.nan
+            self.rows['recordings'].append((self.startTime, eye, rate))
+            self.recordingEye = eye
+            return True
+        elif key == b'START' and len(fields) > 1:
+            self.startTime = _number(fields[1])
+        return False
+
+    def _samples(self, a, starts, ends, tabs, first_tab, count):
+        ''' sample lines with count tabs each: (starts, values) of the lines parsed, values
+        being the first self.fields numbers of each line'''
+        fields = self.fields
+        n = len(starts)
+        if count < fields - 1:
+            self.stats['skipped'] += n
+            return starts[:0], np.zeros((0, fields))
+        # keep each line up to the tab after its last kept number (flags, velocities... dropped)
+        cuts = tabs[first_tab + fields - 1] if count >= fields else ends
+        keep = _keepMask(len(a), starts, cuts)
+        # missing values: a lone '.' parsed as 0 then replaced by NaN
+        dots = np.flatnonzero((a == 46) & keep)
+        if len(dots):
+            before, after = a[dots - 1], a[np.minimum(dots + 1, len(a) - 1)]
+            dots = dots[((before == 32) | (before == 9)) & ((after == 9) | (after == 32) | (after == 10) | (after == 13))]
+            a[dots] = 48
+        # lines with other tokens (e.g. flags '...', 'I..' left in the kept fields) are parsed one by one
+        odd = np.flatnonzero(keep & ~_numberBytes[a])
+        doubled = np.flatnonzero(keep[:-1] & (a[:-1] == 46) & (a[1:] == 46))
+        odd = np.unique(np.searchsorted(starts, np.concatenate([odd, doubled]), side='right') - 1)
+        fast = np.ones(n, dtype=bool)
+        fast[odd] = False
+        values = np.full((n, fields), np.nan)
+        parsed = np.ones(n, dtype=bool)
+        if len(odd):
+            keep = _keepMask(len(a), starts[fast], cuts[fast])
+            values[odd], parsed[odd] = self._slowSamples(a, starts[odd], cuts[odd], fields)
+            self.stats['slow_lines'] += len(odd)
+        numbers = np.fromstring(a[keep].tobytes(), sep=' ')
+        if len(numbers) == np.count_nonzero(fast) * fields:
+            values[fast] = numbers.reshape(-1, fields)
+        else: # numbers not adding up: the whole group line by line
+            values[fast], parsed[fast] = self._slowSamples(a, starts[fast], cuts[fast], fields)
+            self.stats['slow_lines'] += int(np.count_nonzero(fast))
+            self.stats['slow_groups'] += 1
+        if len(dots):
+            line = np.searchsorted(starts, dots, side='right') - 1
+            field = np.searchsorted(tabs, dots) - first_tab[line]
+            values[line, field] = np.nan
+        self.stats['skipped'] += int(np.count_nonzero(~parsed))
+        return starts[parsed], values[parsed]
+
+    def _slowSamples(self, a, starts, cuts, fields):
+        ''' (values, parsed) of lines: their first fields numbers, parsed False for a line
+        with fewer or something else'''
+        values = np.full((len(starts), fields), np.nan)
+        parsed = np.zeros(len(starts), dtype=bool)
+        for i, (start, cut) in enumerate(zip(starts, cuts)):
+            tokens = a[start:cut].tobytes().split()[:fields]
+            try:
+                row = [float(token) for token in tokens]
+            except ValueError:
+                continue
+            if len(row) == fields:
+                values[i], parsed[i] = row, True
+        return values, parsed
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+        if self.samples is None:
+            self._openSamples(RIGHT_EYE)
+        self.samples.close()
+        for name, writer in list(self.writers.items()) + [('samples', self.samples)]:
+            self.stats[name] = len(writer)
+
+
+def parseAsc(filename, directory, chunk_bytes=16 << 20):
+    '''
+    Parses the ASC file filename to directory (created, existing columns overwritten),
+    reading chunk_bytes at a time. Returns stats: bytes, lines, the rows of each table,
+    skipped (sample lines not parsed: a different eye than the first recording, or not numbers),
+    slow_lines (sample lines parsed one by one, e.g. with flags in the kept fields),
+    slow_groups (groups of lines whose numbers did not add up, all parsed one by one) and secs.
+    '''
+    t0 = time.perf_counter()
+    parser = _Parser(directory)
+    rest = bytearray()
+    with open(filename, 'rb') as f:
+        while True:
+            data = f.read(chunk_bytes)
+            if not data:
+                break
+            rest += data
+            cut = rest.rfind(b'\n') + 1
+            if cut:
+                parser.chunk(rest[:cut])
+                del rest[:cut]
+    if rest:
+        parser.chunk(rest + b'\n')
+    parser.close()
+    parser.stats['secs'] = time.perf_counter() - t0
+    return parser.stats
+
+
+def loadColumns(directory, mmap_mode='r'):
+    ''' {table: {column: array}} of a parseAsc output, memory mapped by default'''
+    data = {}
+    for table in sorted(os.listdir(directory)):
+        path = os.path.join(directory, table)
+        if os.path.isdir(path):
+            data[table] = dict((name[:-4], np.load(os.path.join(path, name), mmap_mode=mmap_mode))
+                               for name in sorted(os.listdir(path)) if name.endswith('.npy'))
+    return data
+
+
+def messageText(messages, i):
+    ''' text of message i of the messages table of loadColumns'''
+    start = int(messages['text_start'][i])
+    return messages['text'][start:start + int(messages['text_length'][i])].tobytes().decode('utf-8', 'replace')
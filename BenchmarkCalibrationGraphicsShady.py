@@ -0,0 +1,793 @@
+
+# Micro-benchmarks for the CalibrationGraphicsShady hot paths
+# run with: python BenchmarkCalibrationGraphicsShady.py
+# pylink and Shady are replaced by PylinkSimulator and HeadlessShady, no tracker nor display needed
+
+import time
+import sys
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import numpy as np
+
+import PylinkSimulator
+import HeadlessShady
+PylinkSimulator.install()
+HeadlessShady.install()
+import CalibrationGraphicsShady as cgs
+
+camera_sizes = [(192, 160), (384, 320), (640, 480)] # low res, high res and full camera image
+
+
+def _rate(func, n, min_secs=0.5):
+    ''' calls func() in batches of n until min_secs elapsed, returns calls per second'''
+    count, t0 = 0, time.perf_counter()
+    while True:
+        for i in range(n):
+            func()
+        count += n
+        elapsed = time.perf_counter() - t0
+        if elapsed >= min_secs:
+            return count / elapsed
+
+
+def _legacyImageLine(array, width, line, totlines, buff):
+    ''' per pixel copy as draw_image_line used to do it, reference for the benchmarks'''
+    if array.shape[1] != width:
+        array = np.zeros((totlines, width), dtype=np.uint8)
+    for i in range(width):
+        try: array[line-1, i] = buff[i]
+        except Exception:
+            print('Failed to draw pixel to image line %d %d'%(line-1, i))
+    return array
+
+
+def benchmarkLineIngest(sizes=camera_sizes):
+    ''' lines/second for the legacy per pixel loop and CameraImageBuffer.ingest,
+    with the line given as bytes (zero-copy path) or as a list of ints'''
+    print('draw_image_line ingest (lines/s)')
+    for width, totlines in sizes:
+        frame = np.random.randint(0, 256, (totlines, width)).astype(np.uint8)
+        for kind, lines in [('bytes', [row.tobytes() for row in frame]), ('list', [row.tolist() for row in frame])]:
+            state = {'line': 0, 'array': np.zeros((totlines, width), dtype=np.uint8)}
+            buffer = cgs.CameraImageBuffer()
+
+            def legacy():
+                state['line'] = state['line'] % totlines + 1
+                state['array'] = _legacyImageLine(state['array'], width, state['line'], totlines, lines[state['line']-1])
+
+            def ingest():
+                state['line'] = state['line'] % totlines + 1
+                buffer.ingest(width, state['line'], totlines, lines[state['line']-1])
+
+            before, after = _rate(legacy, totlines), _rate(ingest, totlines)
+            assert np.array_equal(buffer.frame, frame)
+            print('  %4dx%-4d %-5s before %10.0f  after %10.0f  (x%.1f)'%(width, totlines, kind, before, after, after/before))
+
+
+def _graphics(target='full', threaded=False, **tracker_options):
+    ''' CalibrationGraphics on a simulated tracker and a headless window (frames rendered on demand)'''
+    win = HeadlessShady.World(size=(1920, 1080))
+    tracker = PylinkSimulator.EyeLink(**tracker_options)
+    genv = cgs.CalibrationGraphics(tracker, win, target=target, threaded_image=threaded)
+    genv.setCalibrationSounds('off', 'off', 'off')
+    PylinkSimulator.openGraphicsEx(genv)
+    return genv
+
+
+def _grayPalette(n=256):
+    levels = list(range(n))
+    return levels, levels[::-1], [v//2 for v in levels]
+
+
+def benchmarkEyeImageConversion(sizes=camera_sizes):
+    ''' frames/second converting a palette index frame to the RGB eye image,
+    former PIL round trip vs palette lookup table'''
+    print('eye image conversion to 640x480 RGB(A) (frames/s)')
+    genv = _graphics()
+    genv.set_image_palette(*_grayPalette())
+    for width, totlines in sizes:
+        frame = np.random.randint(0, 256, (totlines, width)).astype(np.uint8)
+        genv.eye_image_backend = 'pil'
+        reference = genv._convertEyeImage(frame).copy()
+        before = _rate(lambda: genv._convertEyeImage(frame), 10)
+        genv.eye_image_backend = 'numpy'
+        assert np.array_equal(genv._convertEyeImage(frame)[..., :3], reference)
+        after = _rate(lambda: genv._convertEyeImage(frame), 10)
+        print('  %4dx%-4d pil %8.0f  lut %8.0f  (x%.1f)'%(width, totlines, before, after, after/before))
+
+
+def benchmarkResampling(sizes=camera_sizes, dst_size=(640, 480)):
+    ''' frames/second resizing an RGBA camera frame to the eye image size,
+    ImageOps.fit() vs ImageResampler for each mode (first call, with the map computation, in ms),
+    camera sizes equal to dst_size are skipped (nothing to resample)'''
+    print('resampling RGBA to %dx%d (frames/s, pil / ImageResampler)'%tuple(dst_size))
+    try:
+        Image, ImageOps = cgs._importPIL()
+    except ImportError:
+        Image = ImageOps = None
+    for width, totlines in sizes:
+        if (width, totlines) == tuple(dst_size): # ImageResampler returns the frame as is
+            print('  %4dx%-4d same size, not resampled'%(width, totlines))
+            continue
+        rgba = np.random.randint(0, 256, (totlines, width, 4)).astype(np.uint8)
+        results = []
+        for mode in cgs.ImageResampler.modes:
+            resampler = cgs.ImageResampler(mode)
+            t0 = time.perf_counter()
+            resampler.resample(rgba, dst_size)
+            first = (time.perf_counter() - t0) * 1e3
+            after = _rate(lambda: resampler.resample(rgba, dst_size), 10)
+            method = {'nearest': 'NEAREST', 'bilinear': 'BILINEAR'}.get(mode)
+            if ImageOps is None or method is None:
+                results.append('%s %.0f (%.1f ms)'%(mode, after, first))
+                continue
+            image = Image.fromarray(rgba)
+            method = getattr(Image, method)
+            before = _rate(lambda: np.asarray(ImageOps.fit(image, dst_size, method=method)), 10)
+            results.append('%s pil %.0f / %.0f (%.1f ms)'%(mode, before, after, first))
+        print('  %4dx%-4d %s'%(width, totlines, '  '.join(results)))
+
+
+target_types = {'full': 'Full', 'disk': 'Disk', 'circle': 'Circle', 'cross': 'Cross',
+                'full_quad': 'FullQuad', 'circle_quad': 'CircleQuad', 'cross_quad': 'CrossQuad'}
+
+
+def benchmarkTargets(sizes=(16, 24, 32, 48, 64, 96, 128)):
+    ''' creations and set_target_size calls per second for each target type, with the
+    stimuli created, vertices written and texture bytes uploaded per resize, and the
+    vertices drawn per frame once the target is shown'''
+    print('calibration targets (calls/s)')
+    for name, cls in target_types.items():
+        cls = getattr(cgs, cls)
+        win = HeadlessShady.World(size=(1920, 1080))
+        create = _rate(lambda: cls(win), 10)
+        target = cls(win)
+        state = {'k': 0}
+
+        def resize():
+            state['k'] += 1
+            target.set_target_size(sizes[state['k'] % len(sizes)])
+
+        win.RenderFrame()
+        resize_rate = _rate(resize, len(sizes))
+        totals = win.RenderFrame()
+        for stim in list(win.stimuli):
+            stim.Leave()
+        target = cls(win)
+        target.draw([960, 540])
+        drawn = win.RenderFrame().drawn_vertices
+        print('  %-11s create %8.0f  set_target_size %8.0f  (per resize: %.1f stimuli created, %.0f vertices, %.0f texture bytes)  drawn vertices %d'%(
+            name, create, resize_rate, totals.created/float(state['k']), totals.vertices_written/float(state['k']),
+            totals.texture_bytes/float(state['k']), drawn))
+
+
+def benchmarkBeeps(backend='null', n=1000):
+    ''' setCalibrationSounds() time with the default wav files, time play_beep() takes and
+    target beep onset relative to draw_cal_target (called in pylink's order),
+    null audio backend by default (no sound card needed)'''
+    print('calibration beeps, %s audio backend'%backend)
+    genv = _graphics()
+    genv._beeps = cgs.BeepBank(backend)
+    t0 = time.perf_counter()
+    genv.setCalibrationSounds('', '', '')
+    load = (time.perf_counter() - t0) * 1e3
+    for k in range(n):
+        genv.erase_cal_target()
+        genv.play_beep(PylinkSimulator.CAL_TARG_BEEP)
+        genv.draw_cal_target(960, 540)
+    latency = genv.getBeepLatency()
+    print('  load %.1f ms  play_beep mean %.1f us  max %.1f us  onset vs draw_cal_target mean %.1f us  max %.1f us  (stream %s)'%(
+        load, latency['play_mean']*1e6, latency['play_max']*1e6, latency['mean']*1e6, latency['max']*1e6, latency['stream']))
+
+
+def benchmarkSetupSession(sizes=camera_sizes, frames=60, frame_rate=60.):
+    ''' replays a camera setup + 9 point calibration at max speed, headless World rendering
+    at frame_rate: time in the display callbacks and what would have reached the GPU'''
+    print('setup session, %d camera frames at max line rate'%frames)
+    for width, totlines in sizes:
+        for threaded in (False, True):
+            genv = _graphics(camera_size=(width, totlines), camera_frames=frames, threaded=threaded)
+            genv.win.frame_rate = frame_rate
+            genv.win.Start()
+            t0 = time.perf_counter()
+            genv.tracker.doTrackerSetup()
+            elapsed = time.perf_counter() - t0
+            genv.win.Close()
+            stats, totals = genv.tracker.stats, genv.win.Totals()
+            print('  %4dx%-4d %-8s %6.0f lines/s  draw_image_line %5.1f ms  shady frames %4d  texture MB %6.1f  points writes %4d  vertices %6d  (%.2f s)'%(
+                width, totlines, 'threaded' if threaded else 'direct', stats['line_rate'], stats['draw_image_line'][1]*1e3,
+                totals.index, totals.texture_bytes/1e6, totals.writes.get('points', 0), totals.vertices_written, elapsed))
+
+
+def benchmarkEyeImageRate(size=(384, 320), camera_rate=250., secs=2., frame_rate=60.):
+    ''' camera frames streamed at camera_rate for secs to a World rendering at frame_rate, with
+    no limit and each setEyeImageRate() limit: eye images offered vs shown per second and
+    share of the time spent in draw_image_line'''
+    width, totlines = size
+    print('eye image rate, %dx%d camera at %.0f frames/s, display at %.0f Hz'%(width, totlines, camera_rate, frame_rate))
+    limits = [('no limit', None), ('display', dict()), ('30/s', dict(max_rate=30, wait_for_display=False)),
+              ('10% CPU', dict(max_load=0.1, wait_for_display=False))]
+    for name, limit in limits:
+        genv = _graphics(camera_size=size, camera_frames=int(camera_rate*secs), line_rate=camera_rate*totlines, target_duration=0)
+        if limit is not None:
+            genv.setEyeImageRate(**limit)
+        genv.win.frame_rate = frame_rate
+        genv.win.Start()
+        genv.tracker.doTrackerSetup()
+        genv.win.Close()
+        stats, images = genv.tracker.stats, genv.getEyeImageStats()
+        elapsed = stats['lines_sent']/stats['line_rate']
+        print('  %-9s offered %5.1f/s  shown %5.1f/s  draw_image_line %4.1f%% of the time  (skipped %d: %s)'%(
+            name, images['received']/elapsed, images['displayed']/elapsed, stats['draw_image_line'][1]/elapsed*100,
+            images['skipped'], ', '.join('%s %d'%(key[8:], value) for key, value in sorted(genv.getEyeImageRate().items())
+                                       if key.startswith('skipped_')) or '-'))
+
+
+def benchmarkEyeImageUpload(sizes=camera_sizes, frames=60):
+    ''' texture bytes uploaded per displayed camera frame and time in draw_image_line,
+    CPU palette + resize ('numpy') vs index frame with render side lookup ('shader')'''
+    print('eye image upload per frame, %d camera frames'%frames)
+    for width, totlines in sizes:
+        results = []
+        for backend in ('numpy', 'shader'):
+            genv = _graphics(camera_size=(width, totlines), camera_frames=frames)
+            genv.eye_image_backend = backend
+            genv.tracker.doTrackerSetup()
+            genv.win.RenderFrame()
+            totals = genv.win.Totals()
+            displayed = genv.getEyeImageStats()['displayed']
+            results.append('%s %8.0f bytes %6.1f ms'%(backend, totals.texture_bytes/float(displayed), genv.tracker.stats['draw_image_line'][1]*1e3))
+        print('  %4dx%-4d %s'%(width, totlines, '  '.join(results)))
+
+
+def benchmarkFrameRecording(sizes=camera_sizes, filename='benchmark.cgsrec'):
+    ''' CameraFrameRecorder.append_frame calls per second, and a setup session recorded:
+    time in draw_image_line with and without recording, frames read back'''
+    import CameraFrameRecording
+    print('camera frame recording')
+    for width, totlines in sizes:
+        frame = np.random.randint(0, 256, (totlines, width)).astype(np.uint8)
+        lines = np.random.rand(12, 5)
+        recorder = CameraFrameRecording.CameraFrameRecorder(filename, slots=300)
+        append = _rate(lambda: recorder.append_frame(frame, time.perf_counter(), lines), 30)
+        recorder.close()
+        times = []
+        for record in (False, True):
+            genv = _graphics(camera_size=(width, totlines), camera_frames=60)
+            if record:
+                genv.enableFrameRecording(filename, slots=300)
+            genv.tracker.doTrackerSetup()
+            genv.disableFrameRecording()
+            times.append(genv.tracker.stats['draw_image_line'][1])
+        reader = CameraFrameRecording.CameraFrameReader(filename)
+        assert np.array_equal(reader.frame(0), np.frombuffer(b''.join(genv.tracker._frames[1][0]), dtype=np.uint8).reshape(totlines, width))
+        print('  %4dx%-4d append_frame %6.0f/s  draw_image_line %.1f ms -> %.1f ms recording  (%d frames read back)'%(
+            width, totlines, append, times[0]*1e3, times[1]*1e3, len(reader)))
+        del reader
+    os.remove(filename)
+
+
+def benchmarkRecording(secs=2., sample_rate=1000.):
+    ''' CPU used while recording secs: former busy loop on the main thread vs RecordingSession
+    (with each link source), and the samples and events read'''
+    import RecordingSession
+    print('recording %.0f s at %.0f Hz (CPU s per s)'%(secs, sample_rate))
+    tracker = PylinkSimulator.EyeLink(sample_rate=sample_rate)
+    tracker.startRecording(1, 1, 1, 1)
+    cpu, t0 = time.process_time(), time.time()
+    while time.time()-t0<secs:
+        pass
+    tracker.stopRecording()
+    print('  busy loop          cpu %.2f  (nothing read)'%((time.process_time() - cpu)/secs))
+    for source in ('queue', 'newest'):
+        session = RecordingSession.RecordingSession(tracker, source=source)
+        cpu = time.process_time()
+        with session:
+            session.wait(secs)
+            snapshot = _rate(lambda: session.samples.snapshot(), 100, 0.1)
+        print('  session %-10s cpu %.2f  %5d samples  %3d events  %4d polls  snapshot %.0f/s'%(
+            source, (time.process_time() - cpu)/secs, len(session.samples), len(session.events), session.stats['polls'], snapshot))
+
+
+def benchmarkGazeClassifier(rates=(1000, 2000), secs=60., frame_rate=60.):
+    ''' online classification of secs of synthetic gaze fed frame by frame through a
+    ColumnBuffer: time per frame update (mean / max), vs classifying the whole history
+    again at the last frame, and saccades found vs simulated'''
+    import GazeClassifier
+    import RecordingSession
+    print('gaze classifier, %.0f s of samples fed at %.0f frames/s'%(secs, frame_rate))
+    for rate in rates:
+        model = PylinkSimulator.GazeModel(sample_rate=rate)
+        n = int(secs*rate)
+        gaze, t = model.gaze(0, n), np.arange(n)*1000./rate
+        simulated = sum(1 for segment in model.segments(0, n) if segment[0] == 'sacc' and segment[2] <= n)
+        buffer = RecordingSession.ColumnBuffer(RecordingSession.sample_columns)
+        classifier = GazeClassifier.GazeClassifier(sample_rate=rate)
+        per_frame, i, found = [], 0, 0
+        for k in range(1, int(secs*frame_rate) + 1):
+            for j in range(i, int(k*rate/frame_rate)):
+                buffer.append(t[j], gaze[j, 0], gaze[j, 1], 0, 1)
+            i = int(k*rate/frame_rate)
+            t0 = time.perf_counter()
+            found += sum(1 for event in classifier.follow(buffer) if event.kind == 'saccade_start')
+            per_frame.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        GazeClassifier.GazeClassifier(sample_rate=rate).update(t, gaze[:, 0], gaze[:, 1])
+        history = time.perf_counter() - t0
+        print('  %4d Hz  per frame mean %6.1f us  max %6.1f us  (%.1f Msamples/s)  whole history %6.1f ms  saccades %d / %d'%(
+            rate, np.mean(per_frame)*1e6, np.max(per_frame)*1e6, n/np.sum(per_frame)/1e6, history*1e3, found, simulated))
+
+
+def _writeSyntheticAsc(filename, size_mb, sample_rate=1000., binocular=False, block=100000):
+    ''' ASC file of about size_mb of GazeModel samples, with blinks (missing samples),
+    EFIX / ESACC / EBLINK events and a message per second, returns the samples written'''
+    model = PylinkSimulator.GazeModel(sample_rate=sample_rate)
+    step = 1000./sample_rate
+    eyes = 'LEFT\tRIGHT' if binocular else 'RIGHT'
+    line = '%.0f\t%7.1f\t%7.1f\t%7.1f\t%7.1f\t%7.1f\t%7.1f\t.....\n' if binocular else '%.0f\t%7.1f\t%7.1f\t%7.1f\t...\n'
+    missing = '%.0f\t   .\t   .\t    0.0\t   .\t   .\t    0.0\t.....\n' if binocular else '%.0f\t   .\t   .\t    0.0\t...\n'
+    t0, n = 1000000, 0
+    with open(filename, 'w') as f:
+        f.write('** CONVERTED FROM synthetic.edf\n** DATE: synthetic\n\n')
+        f.write('START\t%d \t%s\tSAMPLES\tEVENTS\n' % (t0, eyes))
+        f.write('SAMPLES\tGAZE\t%s\tRATE\t%.2f\tTRACKING\tCR\tFILTER\t2\n' % (eyes, sample_rate))
+        while f.tell() < size_mb * 1e6:
+            gaze = model.gaze(n, n + block)
+            t = t0 + (n + np.arange(block))*step
+            pupil = 1000 + 50*np.sin(t/700.)
+            blink = ((t - t0) % 3000) < 100 # 100 ms every 3 s
+            rows = np.column_stack([t, gaze, pupil] + ([gaze, pupil] if binocular else []))
+            f.writelines((missing % ti) if b else (line % tuple(row)) for ti, b, row in zip(t, blink, rows))
+            for kind, s0, s1, p0, p1 in model.segments(n, n + block):
+                if n <= s1 - 1 < n + block:
+                    a, b = t0 + s0*step, t0 + (s1 - 1)*step
+                    for eye in (('L', 'R') if binocular else ('R',)):
+                        if kind == 'fix':
+                            f.write('EFIX %s   %.0f\t%.0f\t%.0f\t%7.1f\t%7.1f\t%7d\n' % (eye, a, b, b - a + step, p0[0], p0[1], 1000))
+                        else:
+                            f.write('ESACC %s  %.0f\t%.0f\t%.0f\t%7.1f\t%7.1f\t%7.1f\t%7.1f\t%6.2f\t%7d\n' % (
+                                eye, a, b, b - a + step, p0[0], p0[1], p1[0], p1[1], np.hypot(*(p1 - p0))/40., 400))
+            for start in t[((t - t0) % 3000) == 0]:
+                f.write('EBLINK R %.0f\t%.0f\t100\n' % (start, start + 99))
+            for ti in t[((t - t0) % 1000) == 0]:
+                f.write('MSG\t%.0f TRIAL_VAR second %d\n' % (ti, (ti - t0)//1000))
+            n += block
+        f.write('END\t%.0f \tSAMPLES\tEVENTS\tRES\t  38.00\t  33.00\n' % (t0 + n*step))
+    return n
+
+
+def _lineByLineAsc(filename, max_bytes):
+    ''' samples parsed one line at a time with split / float, reference for the benchmark'''
+    samples, read = [], 0
+    with open(filename, 'rb') as f:
+        for line in f:
+            read += len(line)
+            if read > max_bytes:
+                break
+            if line[:1].isdigit():
+                fields = line.split()
+                samples.append([np.nan if v == b'.' else float(v) for v in fields[:4]])
+    return np.array(samples), read
+
+
+def benchmarkAscParser(size_mb=256, chunk_mb=(4, 16, 64), binocular=False, filename='benchmark.asc'):
+    ''' AscParser.parseAsc throughput (MB/s) on a synthetic ASC file of size_mb (use a few
+    thousand for multi-GB files), for each chunk size, vs parsing line by line'''
+    import AscParser
+    directory = filename + '.columns'
+    print('ASC parser, %s' % ('binocular' if binocular else 'monocular'))
+    t0 = time.perf_counter()
+    n = _writeSyntheticAsc(filename, size_mb, binocular=binocular)
+    size = os.path.getsize(filename)
+    print('  %.0f MB, %d samples written in %.1f s' % (size/1e6, n, time.perf_counter() - t0))
+    reference, read = _lineByLineAsc(filename, 32e6)
+    t0 = time.perf_counter()
+    _lineByLineAsc(filename, 32e6)
+    print('  line by line     %6.1f MB/s' % (read/1e6/(time.perf_counter() - t0)))
+    for chunk in chunk_mb:
+        stats = AscParser.parseAsc(filename, directory, chunk_bytes=int(chunk*(1 << 20)))
+        print('  chunks of %3d MB %6.1f MB/s  %d samples  %d fixations  %d saccades  %d blinks  %d messages  %d skipped' % (
+            chunk, stats['bytes']/1e6/stats['secs'], stats['samples'], stats['fixations'], stats['saccades'],
+            stats['blinks'], stats['messages'], stats['skipped']))
+    data = AscParser.loadColumns(directory)
+    samples = data['samples']
+    columns = np.column_stack([samples[name][:len(reference)] for name in AscParser.sampleColumns(
+        AscParser.BINOCULAR if binocular else AscParser.RIGHT_EYE)[:4]])
+    assert len(samples['time']) == n and np.allclose(columns, reference, equal_nan=True)
+    del data, samples
+    shutil.rmtree(directory)
+    os.remove(filename)
+
+
+def benchmarkGazeBinding(secs=3., frame_rate=60., sample_rate=1000.):
+    ''' stimulus bound to the simulated gaze on a World rendering at frame_rate: time per
+    evaluation, sample age at each frame, and distance to the true gaze at the flip
+    (one frame later) without and with prediction'''
+    import RecordingSession
+    print('gaze binding, %.0f s at %.0f frames/s, %.0f Hz samples'%(secs, frame_rate, sample_rate))
+    for predict in (False, True):
+        genv = _graphics(sample_rate=sample_rate)
+        win, tracker = genv.win, genv.tracker
+        win.frame_rate = frame_rate
+        stim = win.Stimulus(size=[50, 50])
+        session = RecordingSession.RecordingSession(tracker, poll_interval=0.001).start()
+        binding = genv.bindToGaze(stim, session, predict=predict, render_latency=1000./frame_rate)
+        errors, costs = [], []
+        def measured(t): # the bound dynamic, timed and compared to the true gaze at the flip
+            t0 = time.perf_counter()
+            x, y = binding(t)
+            costs.append(time.perf_counter() - t0)
+            flip = session.tracker_time() + 1000./frame_rate
+            true = cgs._trackerToShady(win, *tracker.trueGaze(flip))
+            errors.append(np.hypot(x - true[0], y - true[1]))
+            return [x, y]
+        stim.position = measured
+        win.Start()
+        time.sleep(secs)
+        win.Close()
+        session.stop()
+        report = binding.report()
+        errors = np.array(errors[5:]) # after the first samples
+        print('  %-10s %5.1f us/frame  sample age mean %4.1f ms max %4.1f ms  error at flip median %5.1f px  p95 %6.1f px'%(
+            'predict' if predict else 'no predict', np.mean(costs)*1e6, np.nanmean(report['age']), np.nanmax(report['age']),
+            np.median(errors), np.percentile(errors, 95)))
+
+
+def benchmarkTracing(size=(384, 320), frames=60):
+    ''' setup session at max line rate with tracing off and on, and the traced percentiles'''
+    print('callback tracing, %dx%d, %d camera frames'%(size + (frames,)))
+    rates = []
+    for tracing in (False, True):
+        genv = _graphics(camera_size=size, camera_frames=frames)
+        if tracing:
+            genv.enableTracing()
+        genv.tracker.doTrackerSetup()
+        rates.append(genv.tracker.stats['line_rate'])
+    print('  lines/s off %.0f  on %.0f  (x%.2f)'%(rates[0], rates[1], rates[1]/rates[0]))
+    for name, stats in genv.getTracingSummary().items():
+        print('  %-22s %6d calls  p50 %8.1f us  p95 %8.1f us  p99 %8.1f us  max %8.1f us'%(
+            name, stats['count'], stats['p50']*1e6, stats['p95']*1e6, stats['p99']*1e6, stats['max']*1e6))
+
+
+def benchmarkTargetOnsets(frame_rate=60., target_duration=0.1):
+    ''' 9 point calibration with a World rendering at frame_rate: delay from draw_cal_target /
+    erase_cal_target to the flip showing it, and the tracker messages sent'''
+    print('target onsets at %.0f Hz (ms)'%frame_rate)
+    genv = _graphics(camera_frames=0, line_rate=1e9, target_duration=target_duration)
+    genv.enableOnsetTiming()
+    genv.win.frame_rate = frame_rate
+    genv.win.Start()
+    genv.tracker.doTrackerSetup()
+    time.sleep(3./frame_rate) # last erase flipped
+    genv.win.Close()
+    genv._sendOnsetMessages()
+    onsets = genv.getTargetOnsets()
+    for kind in ('target', 'erase'):
+        delays = np.array([onset['delay'] for onset in onsets if onset['kind'] == kind])*1e3
+        print('  %-6s %3d  delay mean %5.1f  min %5.1f  max %5.1f'%(kind, delays.size, delays.mean(), delays.min(), delays.max()))
+    messages = [m for m in genv.tracker.messages if 'TARGET_' in m[2]]
+    print('  %d messages, e.g. %r offset %d ms'%(len(messages), messages[0][2], messages[0][1]))
+
+
+def benchmarkFrameCommit(secs=1., target='full'):
+    ''' draw_cal_target / erase_cal_target in a loop on this thread while a threaded World renders
+    as fast as it can: frames showing a half applied target (elements not all visible or not all
+    at the same place), with the changes written directly vs staged in the FrameCommit'''
+    print('frame commits, %s target drawn and erased for %.0f s'%(target, secs))
+    for enabled in (False, True):
+        genv = _graphics(target=target)
+        win = genv.win
+        commit = cgs._getFrameCommit(win)
+        commit.enabled = enabled
+        elements = [value for value in vars(genv.target).values() if isinstance(value, HeadlessShady.Stimulus)]
+        centers = [genv.target.surround, genv.target.center] if target == 'full' else [] # same position
+        frames = dict(count=0, torn=0)
+        def check(t):
+            visible = set(bool(stim.visible) for stim in elements)
+            places = set(tuple(stim.position) for stim in centers)
+            frames['count'] += 1
+            frames['torn'] += len(visible) > 1 or len(places) > 1
+        win.SetAnimationCallback(check)
+        win.frame_rate = None
+        win.Start()
+        t0, calls, k = time.perf_counter(), 0, 0
+        while time.perf_counter() - t0 < secs:
+            k += 1
+            genv.draw_cal_target(100 + k % 1700, 100 + k % 900)
+            genv.erase_cal_target()
+            calls += 2
+        win.Close()
+        print('  %-7s %6d callbacks  %6d frames  %5d torn  (%d transactions in %d batches, at most %d ops)'%(
+            'staged' if enabled else 'direct', calls, frames['count'], frames['torn'],
+            commit.stats['transactions'], commit.stats['batches'], commit.stats['max_batch']))
+
+
+def benchmarkStimulusLifecycle(instances=10, drift_corrections=50, target='full'):
+    ''' instances CalibrationGraphics used one after the other in one World, each for a setup
+    and drift_corrections drift corrections, then left open or closed: stimuli created, walked
+    by the render loop at each frame of the experiment (in the World, visible or not) and the
+    StimulusPool report'''
+    print('stimulus lifecycle, %d instances x (setup + %d drift corrections)'%(instances, drift_corrections))
+    for close in (False, True):
+        win = HeadlessShady.World(size=(1920, 1080))
+        t0 = time.perf_counter()
+        for k in range(instances):
+            tracker = PylinkSimulator.EyeLink(camera_frames=2, line_rate=None)
+            genv = cgs.CalibrationGraphics(tracker, win, target=target, audio_backend='null')
+            PylinkSimulator.openGraphicsEx(genv)
+            tracker.doTrackerSetup()
+            for i in range(drift_corrections):
+                tracker.doDriftCorrect(960, 540)
+            if close:
+                genv.close()
+        elapsed = time.perf_counter() - t0
+        walked = win.RenderFrame().walked
+        report = genv.getStimulusReport()
+        print('  %-6s %3d created  %3d reused  %3d walked per frame (%d without the pool)  live %d  parked %d  free %d  textures %.0f kB  (%.1f s)'%(
+            'closed' if close else 'open', report['created'], report['reused'], walked, report['created'] + report['reused'],
+            report['live']['count'], report['parked']['count'], report['free']['count'],
+            sum(report[state]['texture_bytes'] for state in ('live', 'parked', 'free'))/1e3, elapsed))
+
+
+_importSnippet = '''
+import sys
+try:
+    import pylink, Shady
+except ImportError: # stand-ins
+    import PylinkSimulator, HeadlessShady
+    PylinkSimulator.install()
+    HeadlessShady.install()
+before = set(sys.modules)
+%s
+print(' '.join(m for m in %r if m in sys.modules and m not in before))
+'''
+
+
+def benchmarkEdfTransfer(size_mb=256, rates=(None, 50.), frame_rate=60.):
+    ''' receiveDataFile() of a synthetic data file, served as fast as possible or at rate MB/s:
+    time the main thread is blocked when called directly, vs EdfTransfer with the main thread
+    rendering an end screen (longest gap between two frames) and the progress reports'''
+    import EdfTransfer
+    print('data file transfer, %d MB'%size_mb)
+    directory = tempfile.mkdtemp()
+    try:
+        for rate in rates:
+            tracker = PylinkSimulator.EyeLink(data_file_size=size_mb<<20, transfer_rate=None if rate is None else rate*1e6)
+            tracker.openDataFile('test.edf')
+            tracker.closeDataFile()
+            dest = os.path.join(directory, 'test.edf')
+            t0 = time.perf_counter()
+            tracker.receiveDataFile('test.edf', dest)
+            blocked = time.perf_counter() - t0
+            os.remove(dest)
+
+            win = HeadlessShady.World(size=(1920, 1080))
+            reports = []
+            transfer = EdfTransfer.EdfTransfer(tracker, 'test.edf', dest, progress=reports.append).start()
+            frames, gap, last = 0, 0., time.perf_counter()
+            while not transfer.done:
+                win.RenderFrame()
+                time.sleep(1./frame_rate)
+                now = time.perf_counter()
+                frames, gap, last = frames + 1, max(gap, now - last), now
+            size = transfer.wait()
+            assert size == os.path.getsize(dest) == size_mb<<20 and os.listdir(directory) == ['test.edf']
+            p = transfer.progress()
+            print('  %-9s blocking %5.2f s  background %5.2f s (%6.1f MB/s), %4d frames meanwhile, longest frame gap %4.1f ms, %3d progress reports'%(
+                'max speed' if rate is None else '%.0f MB/s'%rate, blocked, p.secs, p.rate/1e6, frames, gap*1e3, len(reports)))
+            os.remove(dest)
+    finally:
+        shutil.rmtree(directory)
+
+
+# Callback regression suite: one timing per pylink display callback, compared to the
+# baseline stored next to this file. Times are divided by a fixed reference workload
+# measured in the same run, so the baseline holds on a faster or slower machine.
+# check:  python BenchmarkCalibrationGraphicsShady.py --check
+# update: python BenchmarkCalibrationGraphicsShady.py --update-baseline
+
+baseline_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+suite_keys = ['c', 'v', 'a', 'return', 'up', 'down', 'left', 'right'] # no 'q'/'escape', they close the World
+
+
+def _bestTime(func, n, repeat=5, after=None):
+    ''' seconds per func() call, best of repeat batches of n calls,
+    after() (untimed) runs after each batch, e.g. to render the staged changes'''
+    func() # first call creates the stimuli, caches, ...
+    best = None
+    for k in range(repeat):
+        t0 = time.perf_counter()
+        for i in range(n):
+            func()
+        elapsed = (time.perf_counter() - t0) / n
+        best = elapsed if best is None else min(best, elapsed)
+        if after is not None:
+            after()
+    return best
+
+
+def _reference():
+    ''' seconds for a fixed mix of interpreter and numpy work, the unit of the suite timings'''
+    a = np.arange(640*480, dtype=np.uint8).reshape(480, 640)
+    lut = np.random.RandomState(0).randint(0, 256, (256, 4)).astype(np.uint8)
+
+    def work():
+        lut[a]
+        d = {}
+        for i in range(200):
+            d[i] = (i*0.5, str(i))
+    return _bestTime(work, 10, repeat=20)
+
+
+def callbackSuite(sizes=camera_sizes, frames=5):
+    ''' {name: seconds per call} of the display callbacks pylink calls during a setup,
+    on PylinkSimulator frames and cross hairs, headless World, null audio'''
+    results = {}
+    for width, totlines in sizes:
+        genv = _graphics(camera_size=(width, totlines), camera_frames=frames, head_view=True)
+        genv.setup_image_display(width, totlines)
+        genv.set_image_palette(*PylinkSimulator.grayPalette())
+        lines, cross_hairs = genv.tracker._getFrames()
+        state = {'k': 0}
+
+        def frame():
+            k = state['k'] = (state['k'] + 1) % len(lines)
+            genv._simulatedCrossHair = tuple(cross_hairs[k]) + (True,)
+            for i, buff in enumerate(lines[k]):
+                genv.draw_image_line(width, i+1, totlines, buff)
+        results['draw_image_line.%dx%d'%(width, totlines)] = _bestTime(frame, frames, after=genv.win.RenderFrame)
+
+    genv = _graphics(head_view=True)
+    palette = PylinkSimulator.grayPalette()
+    results['set_image_palette'] = _bestTime(lambda: genv.set_image_palette(*palette), 100)
+
+    genv.setup_image_display(*genv.tracker.camera_size)
+    genv.win.HandleEvent('mouse_motion', x=-900., y=500.) # mouse cursor inside the eye image
+    lines, cross_hairs = genv.tracker._getFrames()
+    state = {'k': 0}
+
+    def crossHair():
+        k = state['k'] = (state['k'] + 1) % len(cross_hairs)
+        genv._simulatedCrossHair = tuple(cross_hairs[k]) + (True,) # moves every frame, head view lozenge
+        genv._meta_draw_cross_hair()
+    results['_meta_draw_cross_hair'] = _bestTime(crossHair, 200, after=genv.win.RenderFrame)
+    results['get_mouse_state'] = _bestTime(genv.get_mouse_state, 1000)
+
+    def keyBurst():
+        for key in suite_keys*4:
+            genv.win.HandleEvent('key_press', key=key)
+        genv.get_input_key()
+    results['get_input_key.burst%d'%(len(suite_keys)*4)] = _bestTime(keyBurst, 100)
+
+    pool = cgs._getStimulusPool(genv.win)
+    for name in ('full', 'disk', 'circle', 'cross'):
+        cls = getattr(cgs, target_types[name])
+
+        def create(): # pool released stimuli are reused, as from one setup to the next
+            pool.release(cls(genv.win, owner=genv))
+        results['target.%s._create'%name] = _bestTime(create, 20, after=genv.win.RenderFrame)
+        target, target_sizes = cls(genv.win, owner=genv), (16, 24, 32, 48, 64, 96, 128)
+        state = {'k': 0}
+
+        def resize():
+            state['k'] += 1
+            target.set_target_size(target_sizes[state['k'] % len(target_sizes)])
+        results['target.%s.set_target_size'%name] = _bestTime(resize, 7*5, after=genv.win.RenderFrame)
+        pool.release(target)
+
+    genv._beeps = cgs.BeepBank('null')
+    results['setCalibrationSounds'] = _bestTime(lambda: genv.setCalibrationSounds('', '', ''), 20)
+    return results
+
+
+def _suiteRun():
+    reference = _reference()
+    return reference, dict((name, secs/reference) for name, secs in callbackSuite().items())
+
+
+def benchmarkCallbacks(check=False, update=False, threshold=None, runs=3, filename=baseline_file):
+    ''' callbackSuite() in reference units against the stored baseline: returns the callbacks
+    slower than threshold x their baseline (check), or writes the baseline (update).
+    A callback over the threshold is measured again, up to runs times, and only counts as a
+    regression if it stays over; the baseline is the median of runs suite runs.'''
+    baseline = {}
+    if os.path.exists(filename):
+        with open(filename) as f:
+            baseline = json.load(f)
+    if threshold is None:
+        threshold = baseline.get('threshold', 1.5)
+    limits = dict((name, base*baseline.get('thresholds', {}).get(name, threshold)) for name, base in baseline.get('results', {}).items())
+    reference, results = _suiteRun()
+    if update:
+        more = [_suiteRun()[1] for k in range(runs - 1)]
+        results = dict((name, float(np.median([value] + [run[name] for run in more]))) for name, value in results.items())
+    else:
+        for k in range(runs - 1):
+            if not any(results[name] > limits.get(name, np.inf) for name in results):
+                break
+            for name, value in _suiteRun()[1].items():
+                results[name] = min(results[name], value)
+    print('display callbacks (us per call, x reference work, vs baseline; reference %.1f us)'%(reference*1e6))
+    regressions = []
+    for name in sorted(results):
+        base = baseline.get('results', {}).get(name)
+        ratio = None if base is None else results[name]/base
+        if results[name] > limits.get(name, np.inf):
+            regressions.append(name)
+        print('  %-34s %9.1f us  %8.4f  %s%s'%(name, results[name]*reference*1e6, results[name],
+              'no baseline' if ratio is None else 'x%.2f'%ratio, '  REGRESSION' if name in regressions else ''))
+    if update:
+        baseline.update(threshold=threshold, results=results, python=sys.version.split()[0], numpy=np.__version__)
+        with open(filename, 'w') as f:
+            json.dump(baseline, f, indent=1, sort_keys=True)
+            f.write('\n')
+        print('  baseline written to %s'%filename)
+    elif check and regressions:
+        print('  %d callback(s) over x%.2f of the baseline: %s'%(len(regressions), threshold, ', '.join(regressions)))
+    return regressions
+
+
+def _importTimes(statement, watched=()):
+    ''' runs statement in a fresh interpreter with -X importtime, returns
+    {module: cumulative import time (s)} and the watched modules that got imported'''
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([here] + [p for p in [os.environ.get('PYTHONPATH')] if p]))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', _importSnippet%(statement, tuple(watched))],
+                            capture_output=True, text=True, env=env, cwd=here)
+    times = {}
+    for line in result.stderr.splitlines(): # import time: self [us] | cumulative | imported package
+        if line.startswith('import time:') and '|' in line:
+            fields = line[len('import time:'):].split('|')
+            try:
+                times[fields[2].strip()] = int(fields[1]) * 1e-6
+            except ValueError: # header
+                pass
+    return times, result.stdout.split()
+
+
+def benchmarkImportTime(repeat=5):
+    ''' import time of CalibrationGraphicsShady (best of repeat fresh interpreters), the lazily
+    imported modules it did not load, and what each of them costs on first use'''
+    print('import time (ms, best of %d)'%repeat)
+    lazy = ['PIL.Image', 'PIL.ImageOps', 'audiomath', 'Shady.Text']
+    best, loaded = None, []
+    for k in range(repeat):
+        times, loaded = _importTimes('import CalibrationGraphicsShady', lazy)
+        t = times.get('CalibrationGraphicsShady')
+        best = t if best is None or (t is not None and t < best) else best
+    print('  CalibrationGraphicsShady %.1f  (lazy modules loaded: %s)'%(best*1e3, ', '.join(loaded) or 'none'))
+    for module in lazy:
+        times, loaded = _importTimes('try:\n    import %s\nexcept ImportError:\n    pass'%module, [module])
+        if module in loaded:
+            print('  %-24s %.1f on first use'%(module, times.get(module, 0)*1e3))
+        else:
+            print('  %-24s not installed'%module)
+
+
+if __name__ == '__main__':
+    if '--check' in sys.argv or '--update-baseline' in sys.argv:
+        regressions = benchmarkCallbacks(check='--check' in sys.argv, update='--update-baseline' in sys.argv)
+        sys.exit(1 if regressions and '--check' in sys.argv else 0)
+    benchmarkImportTime()
+    benchmarkLineIngest()
+    benchmarkEyeImageConversion()
+    benchmarkResampling()
+    benchmarkTargets()
+    benchmarkBeeps()
+    benchmarkSetupSession()
+    benchmarkEyeImageUpload()
+    benchmarkEyeImageRate()
+    benchmarkFrameRecording()
+    benchmarkRecording()
+    benchmarkGazeClassifier()
+    benchmarkAscParser()
+    benchmarkGazeBinding()
+    benchmarkTracing()
+    benchmarkTargetOnsets()
+    benchmarkFrameCommit()
+    benchmarkStimulusLifecycle()
+    benchmarkEdfTransfer()
+    benchmarkCallbacks()
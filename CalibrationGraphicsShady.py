@@ -3,12 +3,38 @@
 # Last updated on Dec 2021
 
 import Shady
-import Shady.Text
-from PIL import Image, ImageOps
-import audiomath as am
+import numpy as np
 import pylink
+import collections
+import functools
+import itertools
+import threading
+import time
+import traceback
 import sys
 import os
+import wave
+
+# optional or slow to import, loaded on first use: Shady.Text (text stimuli), audiomath
+# (calibration sounds) and PIL (eye_image_backend 'pil')
+Image = ImageOps = None
+am = None
+
+def _importText():
+    import Shady.Text # registers text rendering with Shady
+
+def _importAudiomath():
+    global am
+    if am is None:
+        import audiomath as am
+    return am
+
+def _importPIL():
+    global Image, ImageOps
+    if Image is None:
+        from PIL import Image, ImageOps
+    return Image, ImageOps
+
 
 default_tar_beep = 'type.wav'
 default_done_beep = 'qbeep.wav'
@@ -28,79 +54,397 @@ def _getTextLayer(world):
     return 0.7
 
 
+def _trackerToShady(world, x, y):
+    ''' EyeLink screen coordinates (pixels from the top left corner, y down) -> Shady
+    default coordinates (pixels from the center, y up), scalars or arrays'''
+    return x - world.size[0]/2, - (y - world.size[1]/2)
+
+def _shadyToTracker(world, x, y):
+    return x + world.size[0]/2, - y + world.size[1]/2
+
+
 def _defaultHandler(world, event):
     if event.type == 'key_press' and event.key in ['q', 'escape']:
         world.Close()
 
 
+# Shady key names -> pylink key codes, other single characters are sent as ord(key)
+_keyCodes = {
+    'f1': pylink.F1_KEY, 'f2': pylink.F2_KEY, 'f3': pylink.F3_KEY, 'f4': pylink.F4_KEY, 'f5': pylink.F5_KEY,
+    'f6': pylink.F6_KEY, 'f7': pylink.F7_KEY, 'f8': pylink.F8_KEY, 'f9': pylink.F9_KEY, 'f10': pylink.F10_KEY,
+    'pageup': pylink.PAGE_UP, 'pagedown': pylink.PAGE_DOWN,
+    'up': pylink.CURS_UP, 'down': pylink.CURS_DOWN, 'left': pylink.CURS_LEFT, 'right': pylink.CURS_RIGHT,
+    'backspace': ord('\b'), 'return': pylink.ENTER_KEY, 'enter': pylink.ENTER_KEY, 'space': ord(' '),
+    'escape': pylink.ESC_KEY, 'tab': ord('\t'), 'plus': ord('+'), 'minus': ord('-'),
+}
+# modifier names found in Shady's event.modifiers -> EyeLink modifier bits (ELKMOD_LSHIFT, LCTRL, LALT)
+_keyModifiers = (('shift', 0x0001), ('ctrl', 0x0040), ('alt', 0x0100))
+_modifierBits = {} # cache, event.modifiers string -> bits
+
+
+def _translateKey(event):
+    ''' pylink.KeyInput for a Shady key_press event, pylink.JUNK_KEY for keys the tracker
+    has no use for (e.g. lone modifiers)'''
+    keycode = _keyCodes.get(event.key)
+    if keycode is None:
+        keycode = ord(event.key) if event.key and len(event.key) == 1 else pylink.JUNK_KEY
+    modifiers = getattr(event, 'modifiers', None) or ''
+    mod = _modifierBits.get(modifiers)
+    if mod is None:
+        mod = _modifierBits[modifiers] = sum(bit for name, bit in _keyModifiers if name in str(modifiers).lower())
+    return pylink.KeyInput(keycode, mod)
+
+
+class InputQueue(object):
+    '''
+    Keys and mouse shared by Shady's event handler and pylink's polling (thread-safe).
+    Keys are queued with their capture time, the oldest dropped when full (counted in dropped),
+    only the latest mouse position is kept. keys mirrors the queue as world.keys.
+    '''
+    def __init__(self, mouse=(0., 0.), maxlen=64, latency_history=1000):
+        self._keys = collections.deque(maxlen=maxlen)
+        self.keys = _KeyList(self)
+        self.mouse = (mouse[0], mouse[1], time.perf_counter()) # x, y (shady coords), capture time
+        self.mouse_pressed = 0
+        self.latencies = collections.deque(maxlen=latency_history) # seconds from capture to get_input_key
+        self.dropped = 0
+
+    def push_key(self, key, t=None):
+        if len(self._keys) == self._keys.maxlen:
+            self.dropped += 1
+            if len(self.keys):
+                list.__delitem__(self.keys, 0)
+        self._keys.append((key, time.perf_counter() if t is None else t))
+        list.append(self.keys, key)
+
+    def move_mouse(self, x, y, t=None):
+        self.mouse = (x, y, time.perf_counter() if t is None else t)
+
+    def pop_keys(self):
+        ''' all queued keys, oldest first'''
+        keys, now = [], time.perf_counter()
+        while True:
+            try:
+                key, t = self._keys.popleft()
+            except IndexError:
+                list.__delitem__(self.keys, slice(0, len(keys)))
+                return keys
+            keys.append(key)
+            self.latencies.append(now - t)
+
+
+class _KeyList(list):
+    ''' world.keys: the keys waiting for get_input_key, kept by the InputQueue, append() queues a key'''
+    def __init__(self, queue):
+        list.__init__(self)
+        self._queue = queue
+
+    def append(self, key):
+        self._queue.push_key(key)
+
+
+def _setInputQueue(world, queue):
+    world.input_queue = queue
+    world.keys = queue.keys
+    world.mouse_x, world.mouse_y = queue.mouse[:2]
+    world.mouse_anypress = queue.mouse_pressed
+
+
 def _handleEvents(world, event):
+    queue = world.input_queue
     if event.type == 'key_press':
-        mod = 0 # modifier value
-        try:
-            keycode = ord(event.key)
-        except: pass
-        if event.key == 'f1':
-            keycode = pylink.F1_KEY
-        elif event.key == 'f2':
-            keycode = pylink.F2_KEY
-        elif event.key == 'f3':
-            keycode = pylink.F3_KEY
-        elif event.key == 'f4':
-            keycode = pylink.F4_KEY
-        elif event.key == 'f5':
-            keycode = pylink.F5_KEY
-        elif event.key == 'f6':
-            keycode = pylink.F6_KEY
-        elif event.key == 'f7':
-            keycode = pylink.F7_KEY
-        elif event.key == 'f8':
-            keycode = pylink.F8_KEY
-        elif event.key == 'f9':
-            keycode = pylink.F9_KEY
-        elif event.key == 'f10':
-            keycode = pylink.F10_KEY
-        elif event.key == 'pageup':
-            keycode = pylink.PAGE_UP
-        elif event.key == 'pagedown':
-            keycode = pylink.PAGE_DOWN
-        elif event.key == 'up':
-            keycode = pylink.CURS_UP
-        elif event.key == 'down':
-            keycode = pylink.CURS_DOWN
-        elif event.key == 'left':
-            keycode = pylink.CURS_LEFT
-        elif event.key == 'right':
-            keycode = pylink.CURS_RIGHT
-        elif event.key == 'backspace':
-            keycode = ord('\b')
-        elif event.key == 'return':
-            keycode = pylink.ENTER_KEY
-        elif event.key == 'space':
-            keycode = ord(' ')
-        elif event.key == 'escape':
-            keycode = pylink.ESC_KEY
-        elif event.key == 'tab':
-            keycode = ord('\t')
-        elif event.key == pylink.JUNK_KEY:
-            keycode = 0
-        world.keys.append(pylink.KeyInput(keycode, mod))
+        queue.push_key(_translateKey(event))
 
     if event.type == 'mouse_motion':
-        world.mouse_x = event.x # shady coords
-        world.mouse_y = event.y
+        queue.move_mouse(event.x, event.y) # shady coords
+        world.mouse_x, world.mouse_y = event.x, event.y
     if event.type == 'mouse_press':
-        world.mouse_anypress = 1 #trackpad returns event.key as None?
-    else: world.mouse_anypress = 0
+        queue.mouse_pressed = 1 #trackpad returns event.key as None?
+    else: queue.mouse_pressed = 0
+    world.mouse_anypress = queue.mouse_pressed
+
+
+
+class _PooledStimulus(object):
+    __slots__ = ('stim', 'role', 'owner', 'parkable', 'entered', 'textures')
 
+    def __init__(self, stim, role):
+        self.stim, self.role = stim, role
+        self.owner, self.parkable, self.entered = None, True, True
+        self.textures = {} # 'texture' / 'lut' -> bytes uploaded
+
+
+class StimulusPool(object):
+    '''
+    Stimuli of the calibration display of one World, acquired per role ('eye_image', ...)
+    and reused across CalibrationGraphics instances. park(owner) takes the hidden ones out of
+    the World between setups, unpark(owner) brings them back, release(owner) frees them.
+    Texture bytes uploaded through load_texture() and set_lut() are counted.
+    '''
+    def __init__(self, world):
+        self.world = world
+        self._lock = threading.Lock()
+        self._entries = {} # id(stim) -> _PooledStimulus, owned or free
+        self._free = collections.defaultdict(list) # role -> released entries, out of the World
+        self._parked = collections.defaultdict(list) # owner -> entries out of the World until unpark()
+        self.stats = dict(created=0, reused=0, parked=0)
+
+    def acquire(self, owner, role, parkable=True, **properties):
+        ''' stimulus with properties for owner, parkable=False for stimuli that must stay in
+        the World while hidden (e.g. for their animation callback)'''
+        with self._lock:
+            free = self._free.get(role)
+            entry = free.pop() if free else None
+        reused = entry is not None
+        if not reused:
+            entry = _PooledStimulus(self.world.Stimulus(**properties), role)
+        else:
+            entry.stim.Enter()
+            entry.entered = True
+            for key, value in properties.items():
+                setattr(entry.stim, key, value)
+        with self._lock:
+            self.stats['reused' if reused else 'created'] += 1
+            entry.owner, entry.parkable = owner, parkable
+            self._entries[id(entry.stim)] = entry
+        return entry.stim
+
+    def _entry(self, stim):
+        with self._lock:
+            return self._entries.get(id(stim))
+
+    def load_texture(self, stim, source):
+        ''' skipped when stim was dropped from the pool meanwhile (e.g. from the image worker)'''
+        entry = self._entry(stim)
+        if entry is None:
+            return
+        stim.LoadTexture(source)
+        entry.textures['texture'] = np.asarray(source).nbytes
+
+    def set_lut(self, stim, lut):
+        entry = self._entry(stim)
+        if entry is None:
+            return
+        stim.SetLUT(lut)
+        entry.textures['lut'] = 0 if lut is None else np.asarray(lut, dtype=np.float32).nbytes
+
+    def _owned(self, owner):
+        with self._lock:
+            return [entry for entry in self._entries.values() if entry.owner is owner]
+
+    def park(self, owner):
+        for entry in self._owned(owner):
+            if entry.parkable and entry.entered and not entry.stim.visible:
+                entry.stim.Leave()
+                entry.entered = False
+                with self._lock:
+                    self._parked[owner].append(entry)
+                    self.stats['parked'] += 1
+
+    def unpark(self, owner):
+        ''' cheap when nothing is parked, can be called before each display change'''
+        parked = self._parked.pop(owner, None)
+        for entry in parked or ():
+            entry.stim.Enter()
+            entry.entered = True
+
+    def release(self, owner):
+        self._parked.pop(owner, None)
+        for entry in self._owned(owner):
+            entry.stim.visible = False
+            if not entry.parkable: # kept in the World for its animation callback
+                entry.stim.SetAnimationCallback(None)
+            if entry.textures.get('lut'):
+                self.set_lut(entry.stim, None)
+            if entry.entered:
+                entry.stim.Leave()
+                entry.entered = False
+            with self._lock:
+                entry.owner = None
+                self._free[entry.role].append(entry)
+
+    def discard_free(self):
+        ''' forgets the released stimuli (already out of the World) so they can be garbage collected'''
+        with self._lock:
+            for entries in self._free.values():
+                for entry in entries:
+                    del self._entries[id(entry.stim)]
+            self._free.clear()
+
+    def close(self):
+        with self._lock:
+            entries, self._entries = list(self._entries.values()), {}
+            self._free.clear()
+            self._parked.clear()
+        for entry in entries:
+            if entry.entered:
+                entry.stim.Leave()
+
+    def report(self, owner=None):
+        ''' live (in the World), parked (left between setups) and free (released, kept for reuse)
+        stimuli: count, texture bytes and count per role; with owner, owned: its stimuli'''
+        with self._lock:
+            entries = list(self._entries.values())
+        report = dict(self.stats)
+        for state in ('live', 'parked', 'free'):
+            group = [entry for entry in entries if (entry.entered if state == 'live' else
+                                                    not entry.entered and (entry.owner is None) == (state == 'free'))]
+            roles = collections.Counter(entry.role for entry in group)
+            report[state] = dict(count=len(group), texture_bytes=sum(sum(e.textures.values()) for e in group), roles=dict(roles))
+        if owner is not None:
+            report['owned'] = sum(1 for entry in entries if entry.owner is owner)
+        return report
+
+
+def _getStimulusPool(world):
+    ''' the StimulusPool of world, created on first use'''
+    pool = getattr(world, 'stimulus_pool', None)
+    if pool is None:
+        pool = world.stimulus_pool = StimulusPool(world)
+    return pool
+
+
+class FrameCommit(object):
+    '''
+    Frame-atomic display changes: inside "with commit:", set() and call() are staged per
+    thread and applied together at the start of the next frame (World.Defer). Outside a block,
+    or when not enabled, they act immediately; an exception drops the block's changes (aborted).
+    '''
+    def __init__(self, world):
+        self.world = world
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._pending = [] # ops handed over, applied by the next _apply()
+        self._scheduled = False
+        self._local = threading.local() # depth and ops of the thread's open block
+        self.applied = 0 # batches applied so far, i.e. frames that showed staged changes
+        self.stats = dict(transactions=0, ops=0, batches=0, max_batch=0, aborted=0)
+
+    def __enter__(self):
+        local = self._local
+        depth = getattr(local, 'depth', 0)
+        if not depth:
+            local.ops, local.failed = [], False
+        local.depth = depth + 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        local = self._local
+        local.depth -= 1
+        local.failed = local.failed or exc_type is not None
+        if not local.depth:
+            ops, local.ops = local.ops, None
+            if local.failed: # half of the changes of a callback, never shown
+                with self._lock:
+                    self.stats['aborted'] += 1
+            else:
+                self._commit(ops)
+
+    def _staging(self):
+        ''' op list of the thread's open block, None when changes apply immediately'''
+        if self.enabled and getattr(self._local, 'depth', 0):
+            return self._local.ops
+        return None
+
+    def set(self, stim, **properties):
+        ops = self._staging()
+        if ops is None:
+            for key, value in properties.items():
+                setattr(stim, key, value)
+        else:
+            ops.append((stim, properties, None))
+
+    def call(self, func, *args):
+        ops = self._staging()
+        if ops is None:
+            func(*args)
+        else:
+            ops.append((None, func, args))
+
+    def _commit(self, ops):
+        if not ops:
+            return
+        with self._lock:
+            self._pending.extend(ops)
+            self.stats['transactions'] += 1
+            self.stats['ops'] += len(ops)
+            schedule, self._scheduled = not self._scheduled, True
+        if schedule:
+            self.world.Defer(self._apply)
+
+    def _apply(self):
+        with self._lock:
+            ops, self._pending, self._scheduled = self._pending, [], False
+            self.applied += bool(ops)
+            self.stats['batches'] += bool(ops)
+            self.stats['max_batch'] = max(self.stats['max_batch'], len(ops))
+        for stim, values, args in ops:
+            if stim is None:
+                values(*args)
+            else:
+                for key, value in values.items():
+                    setattr(stim, key, value)
+
+    def flush(self):
+        ''' applies the changes handed over so far now, e.g. when no frame is being rendered'''
+        self._apply()
+
+
+def _getFrameCommit(world):
+    ''' the FrameCommit of world, created on first use'''
+    commit = getattr(world, 'frame_commit', None)
+    if commit is None:
+        commit = world.frame_commit = FrameCommit(world)
+    return commit
+
+
+_targetCacheSize = 32 # geometries / textures kept, an animated size or color only keeps the latest ones
+
+
+def _getTargetGeometry(kind, size, lw):
+    '''
+    cached (read-only) vertices of the line based targets, shared by all targets
+    kind 'cross': 4*lw points, lw parallel 1-px lines per arm of total length size (DRAWMODE.LINES)
+    kind 'ring': complex points of lw concentric 30-sided polygons from radius size/2
+                 inwards, NaN separated (DRAWMODE.LINE_STRIP)
+    '''
+    return _targetGeometry(kind, float(size), int(lw))
+
+
+@functools.lru_cache(maxsize=_targetCacheSize)
+def _targetGeometry(kind, size, lw):
+    arm, lw = size/2, max(lw, 0)
+    if kind == 'cross':
+        loffs = np.arange(lw) - lw/2
+        points = np.empty((lw, 4, 2))
+        points[:, 0, 0], points[:, 1, 0], points[:, :2, 1] = -arm, arm, loffs[:, None]
+        points[:, 2, 1], points[:, 3, 1], points[:, 2:, 0] = -arm, arm, loffs[:, None]
+        points = points.reshape(-1, 2)
+    elif kind == 'ring':
+        poffs = arm - np.arange(lw)
+        points = (poffs[:, None]*Shady.ComplexPolygonBase(30, joined=True)[None, :]).reshape(1, -1)
+    else:
+        raise ValueError('unknown target geometry %r'%kind)
+    points.setflags(write=False)
+    return points
 
 
 class FixationTarget(object):
-    def __init__(self, shady_window):
+    def __init__(self, shady_window, owner=None):
         self.wind = shady_window
+        self.owner = self if owner is None else owner # of the stimuli in the pool
         self.target_size = 32 #pix
         self.target_color = [0]*3
         self.on = None # tracks on screen presence
 
+    def _stimulus(self, name, **properties):
+        ''' stimulus from the StimulusPool of the window'''
+        return _getStimulusPool(self.wind).acquire(self.owner, type(self).__name__ + '.' + name, **properties)
+
+    def _set(self, stim, **properties):
+        ''' property writes staged in the FrameCommit of the window when a callback opened one'''
+        _getFrameCommit(self.wind).set(stim, **properties)
+
     def _create(self):
         raise NotImplementedError("_create() must be implemented in subclass")
 
@@ -118,61 +462,46 @@ class FixationTarget(object):
 
 
 class Full(FixationTarget):
-    def __init__(self, shady_window):
-        super(Full, self).__init__(shady_window)
+    def __init__(self, shady_window, owner=None):
+        super(Full, self).__init__(shady_window, owner)
         self._crossLw = int(round(0.2 * self.target_size)) # prop of size
         self._centerDiameter = self._crossLw # pix
         self._crossColor = [0.5]*3
         self._create()
 
     def _create(self):
-        center = [0, 0]
-        lines = np.zeros((4*self._crossLw, 2))
-        loffs = np.arange(self._crossLw) - self._crossLw/2
-        arm = self.target_size/2
-        k = 0
-        for lo in loffs:
-            lines[k, 0] = center[0] - arm 
-            lines[k, 1] = center[1] + lo
-            lines[k+1, 0] = center[0] + arm 
-            lines[k+1, 1] = center[1] + lo
-            lines[k+2, 0] = center[0] + lo
-            lines[k+2, 1] = center[1] - arm
-            lines[k+3, 0] = center[0] + lo
-            lines[k+3, 1] = center[1] + arm
-            k += 4
-        self.surround = self.wind.Stimulus(size=self.target_size, color=self.target_color, pp=1, anchor=Shady.LOCATION.CENTER, 
+        lines = _getTargetGeometry('cross', self.target_size, self._crossLw)
+        self.surround = self._stimulus('surround', size=self.target_size, color=self.target_color, pp=1, anchor=Shady.LOCATION.CENTER, 
                                            position=[0., 0.], backgroundAlpha=0, visible=False, z=_getTargetLayer(self.wind)+0.1)
-        self.cross = self.wind.Stimulus(size=self.wind.size, color=self._crossColor, drawMode=Shady.DRAWMODE.LINES, 
+        self.cross = self._stimulus('cross', size=self.wind.size, color=self._crossColor, drawMode=Shady.DRAWMODE.LINES, 
                                         penThickness=1, backgroundAlpha=0, points=lines, visible=False, z=_getTargetLayer(self.wind))
-        self.center = self.wind.Stimulus(size=self._centerDiameter, color=self.target_color, pp=1, anchor=Shady.LOCATION.CENTER, 
+        self.center = self._stimulus('center', size=self._centerDiameter, color=self.target_color, pp=1, anchor=Shady.LOCATION.CENTER, 
                                          position=[0., 0.],backgroundAlpha=0, visible=False, z=_getTargetLayer(self.wind)-0.1)
         self.on = False
 
     def set_target_size(self, size):
-        # because cross different, simpler to recreate (so removes previous stims)
-        for element in [self.surround, self.cross, self.center]:
-            element.Leave()
+        # updates the existing stims, so keeps position and visibility
         self.target_size = size
-        self._create()
+        self._set(self.surround, size=self.target_size)
+        self._set(self.cross, points=_getTargetGeometry('cross', self.target_size, self._crossLw))
 
     def set_target_color(self, color):
         self.target_color = color
         for element in [self.surround, self.center]:
-            element.color = self.target_color
+            self._set(element, color=self.target_color)
 
     def draw(self, pos=None):
         if pos:
             for element in [self.surround, self.cross, self.center]:
-                element.position = pos
-            self.cross.position = [pos[0]+self.wind.size[0]/2, pos[1]+self.wind.size[1]/2] #diff ref frame
+                self._set(element, position=pos)
+            self._set(self.cross, position=[pos[0]+self.wind.size[0]/2, pos[1]+self.wind.size[1]/2]) #diff ref frame
         for element in [self.surround, self.cross, self.center]:
-            element.visible = True
+            self._set(element, visible=True)
         self.on = True
 
     def clear(self):
         for element in [self.surround, self.cross, self.center]:
-            element.visible = False
+            self._set(element, visible=False)
         self.on = False
 
 
@@ -181,139 +510,241 @@ class Circle(FixationTarget):
     '''
     if outer circle artifacts, should consider implement a 2 overlapping disks version i.of proper circle
     '''
-    def __init__(self, shady_window):
-        super(Circle, self).__init__(shady_window)
+    def __init__(self, shady_window, owner=None):
+        super(Circle, self).__init__(shady_window, owner)
         self.target_inner = 0.25*self.target_size # in prop of outer radius
         self._create()
 
+    def _ringPoints(self):
+        return _getTargetGeometry('ring', self.target_size, round(self.target_size/2 - self.target_inner/2))
+
     def _create(self):
-        nSides, lw, radius = 30, int(round(self.target_size/2 - self.target_inner/2)), self.target_size/2
-        center = [0, 0]
-        poffs = radius-np.arange(lw)
-        dimPolygon = nSides+2
-        points = np.zeros((1, lw*dimPolygon), dtype=complex)
-        k=0
-        for p in poffs: 
-            points[0, k:k+nSides+2] = p*Shady.ComplexPolygonBase(nSides, joined=True) + [center[0]+1j*center[1]]
-            k += nSides+2
-        self.circle = self.wind.Stimulus(size=self.wind.size, anchor = Shady.LOCATION.CENTER, position = [0., 0.], drawMode=Shady.DRAWMODE.LINE_STRIP, 
+        points = self._ringPoints()
+        self.circle = self._stimulus('circle', size=self.wind.size, anchor = Shady.LOCATION.CENTER, position = [0., 0.], drawMode=Shady.DRAWMODE.LINE_STRIP, 
                                          penThickness=1, points=points, color=self.target_color, visible=False, z=_getTargetLayer(self.wind))
         self.on = False
 
     def set_target_size(self, size):
-        self.target_size = size # because cross different, simpler to recreate (so removes previous stim)
-        self.circle.Leave()
-        self._create()
+        self.target_size = size # updates the existing stim, so keeps position and visibility
+        self._set(self.circle, points=self._ringPoints())
 
     def set_target_color(self, color):
         self.target_color = color
-        self.circle.color = color
+        self._set(self.circle, color=color)
 
     def draw(self, pos=None):
         if pos:
-            self.circle.position = [pos[0]+self.wind.size[0]/2, pos[1]+self.wind.size[1]/2]
-        self.circle.visible = True
+            self._set(self.circle, position=[pos[0]+self.wind.size[0]/2, pos[1]+self.wind.size[1]/2])
+        self._set(self.circle, visible=True)
         self.on = True
 
     def clear(self):
-        self.circle.visible = False
+        self._set(self.circle, visible=False)
         self.on = False
 
 
 class Disk(FixationTarget):
-    def __init__(self, shady_window):
-        super(Disk, self).__init__(shady_window)
+    def __init__(self, shady_window, owner=None):
+        super(Disk, self).__init__(shady_window, owner)
         self._create()
 
     def _create(self):
-        self.disk = self.wind.Stimulus(size=self.target_size, color=self.target_color, pp=1, anchor=Shady.LOCATION.CENTER, 
+        self.disk = self._stimulus('disk', size=self.target_size, color=self.target_color, pp=1, anchor=Shady.LOCATION.CENTER, 
                                        position=[0., 0.], backgroundAlpha=0, visible=False, z=_getTargetLayer(self.wind))
         self.on = False
 
     def set_target_size(self, size):
         self.target_size = size
-        self.disk.size = self.target_size
+        self._set(self.disk, size=self.target_size)
 
     def set_target_color(self, color):
         self.target_color = color
-        self.disk.color = self.target_color
+        self._set(self.disk, color=self.target_color)
 
     def draw(self, pos=None):
         if pos:
-            self.disk.position = pos
-        self.disk.visible = True
+            self._set(self.disk, position=pos)
+        self._set(self.disk, visible=True)
         self.on = True
 
     def clear(self):
-        self.disk.visible = False
+        self._set(self.disk, visible=False)
         self.on = False
 
 
 class Cross(FixationTarget):
-    def __init__(self, shady_window):
-        super(Cross, self).__init__(shady_window)
+    def __init__(self, shady_window, owner=None):
+        super(Cross, self).__init__(shady_window, owner)
         self._crossLw = int(round(0.1*self.target_size)) # pix
         self._centerDiameter = self._crossLw*2
         self._centerColor = [np.abs(i-1) for i in self.target_color]
         self._create()
 
     def _create(self):
-        center = [0, 0]
-        lines = np.zeros((4*self._crossLw, 2))
-        loffs = np.arange(self._crossLw) - self._crossLw/2
-        arm = self.target_size/2
-        k = 0
-        for lo in loffs:
-            lines[k, 0] = center[0] - arm 
-            lines[k, 1] = center[1] + lo
-            lines[k+1, 0] = center[0] + arm 
-            lines[k+1, 1] = center[1] + lo
-            lines[k+2, 0] = center[0] + lo
-            lines[k+2, 1] = center[1] - arm
-            lines[k+3, 0] = center[0] + lo
-            lines[k+3, 1] = center[1] + arm
-            k += 4
-  
-        self.cross = self.wind.Stimulus(size=self.wind.size, color=self.target_color, drawMode=Shady.DRAWMODE.LINES, 
+        lines = _getTargetGeometry('cross', self.target_size, self._crossLw)
+        self.cross = self._stimulus('cross', size=self.wind.size, color=self.target_color, drawMode=Shady.DRAWMODE.LINES, 
                                         penThickness=1, points=lines, visible=False, z=_getTargetLayer(self.wind))
-        self.center = self.wind.Stimulus(size=self._centerDiameter, color=self._centerColor, pp=1, anchor=Shady.LOCATION.CENTER, 
+        self.center = self._stimulus('center', size=self._centerDiameter, color=self._centerColor, pp=1, anchor=Shady.LOCATION.CENTER, 
                                        position=[0., 0.], backgroundAlpha=0, visible=False, z=_getTargetLayer(self.wind)-0.1)
         self.on = False
 
     def set_target_size(self, size):
-        # recreates stim, so resets position
+        # updates the existing stims, so keeps position and visibility
         self.target_size = size
         self._crossLw = int(round(0.1*self.target_size)) # pix
         self._centerDiameter = self._crossLw*2
-        for element in [self.cross, self.center]:
-            element.Leave()
-        self._create()
+        self._set(self.cross, points=_getTargetGeometry('cross', self.target_size, self._crossLw))
+        self._set(self.center, size=self._centerDiameter)
 
     def set_target_color(self, color):
         self.target_color = color
         self._centerColor = [np.abs(i-1) for i in self.target_color]
-        self.cross.color = self.target_color
-        self.center.color = self._centerColor
+        self._set(self.cross, color=self.target_color)
+        self._set(self.center, color=self._centerColor)
 
     def draw(self, pos=None):
         if pos:
-            self.cross.position = [pos[0]+self.wind.size[0]/2, pos[1]+self.wind.size[1]/2]
-            self.center.position = pos
-        self.cross.visible = True
-        self.center.visible = True
+            self._set(self.cross, position=[pos[0]+self.wind.size[0]/2, pos[1]+self.wind.size[1]/2])
+            self._set(self.center, position=pos)
+        self._set(self.cross, visible=True)
+        self._set(self.center, visible=True)
         self.on = True
 
     def clear(self):
-        self.cross.visible = False
-        self.center.visible = False
+        self._set(self.cross, visible=False)
+        self._set(self.center, visible=False)
         self.on = False
 
 
+def _rgb(color):
+    return tuple(np.resize(np.asarray(color, dtype=float).ravel(), 3)) # scalar or RGB(A) -> RGB
+
+
+def _getTargetTexture(kind, size, lw, colors):
+    ''' cached (read-only) antialiased RGBA texture of a 'full', 'ring' or 'cross' target,
+    same shapes as Full, Circle and Cross, the last _targetCacheSize kept
+    '''
+    return _targetTexture(kind, float(size), float(lw), tuple(_rgb(c) for c in colors))
+
+
+@functools.lru_cache(maxsize=_targetCacheSize)
+def _targetTexture(kind, size, lw, colors):
+    n = int(np.ceil(size)) + 2
+    c = np.arange(n) - (n-1)/2. # pixel centers relative to the target center
+    x, y = np.abs(c)[None, :], np.abs(c)[:, None]
+    r = np.hypot(x, y)
+    def inside(d): # signed distance to the edge (> 0 inside) -> coverage
+        return np.clip(d + 0.5, 0, 1)
+    def cross():
+        return np.maximum(inside(lw/2. - y)*inside(size/2. - x), inside(lw/2. - x)*inside(size/2. - y))
+    if kind == 'full':
+        layers = [(inside(size/2. - r), colors[0]), (cross(), colors[1]), (inside(lw/2. - r), colors[0])]
+    elif kind == 'ring':
+        layers = [(inside(size/2. - r)*inside(r - (size/2. - lw)), colors[0])]
+    elif kind == 'cross':
+        layers = [(cross(), colors[0]), (inside(lw - r), colors[1])]
+    else:
+        raise ValueError('unknown target texture %r'%kind)
+    rgb, alpha = np.zeros((n, n, 3)), np.zeros((n, n, 1))
+    for coverage, color in layers: # "over" compositing, premultiplied
+        coverage = coverage[:, :, None]
+        rgb = rgb*(1 - coverage) + coverage*np.asarray(color)
+        alpha = alpha*(1 - coverage) + coverage
+    rgb = np.where(alpha > 0, rgb/np.maximum(alpha, 1e-9), 0)
+    texture = np.round(np.concatenate([rgb, alpha], axis=2)*255).astype(np.uint8)
+    texture.setflags(write=False)
+    return texture
+
+
+class QuadTarget(FixationTarget):
+    '''
+    Target drawn as one textured quad, 4 vertices whatever its size and line width, instead
+    of hundreds or thousands of 1-px lines. The shape is rasterized once per size/color in a
+    cached texture (see _getTargetTexture). The line based classes remain the pixel-exact reference.
+    Subclasses implement _texture()
+    '''
+    def _texture(self):
+        raise NotImplementedError("_texture() must be implemented in subclass")
+
+    def _create(self):
+        self._loaded = self._texture()
+        self.quad = self._stimulus('quad', size=self._loaded.shape[1::-1], anchor=Shady.LOCATION.CENTER, position=[0., 0.],
+                                   visible=False, z=_getTargetLayer(self.wind))
+        _getStimulusPool(self.wind).load_texture(self.quad, self._loaded)
+        self.on = False
+
+    def _refresh(self):
+        texture = self._texture()
+        if texture is not self._loaded:
+            self._loaded = texture
+            _getFrameCommit(self.wind).call(_getStimulusPool(self.wind).load_texture, self.quad, texture) # with the new size
+            self._set(self.quad, size=texture.shape[1::-1])
+
+    def set_target_size(self, size):
+        self.target_size = size
+        self._refresh()
+
+    def set_target_color(self, color):
+        self.target_color = color
+        self._refresh()
+
+    def draw(self, pos=None):
+        if pos:
+            self._set(self.quad, position=pos)
+        self._set(self.quad, visible=True)
+        self.on = True
+
+    def clear(self):
+        self._set(self.quad, visible=False)
+        self.on = False
+
+
+class FullQuad(QuadTarget):
+    ''' Full as a single quad'''
+    def __init__(self, shady_window, owner=None):
+        super(FullQuad, self).__init__(shady_window, owner)
+        self._crossLw = int(round(0.2 * self.target_size)) # prop of size
+        self._crossColor = [0.5]*3
+        self._create()
+
+    def _texture(self):
+        return _getTargetTexture('full', self.target_size, self._crossLw, (self.target_color, self._crossColor))
+
+
+class CircleQuad(QuadTarget):
+    ''' Circle as a single quad'''
+    def __init__(self, shady_window, owner=None):
+        super(CircleQuad, self).__init__(shady_window, owner)
+        self.target_inner = 0.25*self.target_size # in prop of outer radius
+        self._create()
+
+    def _texture(self):
+        lw = max(int(round(self.target_size/2 - self.target_inner/2)), 0)
+        return _getTargetTexture('ring', self.target_size, lw, (self.target_color,))
+
+
+class CrossQuad(QuadTarget):
+    ''' Cross as a single quad'''
+    def __init__(self, shady_window, owner=None):
+        super(CrossQuad, self).__init__(shady_window, owner)
+        self._crossLw = int(round(0.1*self.target_size)) # pix
+        self._create()
+
+    def _texture(self):
+        center_color = [np.abs(i-1) for i in _rgb(self.target_color)]
+        return _getTargetTexture('cross', self.target_size, self._crossLw, (self.target_color, center_color))
+
+    def set_target_size(self, size):
+        self._crossLw = int(round(0.1*size)) # pix
+        super(CrossQuad, self).set_target_size(size)
+
+
 class MenuScreen(object):
 
     #MD size in percent of screen size
-    def __init__(self, shady_window):
+    def __init__(self, shady_window, owner=None):
         self._win = shady_window
+        self._owner = self if owner is None else owner # of the text stimulus in the pool
         self._fontSize = 18
         self._txtColor = [0]*3
         self._menuTxt = ("ENTER: Show/Hide Camera Image \n"+
@@ -325,26 +756,697 @@ class MenuScreen(object):
                          "UP/DOWN: Manually Adjust Pupil Threshold\n"+
                          "+/-: Manually Adjust CR Threshold")
         self.on = None
-        self._create()
+        self._txt = None # created on first draw
 
     def _create(self):
-        self._txt = self._win.Stimulus(text=self._menuTxt, text_align='left', 
-                                     text_fill=self._txtColor, text_size=self._fontSize,
-                                     y=-self._win.size[1]/4, visible=False)
+        _importText()
+        self._txt = _getStimulusPool(self._win).acquire(self._owner, 'MenuScreen.text', text=self._menuTxt, text_align='left',
+                                                        text_fill=self._txtColor, text_size=self._fontSize,
+                                                        y=-self._win.size[1]/4, visible=False)
+
+    def _set(self, stim, **properties):
+        _getFrameCommit(self._win).set(stim, **properties)
 
     def set_menu_color(self, color):
         self._txtColor = color
-        self._txt.text_fill = self._txtColor
+        if self._txt is not None:
+            self._set(self._txt, text_fill=self._txtColor)
 
     def draw(self):
-        self._txt.visible = True
+        if self._txt is None:
+            self._create()
+        self._set(self._txt, visible=True)
         self.on = True
 
     def clear(self):
-        self._txt.visible = False
+        if self._txt is not None:
+            self._set(self._txt, visible=False)
         self.on = False
 
 
+class CameraImageBuffer(object):
+    '''
+    Collects the camera image lines into 8-bit palette index frames, one preallocated
+    frame per view geometry, each line copied in one block.
+    '''
+    def __init__(self):
+        self._frames = {} # (width, totlines) -> index frame
+        self.frame = None # frame currently being filled
+
+    def get_frame(self, width, totlines):
+        key = (int(width), int(totlines))
+        frame = self._frames.get(key)
+        if frame is None:
+            frame = self._frames[key] = np.zeros((key[1], key[0]), dtype=np.uint8)
+        return frame
+
+    def ingest(self, width, line, totlines, buff):
+        ''' copies one line (1-based as sent by pylink), returns True once the frame is complete'''
+        frame = self.frame
+        if frame is None or frame.shape[0] != totlines or frame.shape[1] != width:
+            frame = self.frame = self.get_frame(width, totlines)
+        if 0 < line <= totlines:
+            row = _lineToArray(buff, width)
+            frame[line-1, :row.size] = row
+        else:
+            print('Failed to draw image line %d of %d'%(line-1, totlines))
+        return line == totlines
+
+
+def _lineToArray(buff, width):
+    ''' uint8 view on the first width values of buff, zero-copy when possible'''
+    try:
+        view = memoryview(buff)
+    except TypeError: # plain sequence of ints
+        return np.asarray(buff[:width], dtype=np.uint8)
+    if view.itemsize == 1 and view.ndim == 1:
+        return np.frombuffer(view, dtype=np.uint8, count=min(width, view.nbytes))
+    return np.asarray(view[:width]).astype(np.uint8, copy=False)
+
+
+class ImagePalette(object):
+    '''
+    Lookup table turning palette index frames into RGBA images (one uint32 take() per frame).
+    Output arrays are used in turn, buffers per frame size, so an uploaded image is not
+    overwritten by the next frame.
+    '''
+    def __init__(self, buffers=2):
+        self.lut = np.zeros((256, 4), dtype=np.uint8)
+        self.lut[:, 3] = 255
+        self._lut32 = self.lut.view(np.uint32).ravel() # same memory, 1 value per color
+        self.size = 0 # number of colors sent by the host
+        self.version = 0 # incremented by set_palette
+        self.buffers = buffers
+        self._outputs = {} # frame shape -> [output images, index of the last one returned]
+
+    def set_palette(self, r, g, b):
+        n = min(len(r), len(g), len(b), self.lut.shape[0])
+        rgb = np.array([r[:n], g[:n], b[:n]], dtype=float).T
+        self.lut[:n, :3] = np.clip(rgb, 0, 255).astype(np.uint8)
+        self.lut[n:, :3] = 0
+        self.size = n
+        self.version += 1
+
+    def get_rgb_table(self):
+        ''' (256, 3) float table in [0, 1], for a render side lookup'''
+        return self.lut[:, :3]/255.
+
+    def get_output(self, shape):
+        ''' next output image of this shape, written again only buffers calls later'''
+        shape = tuple(shape[:2]) + (4,)
+        ring = self._outputs.get(shape)
+        if ring is None:
+            ring = self._outputs[shape] = [[np.zeros(shape, dtype=np.uint8) for i in range(self.buffers)], -1]
+        ring[1] = (ring[1] + 1) % len(ring[0])
+        return ring[0][ring[1]]
+
+    def apply(self, index_frame, out=None):
+        ''' out[i, j] = lut[index_frame[i, j]], out is reused buffers frames of the same size later'''
+        if out is None:
+            out = self.get_output(index_frame.shape)
+        # 'clip' avoids np.take buffering out (indices are uint8 so always valid)
+        np.take(self._lut32, index_frame, out=out.view(np.uint32)[..., 0], mode='clip')
+        return out
+
+
+def _fitCrop(w, h, dw, dh):
+    ''' centered crop (left, top, width, height) of a w x h image to the aspect ratio of dw x dh, as ImageOps.fit()'''
+    if w/h > dw/dh:
+        crop_w, crop_h = dw/dh*h, h
+    else:
+        crop_w, crop_h = w, w*dh/dw
+    return (w-crop_w)/2, (h-crop_h)/2, crop_w, crop_h
+
+
+class ImageResampler(object):
+    '''
+    Centered crop (as ImageOps.fit()) and resize, maps cached per shapes and mode.
+    Modes: 'nearest' (as PIL), 'bilinear' (no antialiasing), 'replicate' (k x k blocks, then crop).
+    Output arrays are used in turn, buffers per shape.
+    '''
+    modes = ('nearest', 'bilinear', 'replicate')
+
+    def __init__(self, mode='nearest', buffers=2):
+        self.mode = mode
+        self.buffers = buffers
+        self._maps = {}
+        self._outputs = {} # (shape, dtype, tag) -> [arrays, index of the last one returned]
+
+    def get_map(self, src_shape, dst_shape, mode=None):
+        mode = mode or self.mode
+        key = (tuple(src_shape), tuple(dst_shape), mode)
+        m = self._maps.get(key)
+        if m is None:
+            m = self._maps[key] = self._computeMap(key[0], key[1], mode)
+        return m
+
+    def _computeMap(self, src_shape, dst_shape, mode):
+        (h, w), (dh, dw) = src_shape[:2], dst_shape[:2]
+        if mode == 'replicate':
+            k = max(1, int(np.ceil(max(dw/w, dh/h))))
+            cols = ((w*k - dw)//2 + np.arange(dw))//k
+            rows = ((h*k - dh)//2 + np.arange(dh))//k
+            return np.clip(rows, 0, h-1)[:, None]*w + np.clip(cols, 0, w-1)[None, :]
+        left, top, crop_w, crop_h = _fitCrop(w, h, dw, dh)
+        x = left + (np.arange(dw)+0.5)*crop_w/dw # source coords of destination pixel centers
+        y = top + (np.arange(dh)+0.5)*crop_h/dh
+        if mode == 'nearest':
+            cols = np.clip(np.floor(x).astype(np.intp), 0, w-1)
+            rows = np.clip(np.floor(y).astype(np.intp), 0, h-1)
+            return rows[:, None]*w + cols[None, :]
+        if mode == 'bilinear':
+            # images are handled as (height, width*channels), so column indices and weights
+            # are expanded to every channel and all products broadcast along contiguous rows
+            nc = int(np.prod(src_shape[2:]))
+            x, y = np.clip(x-0.5, 0, w-1), np.clip(y-0.5, 0, h-1)
+            x0, y0 = np.floor(x).astype(np.intp), np.floor(y).astype(np.intp)
+            x1, y1 = np.minimum(x0+1, w-1), np.minimum(y0+1, h-1)
+            channels = np.arange(nc)
+            x0e, x1e = (x0[:, None]*nc + channels).ravel(), (x1[:, None]*nc + channels).ravel()
+            wx, wy = np.repeat(x-x0, nc).astype(np.float32), (y-y0).astype(np.float32)[:, None]
+            return (x0e, x1e, wx, y0, y1, wy)
+        raise ValueError('unknown resampling mode %r, should be one of %s'%(mode, self.modes))
+
+    def get_output(self, shape, dtype=np.uint8, tag=None):
+        ''' next output array, written again only buffers calls later (tagged work arrays: a single one)'''
+        key = (tuple(shape), np.dtype(dtype).str, tag)
+        ring = self._outputs.get(key)
+        if ring is None:
+            n = self.buffers if tag is None else 1
+            ring = self._outputs[key] = [[np.zeros(shape, dtype=dtype) for i in range(n)], -1]
+        ring[1] = (ring[1] + 1) % len(ring[0])
+        return ring[0][ring[1]]
+
+    def resample(self, image, dst_size, mode=None, out=None):
+        ''' image resized to dst_size (width, height), into out or a cached output array'''
+        mode = mode or self.mode
+        dst_shape = (int(dst_size[1]), int(dst_size[0])) + image.shape[2:]
+        if image.shape == dst_shape: # no crop nor resize needed
+            if out is None:
+                return image
+            out[...] = image
+            return out
+        if out is None:
+            out = self.get_output(dst_shape, image.dtype)
+        m = self.get_map(image.shape, dst_shape, mode)
+        if mode == 'bilinear':
+            return self._bilinear(image, m, out)
+        src, dst = image, out
+        if image.ndim == 3 and image.shape[2] == 4 and image.dtype == np.uint8:
+            src, dst = image.view(np.uint32)[..., 0], out.view(np.uint32)[..., 0]
+        np.take(src.ravel(), m, out=dst, mode='clip') # 'clip' avoids np.take buffering out
+        return out
+
+    def _bilinear(self, image, m, out):
+        # columns first, while there are only the source rows to interpolate
+        x0, x1, wx, y0, y1, wy = m
+        src = image.reshape(image.shape[0], -1)
+        h, dh, dwc = src.shape[0], len(y0), len(x0)
+        a = self.get_output((h, dwc), src.dtype, 'left')
+        b = self.get_output((h, dwc), src.dtype, 'right')
+        cols = self.get_output((h, dwc), np.float32, 'cols')
+        top = self.get_output((dh, dwc), np.float32, 'top')
+        bottom = self.get_output((dh, dwc), np.float32, 'bottom')
+        np.take(src, x0, axis=1, out=a, mode='clip')
+        np.take(src, x1, axis=1, out=b, mode='clip')
+        np.subtract(b, a, out=cols, dtype=np.float32)
+        cols *= wx
+        cols += a
+        np.take(cols, y0, axis=0, out=top, mode='clip')
+        np.take(cols, y1, axis=0, out=bottom, mode='clip')
+        bottom -= top
+        bottom *= wy
+        bottom += top
+        if out.dtype.kind in 'ui':
+            bottom += 0.5 # rounding when casting back
+        np.copyto(out.reshape(dh, dwc), bottom, casting='unsafe')
+        return out
+
+
+class CrossHairOverlay(object):
+    '''
+    Cross hair of a camera frame (mouse, CR and pupil crosses, pupil box, search lozenge).
+    Lines are stored in camera coordinates per color, finish() scales them to the eye image and
+    returns only the overlays that changed.
+    '''
+    line_keys = (1, 2, 3, 4, 5) # possible color indices, used for lines
+    lozenge_key = -5
+
+    def __init__(self, capacity=16):
+        self._lines = dict((k, np.zeros((capacity, 4))) for k in self.line_keys) # x1, y1, x2, y2 per line
+        self._scaled = dict((k, np.zeros((capacity, 4))) for k in self.line_keys)
+        self._counts = dict.fromkeys(self.line_keys, 0)
+        self._lozenge = None
+        self._lozengeKey = None # (lozenge, eye_image_size) of the last computed polygon
+        self._unitPolygon = Shady.ComplexPolygonBase(30, joined=True)
+        self._last = {} # key -> vertices returned last time it changed
+
+    def reset(self):
+        for k in self.line_keys:
+            self._counts[k] = 0
+        self._lozenge = None
+
+    def add_line(self, colorindex, x1, y1, x2, y2):
+        lines = self._lines.get(colorindex)
+        if lines is None:
+            return
+        n = self._counts[colorindex]
+        if n == len(lines):
+            lines = self._lines[colorindex] = np.concatenate([lines, np.zeros_like(lines)])
+            self._scaled[colorindex] = np.zeros_like(lines)
+        lines[n] = (x1, y1, x2, y2)
+        self._counts[colorindex] = n + 1
+
+    def set_lozenge(self, x, y, width, height):
+        self._lozenge = (x, y, width, height)
+
+    def raw_lines(self):
+        ''' (n, 5) color index, x1, y1, x2, y2 of the lines stored since reset(), in camera
+        coordinates, the lozenge being a row lozenge_key, x, y, width, height'''
+        rows = [np.column_stack([np.full(self._counts[k], k), self._lines[k][:self._counts[k]]])
+                for k in self.line_keys if self._counts[k]]
+        if self._lozenge is not None:
+            rows.append(np.array([(self.lozenge_key,) + tuple(self._lozenge)], dtype=float))
+        return np.concatenate(rows) if rows else np.zeros((0, 5))
+
+    def finish(self, eye_image_size):
+        ''' {key: vertices} of the overlays that changed, vertices being (n, 2) for lines,
+        complex for the lozenge, and empty for an overlay that became empty'''
+        w, h = float(eye_image_size[0]), float(eye_image_size[1])
+        scale = w > 192
+        factors = np.array([w/192, h/160, w/192, h/160])
+        changes = {}
+        for k in self.line_keys:
+            n = self._counts[k]
+            lines = self._scaled[k][:n]
+            if scale:
+                np.multiply(self._lines[k][:n], factors, out=lines)
+                np.trunc(lines, out=lines)
+                np.subtract(h, lines[:, 1::2], out=lines[:, 1::2])
+            else:
+                lines[...] = self._lines[k][:n]
+            if n and lines.min() < 0: # lines partly out of the image are not drawn
+                lines = lines[(lines >= 0).all(axis=1)]
+            self._update(changes, k, lines.reshape(-1, 2))
+
+        key = (self._lozenge, tuple(eye_image_size))
+        if key != self._lozengeKey:
+            self._lozengeKey = key
+            if self._lozenge is None:
+                polygon = np.zeros(0, dtype=complex)
+            else:
+                x, y, width, height = self._lozenge
+                if scale:
+                    x = int((float(x) / 192) * w)
+                    y = h - int((float(y) / 160) * h)
+                    width = int((float(width) / 192) * w)
+                    height = int((float(height) / 160) * h)
+                radius = np.mean((width, height))/2.
+                polygon = radius*self._unitPolygon + (x+radius + 1j*(y-radius))
+            self._update(changes, self.lozenge_key, polygon)
+        return changes
+
+    def _update(self, changes, key, vertices):
+        last = self._last.get(key)
+        if last is None:
+            if len(vertices) == 0:
+                return
+        elif last.shape == vertices.shape and np.array_equal(last, vertices, equal_nan=True):
+            return
+        self._last[key] = changes[key] = vertices.copy()
+
+
+class FrameExchange(object):
+    '''
+    Hands completed frames from the pylink callback thread to the eye image worker.
+    Triple buffer: the producer always has a free slot to copy into, the consumer always
+    gets the latest frame, and a frame not taken before the next one arrives is dropped
+    instead of queued.
+    '''
+    def __init__(self):
+        self._slots = [None]*3
+        self._info = [None]*3
+        self._write, self._pending, self._read = 0, 1, 2
+        self._fresh = False # pending slot holds a frame not taken yet
+        self._woken = False
+        self._cond = threading.Condition()
+        self.dropped = 0
+
+    def publish(self, frame, info=None):
+        slot = self._slots[self._write]
+        if slot is None or slot.shape != frame.shape:
+            slot = self._slots[self._write] = np.empty_like(frame)
+        np.copyto(slot, frame)
+        with self._cond:
+            self._info[self._write] = info
+            self._write, self._pending = self._pending, self._write
+            if self._fresh:
+                self.dropped += 1
+            self._fresh = True
+            self._cond.notify()
+
+    def take(self, timeout=None):
+        ''' latest frame and its info, (None, None) if none came within timeout
+        the frame stays valid until the next take()'''
+        with self._cond:
+            self._cond.wait_for(lambda: self._fresh or self._woken, timeout)
+            self._woken = False
+            if not self._fresh:
+                return None, None
+            self._read, self._pending = self._pending, self._read
+            self._fresh = False
+            return self._slots[self._read], self._info[self._read]
+
+    def discard(self):
+        with self._cond:
+            if self._fresh:
+                self._fresh = False
+                self.dropped += 1
+
+    def wake(self):
+        ''' makes a waiting take() return now'''
+        with self._cond:
+            self._woken = True
+            self._cond.notify_all()
+
+
+class ImageRateGovernor(object):
+    '''
+    Skips camera frames (still ingested) coming sooner than 1/max_rate ('rate') or than
+    their finalize cost/max_load ('load') after the last one shown, or, with an enabled
+    FrameCommit and wait_for_display, before it was rendered ('display', max_wait s at most).
+    stats() gives the counts and the offered and shown rates over the last window s.
+    '''
+    def __init__(self, max_rate=None, max_load=None, commit=None, wait_for_display=True, max_wait=0.1, window=2.):
+        self.max_rate = max_rate
+        self.max_load = max_load
+        self.commit = commit if wait_for_display else None
+        self.max_wait = max_wait
+        self.window = window
+        self.cost = None # s, moving average of the finalize time
+        self.counts = dict(offered=0, shown=0, skipped_rate=0, skipped_load=0, skipped_display=0)
+        self._offered = collections.deque() # times of the frames of the last window s
+        self._shown = collections.deque()
+        self._last = None # time of the last frame shown
+        self._applied = None # commit.applied when it was shown
+
+    def _skip(self, now):
+        if self._last is None:
+            return None
+        elapsed = now - self._last
+        if self.max_rate and elapsed < 1./self.max_rate:
+            return 'rate'
+        if self.max_load and self.cost is not None and elapsed < self.cost/self.max_load:
+            return 'load'
+        if self.commit is not None and self.commit.enabled and self.commit.applied == self._applied and elapsed < self.max_wait:
+            return 'display'
+        return None
+
+    def admit(self, now):
+        ''' True when the frame completed at now should be shown'''
+        self.counts['offered'] += 1
+        self._offered.append(now)
+        reason = self._skip(now)
+        if reason is not None:
+            self.counts['skipped_' + reason] += 1
+            return False
+        self.counts['shown'] += 1
+        self._shown.append(now)
+        self._last = now
+        self._applied = None if self.commit is None else self.commit.applied
+        return True
+
+    def finished(self, cost):
+        ''' finalize time (s) of a frame shown'''
+        self.cost = cost if self.cost is None else 0.8*self.cost + 0.2*cost
+
+    def stats(self):
+        now = time.perf_counter()
+        rates = []
+        for times in (self._offered, self._shown):
+            while times and times[0] < now - self.window:
+                times.popleft()
+            rates.append(len(times)/self.window)
+        stats = dict(self.counts, offered_rate=rates[0], shown_rate=rates[1], cost=self.cost)
+        stats['load'] = None if self.cost is None else self.cost*rates[1] # fraction of a CPU
+        return stats
+
+
+_beepPairing = 1. # s, a target beep and a draw_cal_target further apart are not the same target
+
+
+def _resolveSoundPath(filename):
+    ''' filename as given if it exists (absolute or relative to the working directory),
+    otherwise relative to this module'''
+    if os.path.isabs(filename) or os.path.exists(filename):
+        return filename
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+
+
+def _readWav(filename):
+    ''' decodes a PCM wav file to (float32 samples x channels in [-1, 1], sampling rate)'''
+    with wave.open(filename, 'rb') as f:
+        nchannels, width, fs, nframes = f.getnchannels(), f.getsampwidth(), f.getframerate(), f.getnframes()
+        data = f.readframes(nframes)
+    if width == 1:
+        y = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128)/128.
+    elif width == 3: # 24 bit: each sample as the 3 high bytes of an int32
+        padded = np.zeros((len(data)//3, 4), dtype=np.uint8)
+        padded[:, 1:] = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3)
+        y = padded.view('<i4').ravel().astype(np.float32)/2.**31
+    elif width in (2, 4):
+        dtype = np.int16 if width == 2 else np.int32
+        y = np.frombuffer(data, dtype=dtype).astype(np.float32)/float(-np.iinfo(dtype).min)
+    else:
+        raise ValueError('unsupported sample width %d in %s'%(width, filename))
+    return y.reshape(-1, nchannels), fs
+
+
+class _NullPlayer(object):
+    ''' plays nothing, counts Play() calls (audio backend 'null', no sound card needed)'''
+    def __init__(self, sound):
+        self.sound = sound
+        self.plays = 0
+
+    def Play(self, position=None, wait=False):
+        self.plays += 1
+
+
+class BeepBank(object):
+    '''
+    Calibration beeps decoded once and played on one persistent output stream.
+    backend: 'audiomath' or 'null' (nothing played). call_times: time each play() took,
+    stream_latency: output latency of the stream (None if unknown).
+    '''
+    names = ('target', 'done', 'error')
+
+    def __init__(self, backend='audiomath'):
+        if backend not in ('audiomath', 'null'):
+            raise ValueError('unknown audio backend %r'%backend)
+        self.backend = backend
+        self.sounds = dict.fromkeys(self.names)
+        self.players = dict.fromkeys(self.names)
+        self.call_times = collections.deque(maxlen=1000)
+        self.stream = None
+        self.stream_latency = None
+
+    def load(self, name, source):
+        ''' source: file name, sound object (audiomath Sound or (samples, fs)) or None for no sound'''
+        if source is None:
+            self.sounds[name] = self.players[name] = None
+            return
+        if isinstance(source, str):
+            path = _resolveSoundPath(source)
+            source = _importAudiomath().Sound(path) if self.backend == 'audiomath' else _readWav(path)
+        self.sounds[name] = source
+        self.players[name] = self._createPlayer(source)
+
+    def _createPlayer(self, sound):
+        if self.backend == 'null':
+            return _NullPlayer(sound)
+        am = _importAudiomath()
+        if self.stream is None:
+            player = am.Player(sound)
+            self.stream = getattr(player, 'stream', None)
+            self.stream_latency = getattr(self.stream, 'outputLatency', None)
+            return player
+        return am.Player(sound, stream=self.stream)
+
+    def play(self, name):
+        ''' starts the sound, returns the time it was started (perf_counter), None for no sound'''
+        player = self.players[name]
+        if player is None:
+            return None
+        t0 = time.perf_counter()
+        player.Play(0, wait=False)
+        self.call_times.append(time.perf_counter() - t0)
+        return t0
+
+
+class CallbackTracer(object):
+    '''
+    Spans (start, duration) of the display callbacks in a preallocated ring buffer,
+    the oldest being overwritten once capacity is reached. Recording a span costs two
+    perf_counter() calls and three array writes, callbacks are traced by wrapping them
+    (see CalibrationGraphics.enableTracing), so nothing runs when tracing is off.
+    '''
+    def __init__(self, capacity=65536):
+        self.capacity = capacity
+        self.names = []
+        self._ids = {}
+        self._span = np.full(capacity, -1, dtype=np.int16)
+        self._start = np.zeros(capacity)
+        self._duration = np.zeros(capacity)
+        self._counter = itertools.count() # next() is atomic, spans can come from several threads
+
+    def span_id(self, name):
+        if name not in self._ids:
+            self._ids[name] = len(self.names)
+            self.names.append(name)
+        return self._ids[name]
+
+    def record(self, span_id, t0, t1):
+        i = next(self._counter) % self.capacity
+        self._span[i] = span_id
+        self._start[i] = t0
+        self._duration[i] = t1 - t0
+
+    def wrap(self, func, name):
+        span_id, record, clock = self.span_id(name), self.record, time.perf_counter
+        def traced(*args, **kwargs):
+            t0 = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(span_id, t0, clock())
+        return traced
+
+    def spans(self):
+        ''' (span ids, starts, durations) of the spans in the buffer, oldest first'''
+        order = np.argsort(self._start, kind='stable')
+        order = order[self._span[order] >= 0]
+        return self._span[order], self._start[order], self._duration[order]
+
+    def summary(self, percentiles=(50, 95, 99)):
+        ''' name -> count, mean, p50, p95, p99 and max durations (s) of the spans in the buffer'''
+        span, start, duration = self.spans()
+        result = {}
+        for i, name in enumerate(self.names):
+            d = duration[span == i]
+            if not d.size:
+                continue
+            stats = dict(count=int(d.size), mean=float(d.mean()), max=float(d.max()))
+            for p, value in zip(percentiles, np.percentile(d, percentiles)):
+                stats['p%g'%p] = float(value)
+            result[name] = stats
+        return result
+
+    def dump(self, filename):
+        ''' spans and summary table to a compressed .npz (names, span, start, duration,
+        summary_columns, summary with one row per name)'''
+        span, start, duration = self.spans()
+        summary = self.summary()
+        columns = ['count', 'mean', 'p50', 'p95', 'p99', 'max']
+        table = np.array([[summary.get(name, {}).get(c, np.nan) for c in columns] for name in self.names]).reshape(-1, len(columns))
+        np.savez_compressed(filename, names=np.array(self.names), span=span, start=start, duration=duration,
+                            summary_columns=np.array(columns), summary=table)
+
+
+class OnsetTimer(object):
+    '''
+    Timestamps the flip showing each target draw / erase command, from the animation
+    callback of an invisible probe: the first frame prepared after a command shows it, its flip
+    is the start of the next callback. Assumes World.Defer() calls (the FrameCommit) run before
+    the animation callbacks of a frame, as in HeadlessShady; otherwise onsets are one frame late.
+    onsets: kind, x, y, command and flip (perf_counter), delay (s), frame.
+    '''
+    def __init__(self, world):
+        self.world = world
+        self.onsets = []
+        self.frames = 0
+        self._lock = threading.Lock()
+        self._pending = [] # commands not drawn yet
+        self._drawing = [] # commands drawn by the frame being prepared
+        self._flipped = collections.deque() # onsets not handed to pop_flipped() yet
+        self._probe = _getStimulusPool(world).acquire(self, 'OnsetTimer.probe', parkable=False, # stays in the World
+                                                      size=[1, 1], visible=False, z=_getTargetLayer(world))
+        self._probe.SetAnimationCallback(self._frame)
+
+    def command(self, kind, x=None, y=None, t=None):
+        ''' t: time of the command (perf_counter), now by default'''
+        with self._lock:
+            self._pending.append(dict(kind=kind, x=x, y=y, command=time.perf_counter() if t is None else t))
+
+    def _frame(self, *args): # called as (t) or (stim, t) depending on the binding
+        now = time.perf_counter()
+        with self._lock:
+            for onset in self._drawing:
+                onset.update(flip=now, delay=now - onset['command'], frame=self.frames - 1)
+                self.onsets.append(onset)
+                self._flipped.append(onset)
+            self._drawing, self._pending = self._pending, []
+            self.frames += 1
+
+    def pop_flipped(self):
+        with self._lock:
+            flipped, self._flipped = list(self._flipped), collections.deque()
+        return flipped
+
+    def close(self):
+        _getStimulusPool(self.world).release(self)
+
+
+class GazeBinding(object):
+    '''
+    Shady dynamic following the newest gaze sample of a RecordingSession (in Shady
+    coordinates). With predict, extrapolated over the sample age plus render_latency (ms) from
+    the velocity over history ms, at most max_horizon ms. Blinks keep the last position.
+    frames: frame time, sample time, age and horizon (ms), see report().
+    '''
+    def __init__(self, world, session, predict=False, render_latency=1000/60., history=10.,
+                 max_horizon=50., eye=None, offset=(0., 0.), max_frames=100000):
+        self.world = world
+        self.session = session
+        self.predict = predict
+        self.render_latency = render_latency
+        self.history = history
+        self.max_horizon = max_horizon
+        self.eye = eye
+        self.offset = offset
+        self.frames = collections.deque(maxlen=max_frames)
+        self._rows = 4 + int(history*4) # rows read per frame, enough for 2 eyes at 2000 Hz
+        self._position = [0., 0.]
+
+    def __call__(self, t):
+        columns = self.session.samples.snapshot(last=self._rows)
+        times, x, y = columns['time'], columns['gaze_x'], columns['gaze_y']
+        valid = ~(np.isnan(x) | np.isnan(y))
+        if self.eye is not None:
+            valid &= columns['eye'] == self.eye
+        if not valid.any():
+            self.frames.append((t, np.nan, np.nan, np.nan))
+            return self._position
+        times, x, y = times[valid], x[valid], y[valid]
+        sample_time, gx, gy = times[-1], float(x[-1]), float(y[-1])
+        age = self.session.tracker_time() - sample_time
+        horizon = 0.
+        if self.predict:
+            k = int(np.searchsorted(times, sample_time - self.history))
+            if sample_time > times[k]:
+                horizon = min(age + self.render_latency, self.max_horizon)
+                gx += (gx - x[k])/(sample_time - times[k])*horizon
+                gy += (gy - y[k])/(sample_time - times[k])*horizon
+        self.frames.append((t, sample_time, age, horizon))
+        x, y = _trackerToShady(self.world, gx, gy)
+        self._position = [x + self.offset[0], y + self.offset[1]]
+        return self._position
+
+    def report(self):
+        ''' {frame_time, sample_time, age, horizon} arrays, one value per evaluated frame'''
+        rows = np.array(self.frames, dtype=float).reshape(-1, 4)
+        return dict(zip(('frame_time', 'sample_time', 'age', 'horizon'), rows.T))
+
+
 class CalibrationGraphics(pylink.EyeLinkCustomDisplay):
 
     """
@@ -357,48 +1459,82 @@ class CalibrationGraphics(pylink.EyeLinkCustomDisplay):
         tracker: eyelink tracker
         win: shady window, canvas with background color set
         target_type: "full" (default), "disk", "circle" or "cross"
-
-    Check which function called when leaves setup display for good 
-    and makes all stimuli Leave() the world?
+        target_rendering: "lines" (default) or "quad" (single textured quad targets)
+        audio_backend: "audiomath" (default) or "null" to play no sound
+        threaded_image: convert and upload eye images on a worker thread
     """
 
-    def __init__(self, tracker, win, target='full', verbose=False):
+    def __init__(self, tracker, win, target='full', verbose=False, threaded_image=False, target_rendering='lines',
+                 audio_backend='audiomath'):
 
         pylink.EyeLinkCustomDisplay.__init__(self)
 
         self.win = win  # screen to use for calibration (assumes canvas mode with background color preset)
         self.tracker = tracker  # connection to the tracker
         self._targetType = target
+        self._targetRendering = target_rendering
         self.target = None
         self.verbose = verbose
+        self._beeps = BeepBank(audio_backend) # silent until setCalibrationSounds()
+        self._beepOnsets = collections.deque(maxlen=1000) # target beep start - draw_cal_target call (s)
+        self._targetDrawn = None # draw_cal_target time not paired with a target beep yet
+        self._targetBeep = None # target beep start not paired with a draw_cal_target yet
+        self._tracer = None # see enableTracing()
+        self._tracingFile = None
+        self._onsetTimer = None # see enableOnsetTiming()
+        self._onsetMessages = False
+        self._recorder = None # see enableFrameRecording()
+        self._stimuli = _getStimulusPool(self.win) # owns every stimulus created below
+        self._commit = _getFrameCommit(self.win) # callbacks stage their display changes in it
 
         # initialize events variables
-        self.win.keys = []
-        self.win.mouse_x, self.win.mouse_y = self.win.size[0]/2, self.win.size[1]/2
-        self.win.mouse_anypress = 0
+        _setInputQueue(self.win, InputQueue(mouse=(self.win.size[0]/2, self.win.size[1]/2)))
 
         # initialize camera eye stims (image and cross hair)
         self.eye_image_title = None
         self.eye_image_size = [640, 480] # intended size of displayed eye_image from camera (bigger than input)
         self.eye_image = None
-        self._resetCrossHair()
-
-        self.cross_hair_stims = None
+        self._imageBuffer = CameraImageBuffer()
+        self._palette = ImagePalette()
+        self._resampler = ImageResampler()
+        # bytes uploaded per camera frame at eye_image_size 640x480:
+        # 'numpy' (default): RGBA converted on the CPU, 640*480*4 = 1228800 whatever the camera image
+        # 'pil' (former, slower conversion): RGB, 640*480*3 = 921600
+        # 'shader': the 8-bit index frame at camera resolution, 30720 for 192x160, 122880 for 384x320,
+        #           307200 for 640x480; the palette (256 colors) is uploaded once per set_image_palette
+        self.eye_image_backend = 'numpy'
+        self.eye_image_resampling = 'nearest' # or 'bilinear', 'replicate', see ImageResampler
+        self._imageStats = dict(received=0, skipped=0, converted=0, displayed=0, errors=0)
+        self._governor = None # see setEyeImageRate()
+        self._eyeImageLayout = None # (backend, frame shape, palette version) the eye image stim is set for
+        self._imageLock = threading.Lock() # eye image display state vs clear_cal_display
+        self._imageGeneration = 0 # incremented when cleared, frames from before are not shown
+        self._imageExchange = FrameExchange() if threaded_image else None
+        self._imageWorker = None
+        self._crossHair = CrossHairOverlay()
+        self._crossHairLock = threading.Lock()
+        self._crossHairPending = {} # changes not pushed to the stims yet
+        self._crossHairDrawn = {} # key -> overlay not empty
+        self._crossHairVisible = set()
+
+        self.cross_hair_stims = {}
 
         self.target = self._createCalibrationTarget() 
-        self.menu = MenuScreen(self.win)
+        self.menu = MenuScreen(self.win, owner=self)
 
 
     def _createCalibrationTarget(self):
         if self.verbose: print("_createCalibrationTarget")
+        if self._targetRendering == 'quad' and self._targetType in ['full', 'circle', 'cross']:
+            return {'full': FullQuad, 'circle': CircleQuad, 'cross': CrossQuad}[self._targetType](self.win, owner=self)
         if self._targetType == 'full':
-            return Full(self.win)
+            return Full(self.win, owner=self)
         elif self._targetType == 'disk':
-            return Disk(self.win)
+            return Disk(self.win, owner=self)
         elif self._targetType == 'circle':
-            return Circle(self.win)
+            return Circle(self.win, owner=self)
         elif self._targetType == 'cross':
-            return Cross(self.win)
+            return Cross(self.win, owner=self)
 
 
     def _getColorFromIndex(self, colorindex):
@@ -418,44 +1554,48 @@ class CalibrationGraphics(pylink.EyeLinkCustomDisplay):
             return (0, 0, 0, 0)
 
 
-    def _meta_draw_cross_hair(self):
-        '''
-        draw cross hair with putative components:
-        - mouse position (red crosses)
-        - CR and pupil cross hair (white crosses)
-        - pupil box color (green square)
-        - search limits on head view (red "lozenge")
-
-        instead of using typical pygame/psychopy draw_line/draw_lozenge usage function,
-        only collects data from these functions to update the 4 putative stim
-        A bit messy
+    def _meta_draw_cross_hair(self, collect=True):
+        ''' draw cross hair with putative components (see CrossHairOverlay)
+        only changed overlays are pushed to their stims, created when first needed
+        collect: False when the data was already collected on the pylink thread (threaded eye image)
         '''
-        self._resetCrossHair()
-        self.draw_cross_hair() # Eyelink defined function, calls other functions (draw_line, get_mouse_state and draw_lozenge from what I gathered...)
-        
-        if self.cross_hair_stims is None:
-            self.cross_hair_stims = {}
-            for s in self.cross_hair_lines.keys():
+        if collect:
+            self._collectCrossHair()
+        with self._crossHairLock:
+            changes, self._crossHairPending = self._crossHairPending, {}
+
+        for s, vertices in changes.items():
+            self._crossHairDrawn[s] = len(vertices) > 0
+            if not len(vertices): # hidden below, no need to push nothing
+                continue
+            if s not in self.cross_hair_stims:
                 color = self._getColorFromIndex(abs(s))
-                if np.sign(s) > 0:
-                    self.cross_hair_stims[s] = self.win.Stimulus(size=self.eye_image_size, anchor=Shady.LOCATION.CENTER, position=[0., 0.], 
-                                                                 drawMode=Shady.DRAWMODE.LINES, penThickness=5, points=self.cross_hair_lines[s], 
-                                                                 color=color, visible=True, smoothing=True, z=_getCrossHairsLayer(self.win))
+                drawMode = Shady.DRAWMODE.LINES if s > 0 else Shady.DRAWMODE.LINE_LOOP
+                self.cross_hair_stims[s] = self._stimuli.acquire(self, 'cross_hair.%d'%s, size=self.eye_image_size, anchor=Shady.LOCATION.CENTER,
+                                                                 position=[0., 0.], drawMode=drawMode, penThickness=5, points=vertices,
+                                                                 color=color, visible=False, smoothing=True, z=_getCrossHairsLayer(self.win))
+            else:
+                self._commit.set(self.cross_hair_stims[s], points=vertices)
+
+        for s, stim in self.cross_hair_stims.items():
+            drawn = self._crossHairDrawn.get(s, False)
+            if drawn != (s in self._crossHairVisible):
+                self._commit.set(stim, visible=drawn)
+                if drawn:
+                    self._crossHairVisible.add(s)
                 else:
-                    self.cross_hair_stims[s] = self.win.Stimulus(size=self.eye_image_size, anchor=Shady.LOCATION.CENTER, position=[0., 0.], 
-                                                                 drawMode=Shady.DRAWMODE.LINE_LOOP, penThickness=5, points=self.cross_hair_lines[s], 
-                                                                 color=color, visible=True, smoothing=True, z=_getCrossHairsLayer(self.win))
-
-        else:
-            for s in self.cross_hair_lines.keys():
-                self.cross_hair_stims[s].points = self.cross_hair_lines[s]
+                    self._crossHairVisible.discard(s)
 
 
-    def _resetCrossHair(self):
-        self.cross_hair_lines = {}
-        for i in range(1, 6): # possible color indices, used for lines
-            self.cross_hair_lines[i] = []
-        self.cross_hair_lines[-5] = [] # index for lozenge
+    def _collectCrossHair(self):
+        ''' runs Eyelink draw_cross_hair() (calls draw_line, get_mouse_state and draw_lozenge from what I gathered...)
+        and queues the overlays that changed for _meta_draw_cross_hair()'''
+        self._crossHair.reset()
+        self.draw_cross_hair()
+        changes = self._crossHair.finish(self.eye_image_size)
+        if changes:
+            with self._crossHairLock:
+                self._crossHairPending.update(changes)
 
 
     def setCalibrationColor(self, color):
@@ -467,7 +1607,8 @@ class CalibrationGraphics(pylink.EyeLinkCustomDisplay):
         if self.verbose: print("setCalibrationColor")
         self._targetColor = color
         if self.target is not None:
-            self.target.set_target_color(self._targetColor)
+            with self._commit:
+                self.target.set_target_color(self._targetColor)
 
 
     def setCalibrationSize(self, size):
@@ -479,7 +1620,8 @@ class CalibrationGraphics(pylink.EyeLinkCustomDisplay):
         if self.verbose: print("setCalibrationSize")
         self._targetSize = size
         if self.target is not None:
-            self.target.set_target_size(self._targetSize)
+            with self._commit:
+                self.target.set_target_size(self._targetSize)
 
 
     def setCalibrationSounds(self, target_beep, done_beep, error_beep):
@@ -492,111 +1634,292 @@ class CalibrationGraphics(pylink.EyeLinkCustomDisplay):
         """
         if self.verbose: print("setCalibrationSounds")
 
-        # target beep
-        if target_beep == '':
-            self._target_beep = am.Sound(default_tar_beep)
-        elif target_beep == 'off':
-            self._target_beep = None
-        else:
-            self._target_beep = target_beep
+        # each is '' (default sound), 'off' (no sound), a file name or an already loaded sound
+        for name, beep, default in [('target', target_beep, default_tar_beep),
+                                    ('done', done_beep, default_done_beep),
+                                    ('error', error_beep, default_error_beep)]:
+            if isinstance(beep, str) and beep == '':
+                beep = default
+            elif isinstance(beep, str) and beep == 'off':
+                beep = None
+            self._beeps.load(name, beep)
+
+
+    def getBeepLatency(self):
+        """ Onset (s) of the target beep relative to its draw_cal_target call (start plus stream
+        latency), over the last 1000 targets: count, mean, median, max, play_mean and play_max
+        (time play_beep took) and stream (output latency, if known)
+        """
+        onsets = np.array(self._beepOnsets) + (self._beeps.stream_latency or 0.)
+        calls = np.array(self._beeps.call_times)
+        latency = dict(count=onsets.size, mean=None, median=None, max=None, play_mean=None, play_max=None,
+                       stream=self._beeps.stream_latency)
+        if onsets.size:
+            latency.update(mean=float(onsets.mean()), median=float(np.median(onsets)), max=float(onsets.max()))
+        if calls.size:
+            latency.update(play_mean=float(calls.mean()), play_max=float(calls.max()))
+        return latency
+
+
+    _tracedCallbacks = {'_meta_draw_cross_hair': '_meta_draw_cross_hair', '_loadEyeImage': 'LoadTexture',
+                        'get_input_key': 'get_input_key', 'get_mouse_state': 'get_mouse_state',
+                        'draw_cal_target': 'draw_cal_target'}
+
+    def enableTracing(self, filename=None, capacity=65536):
+        """ Records the duration of the hot callbacks (see CallbackTracer)
+        Parameters:
+            filename: .npz file dumped at each exit_cal_display (None: no file)
+            capacity: number of spans kept
+        returns the CallbackTracer
+        """
+        self.disableTracing()
+        tracer = self._tracer = CallbackTracer(capacity)
+        self._tracingFile = filename
+        for attr, name in self._tracedCallbacks.items():
+            setattr(self, attr, tracer.wrap(getattr(type(self), attr).__get__(self), name))
+        draw, clock, record = type(self).draw_image_line.__get__(self), time.perf_counter, tracer.record
+        line_id, frame_id = tracer.span_id('draw_image_line'), tracer.span_id('draw_image_line_frame')
+        def draw_image_line(width, line, totlines, buff):
+            t0 = clock()
+            try:
+                return draw(width, line, totlines, buff)
+            finally:
+                record(frame_id if line == totlines else line_id, t0, clock())
+        self.draw_image_line = draw_image_line
+        return tracer
 
-        # done beep
-        if done_beep == '':
-            self._done_beep = am.Sound(default_done_beep)
-        elif done_beep == 'off':
-            self._done_beep = None
-        else:
-            self._done_beep = done_beep
 
-        # error beep
-        if error_beep == '':
-            self._error_beep = am.Sound(default_error_beep)
-        elif error_beep == 'off':
-            self._error_beep = None
-        else:
-            self._error_beep = error_beep
+    def disableTracing(self):
+        """ Removes the tracing wrappers, spans recorded so far stay in getTracingSummary()"""
+        for attr in list(self._tracedCallbacks) + ['draw_image_line']:
+            self.__dict__.pop(attr, None)
+        self._tracingFile = None
+
+
+    def getTracingSummary(self):
+        """ Per callback count, mean, p50, p95, p99 and max durations (s), {} when tracing never enabled"""
+        return {} if self._tracer is None else self._tracer.summary()
+
+
+    def enableOnsetTiming(self, send_messages=True):
+        """ Timestamps the flip showing each calibration target and each erase (see OnsetTimer)
+        Parameters:
+            send_messages: sends "TARGET_ONSET x y DELAY ms" / "TARGET_ERASE DELAY ms" to the
+                           tracker, with the offset placing them at the flip
+        """
+        if self._onsetTimer is None:
+            self._onsetTimer = OnsetTimer(self.win)
+        self._onsetMessages = send_messages
+
+
+    def getTargetOnsets(self):
+        """ Table of the target and erase onsets timed so far (see OnsetTimer.onsets), [] when not enabled"""
+        if self._onsetTimer is None:
+            return []
+        with self._onsetTimer._lock:
+            return [dict(onset) for onset in self._onsetTimer.onsets]
+
+
+    def _sendOnsetMessages(self):
+        ''' messages for the flips timed since last call, sent from the pylink thread'''
+        for onset in self._onsetTimer.pop_flipped():
+            if not self._onsetMessages:
+                continue
+            offset = int(round((time.perf_counter() - onset['flip'])*1000)) # ms before now
+            if onset['kind'] == 'target':
+                message = 'TARGET_ONSET %d %d DELAY %.1f'%(onset['x'], onset['y'], onset['delay']*1000)
+            else:
+                message = 'TARGET_ERASE DELAY %.1f'%(onset['delay']*1000)
+            self.tracker.sendMessage(message, offset)
+
+
+    def enableFrameRecording(self, filename, slots=900, max_frame_size=(640, 480)):
+        """ Records the camera frames, palettes and cross hair to a ring file (see CameraFrameRecording)
+        Parameters:
+            filename: recording file, overwritten
+            slots: number of frames kept
+            max_frame_size: (width, height) of the largest frame recorded
+        """
+        import CameraFrameRecording # only needed when recording
+        self.disableFrameRecording()
+        self._recorder = CameraFrameRecording.CameraFrameRecorder(filename, slots=slots, max_frame_size=max_frame_size)
+        if self._palette.size:
+            self._recorder.set_palette(self._palette.lut[:self._palette.size, :3])
+        return self._recorder
+
+
+    def disableFrameRecording(self):
+        recorder, self._recorder = self._recorder, None
+        if recorder is not None:
+            recorder.close()
+
+
+    def bindToGaze(self, stim, session, predict=False, render_latency=None, **kwargs):
+        """ Makes stim follow the gaze (see GazeBinding)
+        Parameters:
+            session: started RecordingSession
+            predict: extrapolate the gaze over the sample age plus render latency
+            render_latency: ms to the flip, by default the median onset delay if timed, else 1 frame at 60 Hz
+        returns the GazeBinding
+        """
+        if render_latency is None:
+            delays = [onset['delay'] for onset in self.getTargetOnsets() if onset['kind'] == 'target']
+            render_latency = float(np.median(delays))*1000 if delays else 1000/60.
+        binding = GazeBinding(self.win, session, predict=predict, render_latency=render_latency, **kwargs)
+        stim.position = binding
+        return binding
+
+
+    def close(self, free=False):
+        """ Teardown, the instance can no longer be used: stops the eye image worker and the
+        frame recording, and hands all its stimuli back to the window's StimulusPool (out of the
+        World, reused by the next CalibrationGraphics in this window)
+        Parameters:
+            free: also drop the released stimuli of the pool so they are garbage collected
+        """
+        self._stopImageWorker()
+        self.disableFrameRecording()
+        if self._onsetTimer is not None:
+            self._onsetTimer.close()
+            self._onsetTimer = None
+        self._commit.flush() # staged changes of this instance applied before its stimuli go
+        self._stimuli.release(self)
+        if free:
+            self._stimuli.discard_free()
+        self.eye_image = self.eye_image_title = None
+        self.cross_hair_stims = {}
+
+
+    def getStimulusReport(self):
+        """ Stimuli of the window's StimulusPool: live (in the World), parked (out of it between
+        setups) and free (released by closed instances), each with count, texture bytes and count
+        per role, plus created / reused / parked counts and owned: the stimuli of this instance
+        """
+        return self._stimuli.report(owner=self)
 
 
     def setup_cal_display(self):
         if self.verbose: print("setup_cal_display")
         '''init event handling while in camera setup mode and shows menu options'''
-        if self.tracker.getCurrentMode() == pylink.IN_SETUP_MODE:
-            self.menu.draw()
+        with self._commit:
+            self._commit.call(self._stimuli.unpark, self)
+            if self.tracker.getCurrentMode() == pylink.IN_SETUP_MODE:
+                self.menu.draw()
         self.win.SetEventHandler(_handleEvents, slot=0)
 
 
     def exit_cal_display(self):
         if self.verbose: print("exit_cal_display")
         '''exits camera setup and release corresponding Shady resources'''
-        self.clear_cal_display()
+        self._stopImageWorker()
+        with self._commit: # hidden stimuli out of the World until the next setup, once hidden
+            self.clear_cal_display()
+            self._commit.call(self._stimuli.park, self)
+        if self._tracingFile is not None:
+            self._tracer.dump(self._tracingFile)
+        if self._onsetTimer is not None:
+            self._sendOnsetMessages()
+        if self._recorder is not None:
+            self._recorder.flush()
         if self.tracker.getCurrentMode() == pylink.IN_IDLE_MODE:
             self.win.SetEventHandler(_defaultHandler, slot=0)
 
 
     def clear_cal_display(self):
         if self.verbose: print("clear_cal_display")
-        if self.menu.on:
-            self.menu.clear()
-        if self.target.on:
-            self.target.clear()
-        if self.eye_image_title is not None:
-            self.eye_image_title.visible = False
-        if self.eye_image is not None:
-            self.eye_image.visible = False
-        if self.cross_hair_stims is not None:
+        with self._commit, self._imageLock: # a frame being finalized on the worker won't show up again
+            if self.menu.on:
+                self.menu.clear()
+            if self.target.on:
+                self.target.clear()
+            if self.eye_image_title is not None:
+                self._commit.set(self.eye_image_title, visible=False)
+            self._imageGeneration += 1
+            if self._imageExchange is not None:
+                self._imageExchange.discard()
+            if self.eye_image is not None:
+                self._commit.set(self.eye_image, visible=False)
             for element in self.cross_hair_stims.values():
-                element.visible = False
+                self._commit.set(element, visible=False)
+            self._crossHairVisible.clear()
 
 
     def erase_cal_target(self):
         if self.verbose: print("erase_cal_target")
-        self.clear_cal_display()
+        with self._commit: # the onset is timed from the frame applying the changes
+            self.clear_cal_display()
+            if self._onsetTimer is not None:
+                self._commit.call(self._onsetTimer.command, 'erase', None, None, time.perf_counter())
+        if self._onsetTimer is not None:
+            self._sendOnsetMessages()
 
 
     def draw_cal_target(self, x, y):
         if self.verbose: print('draw_cal_target', x, y)
-        # converts to shady default coords
-        x = x - self.win.size[0]/2
-        y = - (y - self.win.size[1]/2)
-        self.target.draw(pos=(x, y))
+        t = time.perf_counter() # beep onsets are relative to this call
+        if self._targetBeep is not None and t - self._targetBeep < _beepPairing:
+            self._beepOnsets.append(self._targetBeep - t)
+            self._targetBeep = None
+        else:
+            self._targetDrawn = t
+        if self._onsetTimer is not None:
+            self._sendOnsetMessages()
+        with self._commit: # target elements moved and shown on the same frame
+            if self._onsetTimer is not None:
+                self._commit.call(self._onsetTimer.command, 'target', x, y, time.perf_counter())
+            self._commit.call(self._stimuli.unpark, self)
+            # converts to shady default coords
+            self.target.draw(pos=_trackerToShady(self.win, x, y))
 
 
     def get_input_key(self):
         ''' handle key input and send it over to the tracker'''
         # if self.win._World__event_handlers[0].__name__ != _handleEvents:
         #     self.win.SetEventHandler(_handleEvents, slot=0)
-        if len(self.win.keys) > 0:
-            k = self.win.keys
-            self.win.keys = []
-            return k
-        else:
-            return None
+        keys = self.win.input_queue.pop_keys()
+        if self._onsetTimer is not None:
+            self._sendOnsetMessages()
+        return keys if keys else None
+
+
+    def getInputLatency(self):
+        """ Time (s) keys waited between capture by Shady and get_input_key, over the last 1000 keys
+        returns count, mean, median and max (None when no key yet)
+        """
+        latencies = np.array(self.win.input_queue.latencies)
+        if not latencies.size:
+            return dict(count=0, mean=None, median=None, max=None)
+        return dict(count=latencies.size, mean=float(latencies.mean()), median=float(np.median(latencies)), max=float(latencies.max()))
 
 
     def play_beep(self, beepid):
         if self.verbose: print("play_beep")
         '''play warning beeps if being requested'''
-        # sound playback should work on all platforms
+        # sounds are preloaded by setCalibrationSounds, see BeepBank
         if beepid in [pylink.DC_TARG_BEEP, pylink.CAL_TARG_BEEP]:
-            if self._target_beep is not None:
-                self._target_beep.Play(verbose=False)
+            t = self._beeps.play('target')
+            if t is not None:
+                if self._targetDrawn is not None and t - self._targetDrawn < _beepPairing:
+                    self._beepOnsets.append(t - self._targetDrawn)
+                    self._targetDrawn = None
+                else:
+                    self._targetBeep = t
         if beepid in [pylink.CAL_ERR_BEEP, pylink.DC_ERR_BEEP]:
-            if self._error_beep is not None:
-                self._error_beep.Play(verbose=False)
+            self._beeps.play('error')
         if beepid in [pylink.CAL_GOOD_BEEP, pylink.DC_GOOD_BEEP]:
-            if self._done_beep is not None:
-                self._done_beep.Play(verbose=False)
+            self._beeps.play('done')
 
 
     def image_title(self, text):
         if self.verbose: print("image_title")
-        if self.eye_image_title is None:
-            self.eye_image_title = self.win.Stimulus(text=text, text_align='left', 
-                                                      text_fill=0, text_size=18,
-                                                      y=-self.win.size[1]/4, visible=True, z=_getTextLayer(self.win))
-        else:
-            self.eye_image_title.text = text
-            self.eye_image_title.visible = True
+        with self._commit:
+            self._commit.call(self._stimuli.unpark, self)
+            if self.eye_image_title is None:
+                _importText()
+                self.eye_image_title = self._stimuli.acquire(self, 'eye_image_title', text=text, text_align='left',
+                                                             text_fill=0, text_size=18,
+                                                             y=-self.win.size[1]/4, visible=False, z=_getTextLayer(self.win))
+            self._commit.set(self.eye_image_title, text=text, visible=True)
 
 
     def setup_image_display(self, width, height):
@@ -605,8 +1928,9 @@ class CalibrationGraphics(pylink.EyeLinkCustomDisplay):
 
         return 1 to request high-resolution camera image'''
         self._size = [width, height]
-        self.clear_cal_display()
-        self._rgb_index_array = np.zeros((int(height/2), int(width/2)), dtype=np.uint8)
+        with self._commit:
+            self._commit.call(self._stimuli.unpark, self)
+            self.clear_cal_display()
 
         return 1
 
@@ -617,37 +1941,159 @@ class CalibrationGraphics(pylink.EyeLinkCustomDisplay):
         Saves all rgb values on that palette. Then for each eye image frame, 
         the eyelnk just sends the palette index for each pixel.
         '''
-        sz = len(r)
-        self._rgb_palette = np.zeros((sz, 3), dtype=np.uint8)
-        i=0
-        while i < sz:
-            self._rgb_palette[i, :] = [int(r[i]), int(g[i]), int(b[i])]
-            i = i + 1
+        self._palette.set_palette(r, g, b)
+        self._rgb_palette = self._palette.lut[:self._palette.size, :3].copy()
+        if self._recorder is not None:
+            self._recorder.set_palette(self._rgb_palette)
 
 
     def draw_image_line(self, width, line, totlines, buff):
-        if self._rgb_index_array.shape[1] != width: # because different size of the 2 camera views
-            self._rgb_index_array = np.zeros((totlines, width), dtype=np.uint8)
-        for i in range(width):
-            try: self._rgb_index_array[line-1, i] = buff[i]
-            except Exception:
-               print('Failed to draw pixel to image line %d %d'%(line-1, i))
-        if line == totlines:
+        # one frame buffer per camera view (the 2 views have different sizes)
+        if self._imageBuffer.ingest(width, line, totlines, buff):
+            self._rgb_index_array = self._imageBuffer.frame
+            self._imageStats['received'] += 1
+            if self._governor is not None and not self._governor.admit(time.perf_counter()):
+                self._imageStats['skipped'] += 1 # ingested, neither converted nor shown
+                if self._recorder is not None:
+                    self._recorder.append_frame(self._rgb_index_array, time.perf_counter())
+                return
             #if self.verbose: print("draw_image_line", width, totlines)
-            try:
-                image = Image.fromarray(self._rgb_index_array,
-                                           mode='P')
-                image.putpalette(self._rgb_palette)
-                image = ImageOps.fit(image, self.eye_image_size) #MD
-                image_array = np.array(image.convert('RGB'))
-
+            if self._imageExchange is None:
+                self._showEyeImage(self._rgb_index_array, self._imageGeneration)
+            else: # cross hair data must still come from the pylink thread
+                self._collectCrossHair()
+                self._imageExchange.publish(self._rgb_index_array, (self._imageGeneration,))
+                if self._imageWorker is None:
+                    self._startImageWorker()
+            if self._recorder is not None: # cross hair of this frame collected by now
+                self._recorder.append_frame(self._rgb_index_array, time.perf_counter(), self._crossHair.raw_lines())
+
+
+    def _showEyeImage(self, index_frame, generation):
+        ''' converts and uploads one complete frame, then the cross hair'''
+        t0 = time.perf_counter()
+        try:
+            image_array = self._convertEyeImage(index_frame)
+            self._imageStats['converted'] += 1
+            with self._commit, self._imageLock: # texture now, stim changes with the next frame
+                if generation != self._imageGeneration: # cleared in the meantime
+                    return
                 if self.eye_image is None:
-                    self.eye_image = self.win.Stimulus(size=self.eye_image_size, anchor=Shady.LOCATION.CENTER, position=[0., 0.], visible=False, z=_getEyeImageLayer(self.win))
-                self.eye_image.LoadTexture(image_array)
-                self.eye_image.visible = True
-                self._meta_draw_cross_hair()
+                    self.eye_image = self._stimuli.acquire(self, 'eye_image', size=self.eye_image_size, anchor=Shady.LOCATION.CENTER, position=[0., 0.],
+                                                           carrierTranslation=[0., 0.], scaling=[1., 1.], visible=False, z=_getEyeImageLayer(self.win))
+                self._layoutEyeImage(image_array.shape)
+                self._loadEyeImage(image_array)
+                self._commit.set(self.eye_image, visible=True)
+                self._imageStats['displayed'] += 1
+                self._meta_draw_cross_hair(collect=self._imageExchange is None)
+            if self._governor is not None:
+                self._governor.finished(time.perf_counter() - t0)
+
+        except Exception: # a frame lost, not the session (this may run on the worker thread)
+            self._imageStats['errors'] += 1
+            if self.verbose and self._imageStats['errors'] == 1:
+                traceback.print_exc()
+
+
+    def _loadEyeImage(self, image_array):
+        self._stimuli.load_texture(self.eye_image, image_array)
+
+
+    def _layoutEyeImage(self, shape):
+        ''' with the 'shader' backend the stim shows the index frame through the palette as a
+        lookup table, cropped by its envelope and scaled to eye_image_size like ImageOps.fit();
+        otherwise the texture already is the final image. Only changes are written.'''
+        shader = self.eye_image_backend == 'shader'
+        layout = (shader, tuple(shape[:2]) if shader else None, self._palette.version if shader else None)
+        if layout == self._eyeImageLayout:
+            return
+        previous, self._eyeImageLayout = self._eyeImageLayout, layout
+        dw, dh = self.eye_image_size
+        if not shader:
+            if previous is None or not previous[0]: # as created
+                return
+            self._commit.call(self._stimuli.set_lut, self.eye_image, None)
+            self._commit.set(self.eye_image, size=self.eye_image_size, carrierTranslation=[0., 0.], scaling=[1., 1.])
+            return
+        if previous is None or previous[2] != layout[2]:
+            self._commit.call(self._stimuli.set_lut, self.eye_image, self._palette.get_rgb_table())
+        if previous is None or previous[1] != layout[1]:
+            left, top, crop_w, crop_h = _fitCrop(shape[1], shape[0], dw, dh)
+            self._commit.set(self.eye_image, size=[crop_w, crop_h], carrierTranslation=[-left, -top],
+                             scaling=[dw/float(crop_w), dh/float(crop_h)])
+
+
+    def _startImageWorker(self):
+        self._imageWorker = threading.Thread(target=self._imageWorkerLoop, name='EyeImageWorker')
+        self._imageWorker.daemon = True
+        self._imageWorker.start()
+
+
+    def _stopImageWorker(self):
+        worker, self._imageWorker = self._imageWorker, None
+        if worker is not None:
+            self._imageExchange.wake()
+            worker.join()
+
+
+    def _imageWorkerLoop(self):
+        me = threading.current_thread()
+        while self._imageWorker is me:
+            frame, info = self._imageExchange.take(timeout=0.5)
+            if frame is not None:
+                self._showEyeImage(frame, *info)
+
+
+    def getEyeImageStats(self):
+        """ Counts of eye image frames: received, skipped (setEyeImageRate), converted, displayed,
+        dropped (threaded worker behind) and errors (first traceback printed when verbose)
+        """
+        stats = dict(self._imageStats)
+        stats['dropped'] = 0 if self._imageExchange is None else self._imageExchange.dropped
+        return stats
 
-            except: pass
+
+    def setEyeImageRate(self, max_rate=None, max_load=None, wait_for_display=True):
+        """ Limits the eye images converted and shown (see ImageRateGovernor)
+        Parameters:
+            max_rate: images per second at most (None: no limit)
+            max_load: fraction of a CPU at most (None: no limit)
+            wait_for_display: skip frames until the last one shown was rendered (0.1 s at most)
+        setEyeImageRate(None, None, False) shows every frame (default)
+        """
+        if max_rate is None and max_load is None and not wait_for_display:
+            self._governor = None
+        else:
+            self._governor = ImageRateGovernor(max_rate, max_load, self._commit, wait_for_display)
+
+
+    def getEyeImageRate(self):
+        """ Offered (complete frames received) and shown eye images: counts, skipped_rate,
+        skipped_load and skipped_display (see ImageRateGovernor) and rates (/s) over the last 2 s, mean finalize cost (s) and load
+        (fraction of a CPU), {} when setEyeImageRate() was not called
+        """
+        return {} if self._governor is None else self._governor.stats()
+
+
+    def _convertEyeImage(self, index_frame):
+        ''' palette index frame -> RGB(A) image cropped and resized to eye_image_size
+        the returned array is reused 2 frames of the same size later
+        with the 'shader' backend a copy of the index frame is returned, the palette and resizing
+        are applied when rendering (see _layoutEyeImage)
+        '''
+        if self.eye_image_backend == 'shader': # index_frame is overwritten by the next frame
+            out = self._resampler.get_output(index_frame.shape, index_frame.dtype)
+            np.copyto(out, index_frame)
+            return out
+        if self.eye_image_backend == 'pil':
+            Image, ImageOps = _importPIL()
+            image = Image.fromarray(index_frame, mode='P')
+            image.putpalette(self._rgb_palette)
+            image = ImageOps.fit(image, self.eye_image_size) #MD
+            return np.array(image.convert('RGB'))
+
+        rgba = self._palette.apply(index_frame) # at camera resolution, then resized
+        return self._resampler.resample(rgba, self.eye_image_size, mode=self.eye_image_resampling)
 
 
     def exit_image_display(self):
@@ -656,27 +2102,22 @@ class CalibrationGraphics(pylink.EyeLinkCustomDisplay):
 
 
     def get_mouse_state(self):
-        if self.verbose: print("get_mouse_state", self.win.mouse_x, self.win.mouse_y, self.win.mouse_anypress)
+        mouse_x, mouse_y, t = self.win.input_queue.mouse
+        mouse_anypress = self.win.input_queue.mouse_pressed
+        if self.verbose: print("get_mouse_state", mouse_x, mouse_y, mouse_anypress)
         ''' get mouse position and any mouse button press and rescales to image
         apparently will call draw_line of coords > 0
         '''
-        x = self.win.mouse_x + self.win.size[0]/2 # eyelink coords
-        y = - self.win.mouse_y + self.win.size[1]/2
+        x, y = _shadyToTracker(self.win, mouse_x, mouse_y) # eyelink coords
         x = x * self.eye_image_size[0]/self.win.size[0]/2 # cam image / eyelink coords
         y = y * self.eye_image_size[1]/self.win.size[1]/2
-        return ((x, y), self.win.mouse_anypress)
+        return ((x, y), mouse_anypress)
 
 
     def draw_line(self, x1, y1, x2, y2, colorindex):
         if self.verbose: print("draw line", x1, x2, y1, y2, colorindex)
-        if self.eye_image_size[0] > 192:
-            x1 = int((float(x1) / 192) * self.eye_image_size[0])
-            x2 = int((float(x2) / 192) * self.eye_image_size[0])
-            y1 = self.eye_image_size[1] - int((float(y1) / 160) * self.eye_image_size[1])
-            y2 = self.eye_image_size[1] - int((float(y2) / 160) * self.eye_image_size[1])
-        if True not in [x < 0 for x in [x1, x2, y1, y2]]:
-            self.cross_hair_lines[colorindex].append([x1, y1])
-            self.cross_hair_lines[colorindex].append([x2, y2])
+        ''' stored as is, scaled to the eye image with the other lines of the frame (CrossHairOverlay.finish)'''
+        self._crossHair.add_line(colorindex, x1, y1, x2, y2)
 
 
     def draw_lozenge(self, x, y, width, height, colorindex):
@@ -686,16 +2127,7 @@ class CalibrationGraphics(pylink.EyeLinkCustomDisplay):
         cf. draw_lozenge() of SR research pygame/psychopy example for exact implementation
         '''
         if self.verbose: print("draw_lozenge", x, y, width, height)
-        if self.eye_image_size[0] > 192:
-            x = int((float(x) / 192) * self.eye_image_size[0])
-            y = self.eye_image_size[1] - int((float(y) / 160) * self.eye_image_size[1])
-            width = int((float(width) / 192) * self.eye_image_size[0])
-            height = int((float(height) / 160) * self.eye_image_size[1])
-        radius = np.mean((width, height))/2.
-        nSides, lw = 30, 2
-
-        center_pos = [x+radius, y-radius]
-        self.cross_hair_lines[-5] = radius*Shady.ComplexPolygonBase(nSides, joined=True) + [center_pos[0]+1j*center_pos[1]]
+        self._crossHair.set_lozenge(x, y, width, height)
 
 
     def alert_printf(self, msg):
@@ -748,16 +2180,27 @@ def demo(test_secs):
     # calibrates the tracker
     el_tracker.doTrackerSetup() 
 
-    # starts recording for test_dur
-    el_tracker.startRecording(1, 1, 1, 1)
-    t0 = time.time()
-    while time.time()-t0<test_secs:
-        pass
-    el_tracker.stopRecording()
+    # records for test_secs, link data read on a background thread while this one sleeps
+    import RecordingSession
+    with RecordingSession.RecordingSession(el_tracker) as session:
+        session.wait(test_secs)
+    print('%d samples, %d events read'%(len(session.samples), len(session.events)))
 
-    # close the data file and transfers it from the eyelink Host PC
+    # close the data file and transfers it from the eyelink Host PC on a background thread,
+    # the window showing an end screen with the progress meanwhile
     el_tracker.closeDataFile()
-    el_tracker.receiveDataFile('test.edf', os.path.join(os.getcwd(), 'test.edf'))
+    import EdfTransfer
+    _importText()
+    end_screen = win.Stimulus(text='Thank you!', text_size=24, z=_getTextLayer(win))
+    commit = _getFrameCommit(win)
+
+    def progress(p):
+        with commit: # applied by the render thread with the next frame
+            commit.set(end_screen, text='Thank you!\n\n' + transfer.describe())
+    transfer = EdfTransfer.EdfTransfer(el_tracker, 'test.edf', os.path.join(os.getcwd(), 'test.edf'), progress=progress)
+    transfer.start()
+    print('%d bytes received'%transfer.wait())
+    end_screen.Leave()
 
     # disconnect from the tracker
     el_tracker.close()
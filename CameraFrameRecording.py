@@ -0,0 +1,165 @@
+
+# Ring file of the camera frames shown during camera setup, for offline review
+#
+# CalibrationGraphics.enableFrameRecording() copies each index frame, palette and cross
+# hair to a preallocated memory mapped file, the oldest frames overwritten. Reading (numpy only):
+#
+#     import CameraFrameRecording
+#     reader = CameraFrameRecording.CameraFrameReader('setup.cgsrec')
+#     for t, frame, palette, lines in reader:
+#         rgb = palette[frame] # frame is a view on the file
+#
+# Layout (little endian), all sections allocated when the file is created:
+#   header    header_dtype
+#   index     slots x index_dtype: time, sequence number, width, height, palette, number of lines
+#   palettes  max_palettes x 256 x 3 uint8 (ring, palette n in n % max_palettes)
+#   lines     slots x max_lines x 5 float32: color index, x1, y1, x2, y2 in camera image
+#             coordinates (192x160), color index -5 being the lozenge x, y, width, height
+#   frames    slots x slot_bytes uint8, the height x width index frame at the start of the slot
+
+import os
+import numpy as np
+
+magic = b'CGSREC\x00\x01'
+version = 1
+
+header_dtype = np.dtype([('magic', 'S8'), ('version', '<u4'), ('slots', '<u4'), ('slot_bytes', '<u4'),
+                         ('max_lines', '<u4'), ('max_palettes', '<u4'), ('palettes_written', '<u4'),
+                         ('frames_written', '<u8')])
+index_dtype = np.dtype([('t', '<f8'), ('seq', '<u8'), ('width', '<u2'), ('height', '<u2'),
+                        ('palette', '<i4'), ('lines', '<u2')])
+
+
+def _layout(header):
+    ''' name -> (offset, dtype, shape) of each section, from the header fields'''
+    sections, offset = {}, header_dtype.itemsize
+    for name, dtype, shape in [('index', index_dtype, (header['slots'],)),
+                               ('palettes', np.dtype(np.uint8), (header['max_palettes'], 256, 3)),
+                               ('lines', np.dtype('<f4'), (header['slots'], header['max_lines'], 5)),
+                               ('frames', np.dtype(np.uint8), (header['slots'], header['slot_bytes']))]:
+        offset = (offset + 63) // 64 * 64 # sections aligned on 64 bytes
+        sections[name] = (offset, dtype, tuple(int(n) for n in shape))
+        offset += dtype.itemsize * int(np.prod(shape))
+    return sections, offset
+
+
+def _mapSections(filename, header, mode):
+    sections, size = _layout(header)
+    return dict((name, np.memmap(filename, dtype=dtype, mode=mode, offset=offset, shape=shape))
+                for name, (offset, dtype, shape) in sections.items())
+
+
+class CameraFrameRecorder(object):
+    '''
+    Creates (overwrites) filename with room for slots frames of at most max_frame_size
+    (width, height) pixels, the full 640x480 camera image by default (276 MB for 900 slots,
+    allocated as frames are written); larger frames are not recorded but counted in skipped,
+    with a message for the first one.
+    '''
+    def __init__(self, filename, slots=900, max_frame_size=(640, 480), max_lines=64, max_palettes=64):
+        self.filename = filename
+        header = np.zeros((), dtype=header_dtype)
+        header['magic'], header['version'], header['slots'] = magic, version, slots
+        header['slot_bytes'] = int(max_frame_size[0]) * int(max_frame_size[1])
+        header['max_lines'], header['max_palettes'] = max_lines, max_palettes
+        sections, size = _layout(header)
+        with open(filename, 'wb') as f:
+            f.truncate(size)
+        self._header = np.memmap(filename, dtype=header_dtype, mode='r+', offset=0, shape=(1,))
+        self._header[0] = header
+        self._sections = _mapSections(filename, header, 'r+')
+        self.slots, self.slot_bytes, self.max_lines, self.max_palettes = slots, int(header['slot_bytes']), max_lines, max_palettes
+        self.max_frame_size = tuple(int(n) for n in max_frame_size)
+        self.frames_written = 0
+        self.palettes_written = 0
+        self.skipped = 0
+
+    def set_palette(self, rgb):
+        ''' rgb: (n <= 256, 3) colors, used by the frames appended from now on'''
+        rgb = np.asarray(rgb)
+        palette = self._sections['palettes'][self.palettes_written % self.max_palettes]
+        palette[:len(rgb)] = rgb
+        palette[len(rgb):] = 0
+        self.palettes_written += 1
+        self._header['palettes_written'][0] = self.palettes_written
+
+    def append_frame(self, frame, t, lines=None):
+        ''' frame: (height, width) uint8 index frame, t: time stamp (s),
+        lines: (n, 5) color index, x1, y1, x2, y2 (extra lines are dropped)'''
+        height, width = frame.shape
+        if height * width > self.slot_bytes:
+            if not self.skipped:
+                print('%s: %dx%d camera frames larger than max_frame_size %dx%d, not recorded'%(
+                    self.filename, width, height, self.max_frame_size[0], self.max_frame_size[1]))
+            self.skipped += 1
+            return
+        slot = self.frames_written % self.slots
+        self._sections['frames'][slot, :height*width].reshape(height, width)[...] = frame
+        n = 0
+        if lines is not None:
+            n = min(len(lines), self.max_lines)
+            self._sections['lines'][slot, :n] = lines[:n]
+        self._sections['index'][slot] = (t, self.frames_written, width, height, self.palettes_written - 1, n)
+        self.frames_written += 1
+        self._header['frames_written'][0] = self.frames_written # written last, the frame is complete
+
+    def flush(self):
+        self._header.flush()
+        for section in self._sections.values():
+            section.flush()
+
+    def close(self):
+        self.flush()
+        self._header = self._sections = None
+
+
+class CameraFrameReader(object):
+    '''
+    Frames of a recording, oldest first, as views on the memory mapped file (nothing is
+    loaded until used). Iterating yields (t, frame, palette, lines); frame(i), palette(i),
+    lines(i) and image(i) (frame through its palette, (height, width, 3)) give frame i.
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        header = np.memmap(filename, dtype=header_dtype, mode='r', offset=0, shape=(1,))[0]
+        if header['magic'] != magic:
+            raise ValueError('%s is not a camera frame recording'%filename)
+        if header['version'] > version:
+            raise ValueError('%s: recording version %d not supported'%(filename, header['version']))
+        self.header = dict((name, header[name].item()) for name in header_dtype.names)
+        self._sections = _mapSections(filename, header, 'r')
+        written, slots = self.header['frames_written'], self.header['slots']
+        self._slots = np.arange(max(0, written - slots), written) % slots # oldest first
+        self.index = self._sections['index'][self._slots]
+        self.times = self.index['t']
+
+    def __len__(self):
+        return len(self._slots)
+
+    def frame(self, i):
+        slot, entry = self._slots[i], self.index[i]
+        height, width = int(entry['height']), int(entry['width'])
+        return self._sections['frames'][slot, :height*width].reshape(height, width)
+
+    def palette(self, i):
+        ''' (256, 3) uint8 colors of frame i, None if no palette was set (or it was overwritten)'''
+        palette = int(self.index[i]['palette'])
+        if palette < 0 or palette < self.header['palettes_written'] - self.header['max_palettes']:
+            return None
+        return self._sections['palettes'][palette % self.header['max_palettes']]
+
+    def lines(self, i):
+        return self._sections['lines'][self._slots[i], :int(self.index[i]['lines'])]
+
+    def image(self, i):
+        palette = self.palette(i)
+        if palette is None:
+            return np.repeat(self.frame(i)[:, :, None], 3, axis=2)
+        return palette[self.frame(i)]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.times[i], self.frame(i), self.palette(i), self.lines(i)
+
+    def __repr__(self):
+        return 'CameraFrameReader(%r, %d frames)'%(os.path.basename(self.filename), len(self))
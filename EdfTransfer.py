@@ -0,0 +1,139 @@
+
+# Data file transfer on a background thread
+#
+# receiveDataFile() runs on a worker thread into a temporary file renamed once complete,
+# the bytes received reported as it grows, while the experiment draws an end screen. Usage:
+#
+#     import EdfTransfer
+#     el_tracker.closeDataFile()
+#     transfer = EdfTransfer.EdfTransfer(el_tracker, 'test.edf', 'data/test.edf', progress=show).start()
+#     ... # end screen, the tracker must not be used until wait() returns
+#     size = transfer.wait()
+
+import collections
+import itertools
+import os
+import threading
+import time
+
+TransferProgress = collections.namedtuple('TransferProgress', 'bytes total secs rate done')
+TransferProgress.__doc__ = '''bytes received so far, total: expected size (None if unknown),
+secs since the start, rate: bytes per second over the whole transfer, done: file renamed (or failed)'''
+
+
+_tempNumbers = itertools.count()
+
+
+class EdfTransfer(object):
+    '''
+    Parameters:
+        tracker: pylink EyeLink, only used from the worker thread during the transfer
+        src: data file name on the Host PC (the name given to openDataFile)
+        dest: local path, written only once the transfer is complete
+        progress: called with a TransferProgress every interval seconds and at the end,
+                  from the transfer thread (use a FrameCommit to change stimuli)
+        interval: seconds between two progress reports
+        expected_size: bytes, when known, for the percentage
+    '''
+    def __init__(self, tracker, src, dest, progress=None, interval=0.1, expected_size=None):
+        self.tracker = tracker
+        self.src = src
+        self.dest = os.path.abspath(dest)
+        self.progress_callback = progress
+        self.interval = interval
+        self.expected_size = expected_size
+        self.size = None # receiveDataFile() result
+        self.error = None
+        self._temp = None
+        self._t0 = None
+        self._end = None
+        self._done = threading.Event()
+        self._threads = []
+
+    def start(self):
+        directory, name = os.path.split(self.dest)
+        while True: # next to dest, same file system: atomic rename
+            self._temp = os.path.join(directory, '.%s.%d.%d.part'%(name, os.getpid(), next(_tempNumbers)))
+            try: # mode 0666 minus the umask, as the file receiveDataFile would create
+                os.close(os.open(self._temp, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666))
+                break
+            except FileExistsError:
+                pass
+        self._t0 = time.perf_counter()
+        self._threads = [threading.Thread(target=self._receive, name='EdfTransfer'),
+                         threading.Thread(target=self._report, name='EdfTransfer.progress')]
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.wait()
+
+    def _receive(self):
+        try:
+            size = self.tracker.receiveDataFile(self.src, self._temp)
+            if size is None or size <= 0: # 0: cancelled, < 0: error
+                raise RuntimeError('receiveDataFile failed (%r)'%size)
+            os.replace(self._temp, self.dest)
+            self.size = size
+        except Exception as error:
+            self.error = error
+            if os.path.exists(self._temp):
+                os.remove(self._temp)
+        finally:
+            self._end = time.perf_counter()
+            self._done.set()
+
+    def _report(self):
+        while not self._done.wait(self.interval):
+            self._notify()
+        self._notify()
+
+    def _notify(self):
+        if self.progress_callback is not None:
+            self.progress_callback(self.progress())
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def progress(self):
+        ''' TransferProgress now'''
+        if self._t0 is None:
+            return TransferProgress(0, self.expected_size, 0., 0., False)
+        done = self._done.is_set()
+        if done:
+            received, secs = self.size or 0, self._end - self._t0
+        else:
+            try:
+                received = os.path.getsize(self._temp)
+            except OSError: # renamed in the meantime
+                received = self.size or 0
+            secs = time.perf_counter() - self._t0
+        total = self.size if self.size is not None else self.expected_size
+        return TransferProgress(received, total, secs, received/secs if secs > 0 else 0., done)
+
+    def describe(self):
+        ''' one line for an end screen, e.g. "test.edf: 12.5 MB (4.1 MB/s)"'''
+        p = self.progress()
+        if self.error is not None:
+            return '%s: transfer failed'%self.src
+        text = '%s: %.1f MB'%(self.src, p.bytes/1e6)
+        if p.total:
+            text += ' of %.1f MB'%(p.total/1e6)
+        return text + (' received' if p.done else ' (%.1f MB/s)'%(p.rate/1e6))
+
+    def wait(self, timeout=None):
+        ''' waits for the end of the transfer (time.sleep, no busy loop), returns the size
+        received, None if still running after timeout. Raises the error of a failed transfer'''
+        if not self._done.wait(timeout):
+            return None
+        for thread in self._threads:
+            thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.size
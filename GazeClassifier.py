@@ -0,0 +1,153 @@
+
+# Online fixation / saccade classification of the live gaze samples
+#
+# Velocity threshold (I-VT) with a dispersion limit, updated with the new samples only,
+# e.g. each frame on the buffer a RecordingSession fills:
+#
+#     import GazeClassifier
+#     classifier = GazeClassifier.GazeClassifier(sample_rate=1000, pixels_per_degree=40)
+#     def frame(t):
+#         for event in classifier.follow(session.samples):
+#             print(event.kind, event.time, event.x, event.y)
+#         stim.visible = classifier.fixating
+#     world.SetAnimationCallback(frame)
+
+import collections
+import numpy as np
+
+GazeEvent = collections.namedtuple('GazeEvent', 'kind time detected x y')
+GazeEvent.__doc__ = '''kind: 'fixation_start', 'fixation_end', 'saccade_start' or 'saccade_end'
+time: sample time of the start / end (ms), detected: time of the sample that revealed it
+x, y: mean position of the fixation (so far for fixation_start), position at saccade start / end'''
+
+FIXATION, SACCADE, MISSING = 1, 0, -1
+
+
+class GazeClassifier(object):
+    '''
+    Parameters:
+        sample_rate: samples per second
+        pixels_per_degree: gaze coordinates per degree of visual angle
+        velocity_threshold: deg/s, above is a saccade
+        window: ms, velocity from the displacement over that interval
+        min_fixation: ms below threshold before a fixation is reported
+        max_dispersion: deg, (max - min) of x plus of y, beyond it a new fixation starts
+        eye: eye column value to keep in follow() (None: every row)
+    '''
+    def __init__(self, sample_rate=1000., pixels_per_degree=40., velocity_threshold=30., window=5.,
+                 min_fixation=50., max_dispersion=1.5, eye=None, max_events=10000):
+        self.sample_rate = float(sample_rate)
+        self.pixels_per_degree = float(pixels_per_degree)
+        self.velocity_threshold = float(velocity_threshold)
+        self.window = max(1, int(round(window*self.sample_rate/1000.))) # samples
+        self.min_fixation = float(min_fixation)
+        self.max_dispersion = float(max_dispersion)
+        self.eye = eye
+        self.events = collections.deque(maxlen=max_events) # all events, latest last
+        self.samples = 0
+        self._history = (np.zeros(0), np.zeros(0), np.zeros(0)) # last window samples (t, x, y)
+        self._read = 0 # rows of the followed buffer already processed
+        self._label = None
+        self._start = None # time of the first sample of the current run
+        self._lastT = None
+        self._lastXY = (np.nan, np.nan)
+        self._confirmed = False
+        self._stats = None # n, sum x, sum y, min x, max x, min y, max y of the current fixation
+
+    @property
+    def fixating(self):
+        return self._label == FIXATION and self._confirmed
+
+    @property
+    def fixation(self):
+        ''' (start time, mean x, mean y) of the current fixation, None when not fixating'''
+        if not self.fixating:
+            return None
+        n, sx, sy = self._stats[:3]
+        return self._start, sx/n, sy/n
+
+    def follow(self, buffer):
+        ''' processes the rows appended to a RecordingSession.ColumnBuffer since the last call,
+        returns the new events'''
+        if len(buffer) < self._read: # cleared
+            self._read = 0
+        columns = buffer.snapshot()
+        t, x, y = columns['time'][self._read:], columns['gaze_x'][self._read:], columns['gaze_y'][self._read:]
+        self._read += len(t)
+        if self.eye is not None:
+            keep = columns['eye'][self._read - len(t):self._read] == self.eye
+            t, x, y = t[keep], x[keep], y[keep]
+        return self.update(t, x, y)
+
+    def update(self, t, x, y):
+        ''' t (ms), x, y of the new samples, returns the new events'''
+        t, x, y = np.asarray(t, dtype=float), np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+        if not len(t):
+            return []
+        self.samples += len(t)
+        ht, hx, hy = self._history
+        at, ax, ay = np.concatenate([ht, t]), np.concatenate([hx, x]), np.concatenate([hy, y])
+        w = self.window
+        velocity = np.full(len(t), np.nan)
+        first = max(0, w - len(ht)) # new samples with window samples before them
+        if len(at) > w:
+            dt = (at[w:] - at[:-w])/1000.
+            distance = np.hypot(ax[w:] - ax[:-w], ay[w:] - ay[:-w])/self.pixels_per_degree
+            with np.errstate(invalid='ignore', divide='ignore'):
+                velocity[first:] = (distance/dt)[len(at) - w - (len(t) - first):]
+        self._history = (at[-w:], ax[-w:], ay[-w:])
+        labels = np.where(np.isnan(velocity), MISSING, np.where(velocity > self.velocity_threshold, SACCADE, FIXATION))
+        labels[np.isnan(x) | np.isnan(y)] = MISSING
+        new = []
+        bounds = np.concatenate([[0], np.flatnonzero(np.diff(labels)) + 1, [len(labels)]])
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            self._run(new, int(labels[a]), t[a:b], x[a:b], y[a:b])
+        self.events.extend(new)
+        return new
+
+    def _emit(self, new, kind, time, detected, x, y):
+        new.append(GazeEvent(kind, time, detected, x, y))
+
+    def _run(self, new, label, t, x, y):
+        if label != self._label:
+            self._close(new, t[0])
+            self._open(new, label, t[0], x[0], y[0])
+        if label == FIXATION:
+            self._extendFixation(new, t, x, y)
+        else:
+            self._lastT, self._lastXY = t[-1], (x[-1], y[-1])
+
+    def _open(self, new, label, t0, x0, y0):
+        self._label, self._start, self._confirmed, self._stats = label, t0, False, None
+        if label == SACCADE:
+            self._emit(new, 'saccade_start', t0, t0, x0, y0)
+
+    def _close(self, new, detected):
+        if self._label == FIXATION and self._confirmed:
+            n, sx, sy = self._stats[:3]
+            self._emit(new, 'fixation_end', self._lastT, detected, sx/n, sy/n)
+        elif self._label == SACCADE:
+            self._emit(new, 'saccade_end', self._lastT, detected, *self._lastXY)
+
+    def _extendFixation(self, new, t, x, y):
+        while len(t):
+            if self._stats is None:
+                self._stats = [0, 0., 0., x[0], x[0], y[0], y[0]]
+            n, sx, sy, minx, maxx, miny, maxy = self._stats
+            minx, maxx = np.minimum(np.minimum.accumulate(x), minx), np.maximum(np.maximum.accumulate(x), maxx)
+            miny, maxy = np.minimum(np.minimum.accumulate(y), miny), np.maximum(np.maximum.accumulate(y), maxy)
+            dispersion = (maxx - minx + maxy - miny)/self.pixels_per_degree
+            over = np.flatnonzero(dispersion > self.max_dispersion)
+            k = over[0] if over.size else len(t) # samples [0, k) belong to this fixation
+            if k:
+                self._stats = [n + k, sx + x[:k].sum(), sy + y[:k].sum(), minx[k-1], maxx[k-1], miny[k-1], maxy[k-1]]
+                if not self._confirmed and t[k-1] - self._start >= self.min_fixation:
+                    j = int(np.searchsorted(t[:k], self._start + self.min_fixation))
+                    self._confirmed = True
+                    self._emit(new, 'fixation_start', self._start, t[j], (sx + x[:j+1].sum())/(n + j + 1), (sy + y[:j+1].sum())/(n + j + 1))
+                self._lastT, self._lastXY = t[k-1], (x[k-1], y[k-1])
+            if k == len(t):
+                return
+            self._close(new, t[k]) # drifted too far, new fixation from sample k
+            self._open(new, FIXATION, t[k], x[k], y[k])
+            t, x, y = t[k:], x[k:], y[k:]
@@ -0,0 +1,325 @@
+
+# Headless stand-in for the parts of Shady used by CalibrationGraphicsShady
+#
+# World and Stimulus that draw nothing but count, per frame, what would reach the GPU. Usage:
+#
+#     import HeadlessShady
+#     HeadlessShady.install() # before importing CalibrationGraphicsShady
+#     import CalibrationGraphicsShady as cgs
+#     win = HeadlessShady.World(size=(1920, 1080), threaded=True)
+#     ...
+#     print(win.Totals())
+
+import importlib.machinery
+import threading
+import time
+import types
+import sys
+import numpy as np
+
+
+class LOCATION(object):
+    NORTHWEST, NORTH, NORTHEAST = 'NORTHWEST', 'NORTH', 'NORTHEAST'
+    WEST, CENTER, EAST = 'WEST', 'CENTER', 'EAST'
+    SOUTHWEST, SOUTH, SOUTHEAST = 'SOUTHWEST', 'SOUTH', 'SOUTHEAST'
+
+
+class DRAWMODE(object):
+    POINTS, LINES, LINE_STRIP, LINE_LOOP = 'POINTS', 'LINES', 'LINE_STRIP', 'LINE_LOOP'
+    POLYGON, QUADS, TRIANGLES, TRIANGLE_FAN, TRIANGLE_STRIP = 'POLYGON', 'QUADS', 'TRIANGLES', 'TRIANGLE_FAN', 'TRIANGLE_STRIP'
+
+
+def ComplexPolygonBase(nSides, joined=False):
+    ''' unit polygon as complex numbers, closed and followed by a NaN (strip break) if joined'''
+    z = np.exp(2j*np.pi*np.arange(nSides + 1)/nSides)
+    if joined:
+        return np.append(z, np.nan)
+    return z[:-1]
+
+
+def vertexCount(points):
+    ''' number of vertices in a Shady points value (complex, n x 2 or flat x, y)'''
+    if points is None:
+        return 0
+    points = np.asarray(points)
+    if np.iscomplexobj(points):
+        return points.size
+    return points.size // 2
+
+
+class FrameRecord(object):
+    '''
+    What happened between two rendered frames: stimuli created, left and entered again,
+    property writes (per property name), vertices written through points, texture bytes
+    uploaded, and once rendered, the number of stimuli walked (in the World, visible or
+    not) and the number of stimuli and vertices drawn.
+    '''
+    def __init__(self, index):
+        self.index = index
+        self.t = None # time when rendered
+        self.created = 0
+        self.left = 0
+        self.entered = 0
+        self.writes = {}
+        self.vertices_written = 0
+        self.texture_uploads = 0
+        self.texture_bytes = 0
+        self.walked = 0
+        self.drawn = 0
+        self.drawn_vertices = 0
+
+    def as_dict(self):
+        return dict(self.__dict__, writes=dict(self.writes))
+
+    def __repr__(self):
+        return 'FrameRecord(%s)'%', '.join('%s=%r'%item for item in self.as_dict().items())
+
+
+class Stimulus(object):
+    '''
+    Holds its properties as plain attributes and reports every write to its World.
+    A callable assigned to a property is a dynamic, evaluated with the time at each frame.
+    '''
+    _internal = ('world', 'name', '_dynamics', '_callback', 'texture', 'texture_shape', 'lut')
+
+    def __init__(self, world, name=None, **properties):
+        object.__setattr__(self, 'world', world)
+        object.__setattr__(self, 'name', name)
+        object.__setattr__(self, '_dynamics', {})
+        object.__setattr__(self, '_callback', None)
+        object.__setattr__(self, 'texture_shape', None)
+        object.__setattr__(self, 'lut', None)
+        for key, value in dict(dict(visible=True, points=None, position=[0., 0.], size=None, z=0), **properties).items():
+            self._set(key, value)
+
+    def _set(self, key, value):
+        if callable(value) and key not in self._internal:
+            self._dynamics[key] = value
+            return
+        self._dynamics.pop(key, None)
+        object.__setattr__(self, key, value)
+
+    def __setattr__(self, key, value):
+        if key in self._internal:
+            object.__setattr__(self, key, value)
+            return
+        self._set(key, value)
+        self.world._recordWrite(self, key, value)
+
+    def LoadTexture(self, source):
+        ''' keeps the array itself as texture (not copied, as a deferred upload would read it)'''
+        source = np.asarray(source)
+        object.__setattr__(self, 'texture', source)
+        object.__setattr__(self, 'texture_shape', source.shape)
+        self.world._recordTexture(source.nbytes)
+
+    def SetLUT(self, lut):
+        ''' lookup table of the pixel values (None to remove), uploaded as a texture'''
+        object.__setattr__(self, 'lut', lut)
+        if lut is not None:
+            self.world._recordTexture(np.asarray(lut, dtype=np.float32).nbytes)
+
+    def SetAnimationCallback(self, callback):
+        object.__setattr__(self, '_callback', callback)
+
+    def Leave(self):
+        self.world._leave(self)
+
+    def Enter(self):
+        ''' back in the World after Leave()'''
+        self.world._enter(self)
+
+    def _animate(self, t):
+        if self._callback is not None:
+            self._callback(t)
+        for key, func in list(self._dynamics.items()):
+            object.__setattr__(self, key, func(t))
+
+
+class Event(object):
+    def __init__(self, type, key=None, x=None, y=None, modifiers='', t=None):
+        self.type = type
+        self.key = key
+        self.x, self.y = x, y
+        self.modifiers = modifiers
+        self.t = time.perf_counter() if t is None else t
+
+
+class World(object):
+    '''
+    Parameters:
+        size: (width, height) in pixels
+        frame_rate: frames per second of the render thread, None for as fast as possible
+        threaded: if True, a thread renders frames like Shady's threaded World,
+                  otherwise call RenderFrame() yourself
+    Other Shady World arguments (screen, canvas, backgroundColor, ...) are accepted and kept.
+
+    frames lists the FrameRecord of every rendered frame, Totals() sums them up.
+    '''
+    def __init__(self, size=(1920, 1080), frame_rate=60., threaded=False, **kwargs):
+        self.size = [int(size[0]), int(size[1])]
+        self.frame_rate = frame_rate
+        self.options = kwargs
+        self.stimuli = []
+        self.frames = []
+        self.keep_frames = 100000 # older records are only kept in the totals
+        self._lock = threading.RLock()
+        self._record = FrameRecord(0)
+        self._totals = FrameRecord(None)
+        self._handlers = {}
+        self._callback = None
+        self._deferred = []
+        self._t0 = time.perf_counter()
+        self._running = False
+        self._thread = None
+        if threaded:
+            self.Start()
+
+    # stimuli and accounting
+    def Stimulus(self, **properties):
+        with self._lock:
+            stim = Stimulus(self, **properties)
+            self.stimuli.append(stim)
+            self._record.created += 1
+        return stim
+
+    def _leave(self, stim):
+        with self._lock:
+            if stim in self.stimuli:
+                self.stimuli.remove(stim)
+                self._record.left += 1
+
+    def _enter(self, stim):
+        with self._lock:
+            if stim not in self.stimuli:
+                self.stimuli.append(stim)
+                self._record.entered += 1
+
+    def _recordWrite(self, stim, key, value):
+        with self._lock:
+            writes = self._record.writes
+            writes[key] = writes.get(key, 0) + 1
+            if key == 'points':
+                self._record.vertices_written += vertexCount(value)
+
+    def _recordTexture(self, nbytes):
+        with self._lock:
+            self._record.texture_uploads += 1
+            self._record.texture_bytes += nbytes
+
+    # events and callbacks
+    def SetEventHandler(self, handler, slot=0):
+        self._handlers[slot] = handler
+
+    def HandleEvent(self, type, **kwargs):
+        ''' sends a synthetic event (key_press, mouse_motion, ...) to the event handlers'''
+        event = Event(type, **kwargs)
+        for slot in sorted(self._handlers):
+            if self._handlers[slot] is not None:
+                self._handlers[slot](self, event)
+        return event
+
+    def SetAnimationCallback(self, callback):
+        self._callback = callback
+
+    def Defer(self, func, *args, **kwargs):
+        ''' runs func at the start of the next frame, on the render thread'''
+        with self._lock:
+            self._deferred.append((func, args, kwargs))
+
+    # rendering
+    def RenderFrame(self):
+        ''' one frame: deferred calls, animation callbacks and dynamics, then accounting of what is drawn'''
+        t = time.perf_counter() - self._t0
+        with self._lock:
+            deferred, self._deferred = self._deferred, []
+        for func, args, kwargs in deferred:
+            func(*args, **kwargs)
+        if self._callback is not None:
+            self._callback(t)
+        with self._lock:
+            for stim in list(self.stimuli):
+                stim._animate(t)
+            record, self._record = self._record, FrameRecord(self._record.index + 1)
+            record.t = t
+            record.walked = len(self.stimuli)
+            for stim in self.stimuli:
+                if stim.visible:
+                    record.drawn += 1
+                    record.drawn_vertices += vertexCount(stim.points) if stim.points is not None else 4
+            self.frames.append(record)
+            if len(self.frames) > self.keep_frames:
+                del self.frames[:len(self.frames) - self.keep_frames]
+            self._accumulate(record)
+        return record
+
+    def _accumulate(self, record):
+        totals = self._totals
+        for key in ('created', 'left', 'entered', 'walked', 'vertices_written', 'texture_uploads', 'texture_bytes', 'drawn', 'drawn_vertices'):
+            setattr(totals, key, getattr(totals, key) + getattr(record, key))
+        for key, n in record.writes.items():
+            totals.writes[key] = totals.writes.get(key, 0) + n
+        totals.index = record.index + 1 # number of frames
+
+    def Totals(self):
+        ''' sums over all rendered frames, index being the number of frames'''
+        with self._lock:
+            totals = FrameRecord(len(self.frames) if self._totals.index is None else self._totals.index)
+            totals.__dict__.update(self._totals.as_dict(), index=totals.index)
+            return totals
+
+    def ResetAccounting(self):
+        with self._lock:
+            self.frames = []
+            self._totals = FrameRecord(None)
+
+    def _loop(self):
+        t_next = time.perf_counter()
+        while self._running:
+            self.RenderFrame()
+            if self.frame_rate:
+                t_next += 1./self.frame_rate
+                time.sleep(max(0, t_next - time.perf_counter()))
+            else:
+                time.sleep(0)
+
+    def Start(self):
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._loop, name='HeadlessShadyRender')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def Close(self):
+        self._running = False
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+
+class _TextFinder(object):
+    ''' import hook creating an empty Shady.Text (CalibrationGraphicsShady only needs it importable)
+    when it is first imported, so that like the real one it is only in sys.modules once used'''
+    def find_spec(self, name, path=None, target=None):
+        if name != 'Shady.Text' or sys.modules.get('Shady') is not sys.modules[__name__]:
+            return None
+        return importlib.machinery.ModuleSpec(name, self)
+
+    def create_module(self, spec):
+        return types.ModuleType(spec.name)
+
+    def exec_module(self, module):
+        pass
+
+
+def install():
+    ''' makes "import Shady" and "import Shady.Text" give this module (and an empty Shady.Text),
+    returns the previous Shady if any'''
+    previous = sys.modules.get('Shady')
+    module = sys.modules[__name__]
+    module.__path__ = [] # a package, for the Shady.Text submodule
+    sys.modules['Shady'] = module
+    sys.modules.pop('Shady.Text', None)
+    if not any(isinstance(finder, _TextFinder) for finder in sys.meta_path):
+        sys.meta_path.insert(0, _TextFinder())
+    return previous
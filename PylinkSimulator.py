@@ -0,0 +1,534 @@
+
+# Offline stand-in for the parts of pylink used by CalibrationGraphicsShady
+#
+# Replays camera setup and calibration through the display callbacks, and generates
+# link samples and events while recording (see GazeModel). Usage:
+#
+#     import PylinkSimulator
+#     PylinkSimulator.install() # before importing CalibrationGraphicsShady
+#     import CalibrationGraphicsShady as cgs
+#     tracker = PylinkSimulator.EyeLink(line_rate=None) # None: max speed
+#     genv = cgs.CalibrationGraphics(tracker, win)
+#     PylinkSimulator.openGraphicsEx(genv)
+#     tracker.doTrackerSetup()
+#     print(tracker.stats)
+
+import collections
+import time
+import sys
+import numpy as np
+
+# tracker modes
+IN_UNKNOWN_MODE = 0
+IN_IDLE_MODE = 1
+IN_SETUP_MODE = 2
+IN_RECORD_MODE = 4
+IN_TARGET_MODE = 8
+IN_DRIFTCORR_MODE = 16
+IN_IMAGE_MODE = 32
+IN_USER_MENU = 64
+IN_PLAYBACK_MODE = 256
+
+# keys
+JUNK_KEY = 1
+TERMINATE_KEY = 0x7FFF
+ESC_KEY = 0x1B
+ENTER_KEY = 0x0D
+F1_KEY, F2_KEY, F3_KEY, F4_KEY, F5_KEY = 0x3B00, 0x3C00, 0x3D00, 0x3E00, 0x3F00
+F6_KEY, F7_KEY, F8_KEY, F9_KEY, F10_KEY = 0x4000, 0x4100, 0x4200, 0x4300, 0x4400
+PAGE_UP, PAGE_DOWN = 0x4900, 0x5100
+CURS_UP, CURS_DOWN, CURS_LEFT, CURS_RIGHT = 0x4800, 0x5000, 0x4B00, 0x4D00
+
+# cross hair colors
+CR_HAIR_COLOR = 1
+PUPIL_HAIR_COLOR = 2
+PUPIL_BOX_COLOR = 3
+SEARCH_LIMIT_BOX_COLOR = 4
+MOUSE_CURSOR_COLOR = 5
+
+# link data
+SAMPLE_TYPE = 200
+STARTBLINK, ENDBLINK, STARTSACC, ENDSACC, STARTFIX, ENDFIX = 3, 4, 5, 6, 7, 8
+LEFT_EYE, RIGHT_EYE, BINOCULAR = 0, 1, 2
+MISSING_DATA = -32768
+
+# beeps
+CAL_ERR_BEEP = -1
+DC_ERR_BEEP = -2
+CAL_GOOD_BEEP = 0
+CAL_TARG_BEEP = 1
+DC_GOOD_BEEP = 2
+DC_TARG_BEEP = 3
+
+_display = None # set by openGraphicsEx()
+_tracker = None
+
+
+class KeyInput(object):
+    def __init__(self, key, mod=0):
+        self.key = key
+        self.mod = mod
+        self.type = 0x1 # KEYDOWN
+
+    def __repr__(self):
+        return 'KeyInput(%r, %r)'%(self.key, self.mod)
+
+
+class EyeLinkCustomDisplay(object):
+    '''
+    Base class of the custom calibration displays. Only draw_cross_hair() does
+    something: it asks the display for the mouse state and draws pupil and CR cross
+    hairs, the pupil box and the search limits lozenge through draw_line() and
+    draw_lozenge(), in the 192x160 camera image coordinates pylink uses.
+    '''
+    def __init__(self):
+        self._simulatedCrossHair = None # set by the simulated tracker for each frame
+
+    def draw_cross_hair(self):
+        (mx, my), pressed = self.get_mouse_state()
+        if mx > 0 and my > 0:
+            self.draw_line(mx-4, my, mx+4, my, MOUSE_CURSOR_COLOR)
+            self.draw_line(mx, my-4, mx, my+4, MOUSE_CURSOR_COLOR)
+        if self._simulatedCrossHair is None:
+            return
+        px, py, cx, cy, head_view = self._simulatedCrossHair
+        for x, y, color, arm in [(px, py, PUPIL_HAIR_COLOR, 10), (cx, cy, CR_HAIR_COLOR, 5)]:
+            self.draw_line(x-arm, y, x+arm, y, color)
+            self.draw_line(x, y-arm, x, y+arm, color)
+        box = [(px-15, py-15), (px+15, py-15), (px+15, py+15), (px-15, py+15)]
+        for (x1, y1), (x2, y2) in zip(box, box[1:] + box[:1]):
+            self.draw_line(x1, y1, x2, y2, PUPIL_BOX_COLOR)
+        if head_view:
+            self.draw_lozenge(46, 30, 100, 100, MOUSE_CURSOR_COLOR)
+
+
+class SampleData(object):
+    def __init__(self, gaze, pupil):
+        self._gaze, self._pupil = gaze, pupil
+
+    def getGaze(self):
+        return self._gaze
+
+    def getPupilSize(self):
+        return self._pupil
+
+
+class Sample(object):
+    ''' link sample, time in ms of tracker time'''
+    def __init__(self, time, eye, gaze, pupil):
+        self._time, self._eye = time, eye
+        self._data = SampleData(gaze, pupil)
+
+    def getTime(self):
+        return self._time
+
+    def getType(self):
+        return SAMPLE_TYPE
+
+    def isLeftSample(self):
+        return self._eye in (LEFT_EYE, BINOCULAR)
+
+    def isRightSample(self):
+        return self._eye in (RIGHT_EYE, BINOCULAR)
+
+    def isBinocular(self):
+        return self._eye == BINOCULAR
+
+    def getLeftEye(self):
+        return self._data if self.isLeftSample() else None
+
+    def getRightEye(self):
+        return self._data if self.isRightSample() else None
+
+
+class EyeEvent(object):
+    ''' fixation / saccade event, end time and gazes only meaningful for end events'''
+    def __init__(self, type, eye, start, end, start_gaze, end_gaze, average_gaze):
+        self._type, self._eye, self._start, self._end = type, eye, start, end
+        self._startGaze, self._endGaze, self._averageGaze = start_gaze, end_gaze, average_gaze
+
+    def getType(self):
+        return self._type
+
+    def getEye(self):
+        return self._eye
+
+    def getTime(self):
+        return self._end if self._type in (ENDFIX, ENDSACC, ENDBLINK) else self._start
+
+    def getStartTime(self):
+        return self._start
+
+    def getEndTime(self):
+        return self._end
+
+    def getStartGaze(self):
+        return self._startGaze
+
+    def getEndGaze(self):
+        return self._endGaze
+
+    def getAverageGaze(self):
+        return self._averageGaze
+
+
+class GazeModel(object):
+    '''
+    Synthetic gaze, sample by sample: fixations of 200 to 400 ms at random screen positions
+    joined by saccades with a raised cosine profile (duration growing with amplitude), plus
+    gaussian noise. Also gives the fixation and saccade events at the segment boundaries.
+    '''
+    def __init__(self, screen_size=(1920, 1080), sample_rate=1000., noise=0.5, seed=0):
+        self.screen_size = screen_size
+        self.sample_rate = float(sample_rate)
+        self.noise = noise
+        self._rng = np.random.RandomState(seed)
+        self._segments = [] # (kind, first sample, last sample + 1, start point, end point)
+        self._end = 0
+        self._point = np.array(screen_size, dtype=float)/2
+
+    def _extend(self, index):
+        ms = self.sample_rate/1000.
+        while self._end <= index:
+            n = max(1, int(self._rng.uniform(200, 400)*ms))
+            self._segments.append(('fix', self._end, self._end + n, self._point, self._point))
+            self._end += n
+            target = self._rng.uniform(0.1, 0.9, 2)*self.screen_size
+            amplitude = np.hypot(*(target - self._point)) # pixels, roughly 40 per degree
+            n = max(2, int((20 + 2.2*amplitude/40.)*ms))
+            self._segments.append(('sacc', self._end, self._end + n, self._point, target))
+            self._end += n
+            self._point = target
+
+    def segments(self, first, last):
+        ''' segments overlapping samples first to last - 1'''
+        self._extend(last)
+        return [seg for seg in self._segments if seg[2] > first and seg[1] < last]
+
+    def gaze(self, first, last, noise=True):
+        ''' (n, 2) gaze of samples first to last - 1, noise=False for the true positions'''
+        gaze = np.zeros((last - first, 2))
+        for kind, s0, s1, p0, p1 in self.segments(first, last):
+            i = np.arange(max(s0, first), min(s1, last))
+            progress = (i - s0)/float(max(1, s1 - s0 - 1))
+            weight = (1 - np.cos(np.pi*progress))/2 if kind == 'sacc' else np.zeros(len(i))
+            gaze[i - first] = p0 + weight[:, None]*(p1 - p0)
+        if not noise:
+            return gaze
+        return gaze + self._rng.normal(0, self.noise, gaze.shape)
+
+
+def openGraphicsEx(display):
+    global _display
+    _display = display
+
+def closeGraphics():
+    global _display
+    _display = None
+
+def getEYELINK():
+    return _tracker
+
+
+def syntheticCameraFrames(width, height, count=30):
+    '''
+    count palette index frames (height, width) of a dark pupil with a bright corneal
+    reflection moving on a gray eye, with the matching cross hair positions scaled
+    to 192x160
+    '''
+    y, x = np.mgrid[0:height, 0:width]
+    frames, cross_hairs = [], []
+    for k in range(count):
+        phase = 2*np.pi*k/count
+        px, py = width*(0.5 + 0.15*np.cos(phase)), height*(0.5 + 0.1*np.sin(phase))
+        cx, cy = px + width*0.03, py - height*0.03
+        frame = np.full((height, width), 120, dtype=np.uint8)
+        frame[(x-px)**2 + (y-py)**2 < (0.12*height)**2] = 20
+        frame[(x-cx)**2 + (y-cy)**2 < (0.02*height)**2] = 250
+        noise = np.random.randint(0, 8, frame.shape).astype(np.uint8)
+        frames.append(frame + noise)
+        cross_hairs.append((px*192/width, py*160/height, cx*192/width, cy*160/height))
+    return frames, cross_hairs
+
+
+def grayPalette(n=256):
+    levels = [int(round(i*255/(n-1))) for i in range(n)]
+    return levels, list(levels), list(levels)
+
+
+class EyeLink(object):
+    '''
+    Simulated tracker, doTrackerSetup() and doDriftCorrect() replay a camera setup and a
+    calibration through the display passed to openGraphicsEx().
+
+    Parameters:
+        camera_size: (width, height) of the camera image sent
+        line_rate: camera lines per second, None to send as fast as possible
+        camera_frames: number of frames sent during camera setup
+        target_duration: seconds each calibration target stays up (0 when line_rate is None)
+        buffer_type: 'bytes' or 'list', how each line is given to draw_image_line
+        head_view: also draw the search limits lozenge
+        data_file_size: bytes of the synthetic EDF file receiveDataFile() writes
+        transfer_rate: bytes per second of receiveDataFile(), None for as fast as possible
+    stats: calls and time spent in each display callback during the last session
+    '''
+    def __init__(self, trackeraddress=None, camera_size=(384, 320), line_rate=None, camera_frames=60,
+                 target_duration=1.0, screen_size=(1920, 1080), buffer_type='bytes', head_view=False,
+                 sample_rate=1000., eye_used=RIGHT_EYE, gaze_model=None, data_file_size=64<<20, transfer_rate=None):
+        global _tracker
+        _tracker = self
+        self.camera_size = tuple(camera_size)
+        self.line_rate = line_rate
+        self.camera_frames = camera_frames
+        self.target_duration = target_duration
+        self.screen_size = tuple(screen_size)
+        self.buffer_type = buffer_type
+        self.head_view = head_view
+        self.calibration_targets = [(0.5, 0.5), (0.5, 0.25), (0.5, 0.75), (0.25, 0.5), (0.75, 0.5),
+                                    (0.25, 0.25), (0.75, 0.25), (0.25, 0.75), (0.75, 0.75)]
+        self.mode = IN_IDLE_MODE
+        self.commands, self.messages, self.keys = [], [], []
+        self.stats = {}
+        self._frames = None
+        self._open = True
+        self.sample_rate = float(sample_rate)
+        self.eye_used = eye_used
+        self.gaze_model = gaze_model if gaze_model is not None else GazeModel(screen_size, sample_rate)
+        self._t0 = time.perf_counter() # tracker time 0
+        self._recording = None # perf_counter at startRecording
+        self._link = collections.deque() # (type, data) not read by getNextData yet
+        self._generated = 0 # samples generated since startRecording
+        self._newest = None
+        self._current = None
+        self.data_file_size = data_file_size
+        self.transfer_rate = transfer_rate
+        self._dataFile = None # (name, still open), see receiveDataFile
+
+    def trueGaze(self, tracker_time):
+        ''' noiseless simulated gaze at tracker_time (ms) of the current recording'''
+        i = int(round((tracker_time - (self._recording - self._t0)*1000.)*self.sample_rate/1000.))
+        return self.gaze_model.gaze(i, i+1, noise=False)[0]
+
+    # bookkeeping of the host side commands
+    def getCurrentMode(self):
+        return self.mode
+
+    def sendCommand(self, command):
+        self.commands.append(command)
+        return 0
+
+    def sendMessage(self, message, offset=0):
+        self.messages.append((time.perf_counter(), offset, message))
+        return 0
+
+    def openDataFile(self, name):
+        self.commands.append('open_data_file %s'%name)
+        self._dataFile = (name, True)
+        return 0
+
+    def closeDataFile(self):
+        self.commands.append('close_data_file')
+        if self._dataFile is not None:
+            self._dataFile = (self._dataFile[0], False)
+        return 0
+
+    def receiveDataFile(self, src, dest, chunk_size=1<<20):
+        ''' writes data_file_size synthetic bytes to dest by chunks (flushed, so the file grows
+        as with a real transfer), paced at transfer_rate. Returns the size like pylink,
+        -1 when src is not the closed data file'''
+        if self._dataFile is None or self._dataFile[0] != src or self._dataFile[1]:
+            return -1
+        block = np.random.RandomState(0).randint(0, 256, chunk_size).astype(np.uint8).tobytes()
+        t0, sent = time.perf_counter(), 0
+        with open(dest, 'wb') as f:
+            while sent < self.data_file_size:
+                n = min(chunk_size, self.data_file_size - sent)
+                f.write(block[:n])
+                f.flush()
+                sent += n
+                if self.transfer_rate is not None:
+                    delay = t0 + sent/float(self.transfer_rate) - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+        return sent
+
+    def setOfflineMode(self):
+        self.mode = IN_IDLE_MODE
+
+    def isConnected(self):
+        return self._open
+
+    def close(self):
+        self._open = False
+
+    # recording: samples generated at sample_rate in real time, read through the link
+    def trackerTime(self):
+        return (time.perf_counter() - self._t0)*1000.
+
+    def startRecording(self, file_samples, file_events, link_samples, link_events):
+        self._recording = time.perf_counter()
+        self._linkSamples, self._linkEvents = link_samples, link_events
+        self._link.clear()
+        self._generated = 0
+        self._newest = None
+        self.mode = IN_RECORD_MODE
+        return 0
+
+    def stopRecording(self):
+        self._generate()
+        self._recording = None
+        self.mode = IN_IDLE_MODE
+
+    def isRecording(self):
+        return 0 if self._recording is not None else -1 # 0: TRIAL_OK, recording
+
+    def waitForBlockStart(self, maxwait, samples, events):
+        return 1
+
+    def eyeAvailable(self):
+        return self.eye_used
+
+    def _generate(self):
+        ''' samples (and events) due by now, queued on the link'''
+        if self._recording is None:
+            return
+        due = int((time.perf_counter() - self._recording)*self.sample_rate)
+        first, last = self._generated, due
+        if last <= first:
+            return
+        model, ms = self.gaze_model, 1000./self.sample_rate
+        t_first = (self._recording - self._t0)*1000.
+        def t(i):
+            return t_first + i*ms
+        gaze = model.gaze(first, last)
+        pupil = 1000 + 20*np.sin(np.arange(first, last)*ms/700.)
+        events = {}
+        for kind, s0, s1, p0, p1 in model.segments(first - 1, last): # with the one ending at first
+            start, end = (STARTFIX, ENDFIX) if kind == 'fix' else (STARTSACC, ENDSACC)
+            events.setdefault(s0, []).append(EyeEvent(start, self.eye_used, t(s0), t(s0), tuple(p0), None, None))
+            average = tuple((np.asarray(p0) + p1)/2)
+            events.setdefault(s1, []).append(EyeEvent(end, self.eye_used, t(s0), t(s1 - 1), tuple(p0), tuple(p1), average))
+        for i in range(first, last):
+            for event in events.get(i, ()):
+                if self._linkEvents:
+                    self._link.append((event.getType(), event))
+            sample = Sample(t(i), self.eye_used, tuple(gaze[i - first]), pupil[i - first])
+            if self._linkSamples:
+                self._link.append((SAMPLE_TYPE, sample))
+        self._newest = sample
+        self._generated = last
+
+    def getNextData(self):
+        self._generate()
+        if not self._link:
+            self._current = None
+            return 0
+        code, self._current = self._link.popleft()
+        return code
+
+    def getFloatData(self):
+        return self._current
+
+    def getNewestSample(self):
+        self._generate()
+        return self._newest
+
+    # session replay
+    def _call(self, name, *args):
+        t0 = time.perf_counter()
+        result = getattr(_display, name)(*args)
+        calls, total = self.stats.get(name, (0, 0.))
+        self.stats[name] = (calls + 1, total + time.perf_counter() - t0)
+        return result
+
+    def _pollKeys(self):
+        keys = self._call('get_input_key')
+        if keys:
+            self.keys.extend(keys)
+            return any(k.key in (ESC_KEY, TERMINATE_KEY) for k in keys)
+        return False
+
+    def _waitUntil(self, t):
+        if self.line_rate is not None:
+            while time.perf_counter() < t:
+                time.sleep(max(0, min(0.001, t - time.perf_counter())))
+
+    def _getFrames(self):
+        if self._frames is None or self._frames[0] != (self.camera_size, self.buffer_type):
+            frames, cross_hairs = syntheticCameraFrames(*self.camera_size)
+            if self.buffer_type == 'bytes':
+                lines = [[row.tobytes() for row in frame] for frame in frames]
+            else:
+                lines = [[row.tolist() for row in frame] for frame in frames]
+            self._frames = ((self.camera_size, self.buffer_type), lines, cross_hairs)
+        return self._frames[1], self._frames[2]
+
+    def _cameraSetup(self):
+        width, height = self.camera_size
+        lines, cross_hairs = self._getFrames()
+        self._call('image_title', 'Simulated camera image')
+        self._call('setup_image_display', width, height)
+        self._call('set_image_palette', *grayPalette())
+        self.mode = IN_IMAGE_MODE
+        t_line = 0 if self.line_rate is None else 1./self.line_rate
+        t, t0, sent = time.perf_counter(), time.perf_counter(), 0
+        for k in range(self.camera_frames):
+            frame, (px, py, cx, cy) = lines[k % len(lines)], cross_hairs[k % len(lines)]
+            _display._simulatedCrossHair = (px, py, cx, cy, self.head_view)
+            for i, buff in enumerate(frame):
+                t += t_line
+                self._waitUntil(t)
+                self._call('draw_image_line', width, i+1, height, buff)
+                sent += 1
+            if self._pollKeys():
+                break
+        elapsed = time.perf_counter() - t0
+        self.stats['lines_sent'] = sent
+        self.stats['line_rate'] = sent/elapsed if elapsed > 0 else float('inf')
+        self._call('exit_image_display')
+        self.mode = IN_SETUP_MODE
+
+    def _calibrate(self, targets, target_beep, good_beep):
+        self.mode = IN_TARGET_MODE
+        duration = 0 if self.line_rate is None else self.target_duration
+        for tx, ty in targets:
+            self._call('erase_cal_target')
+            self._call('play_beep', target_beep)
+            self._call('draw_cal_target', tx*self.screen_size[0], ty*self.screen_size[1])
+            t = time.perf_counter() + duration
+            while True:
+                if self._pollKeys():
+                    break
+                if time.perf_counter() >= t:
+                    break
+                time.sleep(0.005)
+        self._call('erase_cal_target')
+        self._call('play_beep', good_beep)
+
+    def doTrackerSetup(self, width=None, height=None):
+        if _display is None:
+            raise RuntimeError('call openGraphicsEx() first')
+        self.stats = {}
+        self.mode = IN_SETUP_MODE
+        self._call('setup_cal_display')
+        self._cameraSetup()
+        self._calibrate(self.calibration_targets, CAL_TARG_BEEP, CAL_GOOD_BEEP)
+        self.mode = IN_IDLE_MODE
+        self._call('exit_cal_display')
+
+    def doDriftCorrect(self, x, y, draw=1, allow_setup=1):
+        if _display is None:
+            raise RuntimeError('call openGraphicsEx() first')
+        self.mode = IN_DRIFTCORR_MODE
+        self._call('setup_cal_display')
+        self._calibrate([(x/float(self.screen_size[0]), y/float(self.screen_size[1]))], DC_TARG_BEEP, DC_GOOD_BEEP)
+        self.mode = IN_IDLE_MODE
+        self._call('exit_cal_display')
+        return 0
+
+
+def install():
+    ''' makes "import pylink" give this module, returns the module that was there if any'''
+    previous = sys.modules.get('pylink')
+    sys.modules['pylink'] = sys.modules[__name__]
+    return previous
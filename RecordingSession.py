@@ -0,0 +1,203 @@
+
+# Recording with the link data read on a background thread
+#
+# The link samples and events are drained on a paced thread into numpy columns, instead
+# of a busy loop starving Shady's render thread. Usage:
+#
+#     import RecordingSession
+#     with RecordingSession.RecordingSession(el_tracker) as session:
+#         time.sleep(test_secs) # or run the trial
+#         samples = session.samples.snapshot() # dict of numpy columns, no copy
+#     print(samples['time'][-1], samples['gaze_x'][-1])
+
+import threading
+import time
+import numpy as np
+import pylink
+
+
+class ColumnBuffer(object):
+    '''
+    Growable column store (arrays doubled when full), appended from one thread.
+    snapshot() returns views on the rows so far, never rewritten; error, set when the
+    filling thread died, is raised by snapshot() and newest().
+    '''
+    def __init__(self, columns, capacity=4096):
+        self.columns = [name for name, dtype in columns]
+        self._arrays = dict((name, np.zeros(capacity, dtype=dtype)) for name, dtype in columns)
+        self._count = 0
+        self._lock = threading.Lock() # arrays and count seen together
+        self.error = None
+
+    def __len__(self):
+        return self._count
+
+    def append(self, *row):
+        n = self._count
+        arrays = self._arrays
+        if n == len(arrays[self.columns[0]]):
+            grown = {}
+            for name, array in arrays.items():
+                grown[name] = np.zeros(2*len(array), dtype=array.dtype)
+                grown[name][:n] = array
+            with self._lock:
+                self._arrays = arrays = grown
+        for name, value in zip(self.columns, row):
+            arrays[name][n] = value
+        self._count = n + 1
+
+    def snapshot(self, last=None):
+        ''' {column: view} of all rows, or of the last ones'''
+        if self.error is not None:
+            raise self.error
+        with self._lock:
+            arrays, n = self._arrays, self._count
+        first = 0 if last is None else max(0, n - last)
+        return dict((name, array[first:n]) for name, array in arrays.items())
+
+    def newest(self):
+        ''' {column: value} of the last row, None when empty'''
+        if self.error is not None:
+            raise self.error
+        with self._lock:
+            arrays, n = self._arrays, self._count
+        if not n:
+            return None
+        return dict((name, array[n-1].item()) for name, array in arrays.items())
+
+    def clear(self):
+        ''' empties the buffer, on new arrays: the views of earlier snapshots keep their rows'''
+        with self._lock:
+            self._arrays = dict((name, np.zeros_like(array)) for name, array in self._arrays.items())
+            self._count = 0
+
+
+sample_columns = [('time', 'f8'), ('gaze_x', 'f4'), ('gaze_y', 'f4'), ('pupil', 'f4'), ('eye', 'i1')]
+event_columns = [('type', 'i2'), ('eye', 'i1'), ('start', 'f8'), ('end', 'f8'), ('gaze_x', 'f4'), ('gaze_y', 'f4')]
+
+_eventTypes = ('STARTBLINK', 'ENDBLINK', 'STARTSACC', 'ENDSACC', 'STARTFIX', 'ENDFIX')
+
+
+def _gazeValue(v):
+    return np.nan if v == getattr(pylink, 'MISSING_DATA', -32768) else v
+
+
+class RecordingSession(object):
+    '''
+    Parameters:
+        tracker: pylink EyeLink, only used from the session thread while recording
+        poll_interval: seconds slept between two link drains
+        source: 'queue' (every sample and event, getNextData()) or 'newest' (getNewestSample())
+        file_samples, file_events, link_samples, link_events: startRecording() arguments
+    samples and events are ColumnBuffers filled while recording, stats counts the drains and rows.
+    An exception on the session thread stops it, kept in error and raised by stop().
+    '''
+    def __init__(self, tracker, poll_interval=0.002, source='queue',
+                 file_samples=1, file_events=1, link_samples=1, link_events=1):
+        if source not in ('queue', 'newest'):
+            raise ValueError('unknown source %r'%source)
+        self.tracker = tracker
+        self.poll_interval = poll_interval
+        self.source = source
+        self._recordingArgs = (file_samples, file_events, link_samples, link_events)
+        self.samples = ColumnBuffer(sample_columns)
+        self.events = ColumnBuffer(event_columns)
+        self.stats = dict(polls=0, samples=0, events=0)
+        self._eventCodes = set(getattr(pylink, name) for name in _eventTypes if hasattr(pylink, name))
+        self.error = None
+        self._lastTime = None
+        self._clockOffset = None # local ms - tracker ms, see tracker_time()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        error = self.tracker.startRecording(*self._recordingArgs)
+        if error:
+            raise RuntimeError('startRecording failed (%r)'%error)
+        self.tracker.waitForBlockStart(100, 1, 0)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='RecordingSession')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        ''' stops the thread, reads what is left on the link, then stops recording'''
+        thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stop.set()
+        thread.join()
+        if self.error is None:
+            self._drain()
+        self.tracker.stopRecording()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _loop(self):
+        try:
+            while not self._stop.is_set():
+                self._drain()
+                self._stop.wait(self.poll_interval) # releases the CPU
+        except Exception as error:
+            self.error = self.samples.error = self.events.error = error
+
+    def _drain(self):
+        self.stats['polls'] += 1
+        self._clockOffset = time.perf_counter()*1000. - self.tracker.trackerTime()
+        if self.source == 'newest':
+            sample = self.tracker.getNewestSample()
+            if sample is not None and sample.getTime() != self._lastTime:
+                self._lastTime = sample.getTime()
+                self._addSample(sample)
+            return
+        while True:
+            code = self.tracker.getNextData()
+            if not code:
+                return
+            data = self.tracker.getFloatData()
+            if code == pylink.SAMPLE_TYPE:
+                self._addSample(data)
+            elif code in self._eventCodes:
+                self._addEvent(code, data)
+
+    def _addSample(self, sample):
+        t = sample.getTime()
+        for eye, is_eye, get in [(0, sample.isLeftSample, sample.getLeftEye), (1, sample.isRightSample, sample.getRightEye)]:
+            if is_eye():
+                data = get()
+                x, y = data.getGaze()
+                self.samples.append(t, _gazeValue(x), _gazeValue(y), data.getPupilSize(), eye)
+                self.stats['samples'] += 1
+
+    def _addEvent(self, code, event):
+        gaze = (np.nan, np.nan)
+        for getter in (['getAverageGaze'] if code == getattr(pylink, 'ENDFIX', None) else []) + ['getEndGaze', 'getStartGaze']:
+            value = getattr(event, getter, lambda: None)()
+            if value is not None:
+                gaze = value
+                break
+        end = event.getEndTime() if hasattr(event, 'getEndTime') else np.nan
+        self.events.append(code, event.getEye(), event.getStartTime(), end, _gazeValue(gaze[0]), _gazeValue(gaze[1]))
+        self.stats['events'] += 1
+
+    def tracker_time(self):
+        ''' current tracker time (ms) estimated from the local clock, without calling the tracker
+        (usable from any thread), the offset being measured at each drain'''
+        if self._clockOffset is None:
+            self._clockOffset = time.perf_counter()*1000. - self.tracker.trackerTime()
+        return time.perf_counter()*1000. - self._clockOffset
+
+    def newest(self):
+        ''' last sample read, {column: value}, None before the first'''
+        return self.samples.newest()
+
+    def wait(self, secs):
+        ''' sleeps secs while the session reads the link (time.sleep, no busy loop)'''
+        time.sleep(secs)
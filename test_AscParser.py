@@ -0,0 +1,69 @@
+
+# pytest tests of AscParser on small hand written ASC files
+
+import numpy as np
+import pytest
+
+import AscParser
+
+_asc = '''** CONVERTED FROM test.edf
+MSG\t900 DISPLAY_COORDS 0 0 1919 1079
+START\t900 \tRIGHT\tSAMPLES\tEVENTS
+SAMPLES\tGAZE\tRIGHT\tRATE\t1000.00\tTRACKING\tCR
+1000\t 512.3\t 384.1\t 1000.0\t...
+1001\t   .\t   .\t    0.0\t...
+1002\t 512.0\t 384.0\t 1000.0\tI..
+1003\t 513.0\t 385.0\t 1001.0 .C.
+1004\t 514.0\t 386.0\t 1002.0 ...
+1005\t 515.0\t 387.0\t 1003.0
+MSG\t1005 TRIAL_VAR condition \xe9t\xe9
+1006\t   .\t   .\t    0.0 ...
+1007\t 516.0\t 388.0\t 1004.0\t.C.R.
+EFIX R   1000\t1005\t6\t  513.4\t  385.2\t   1002
+ESACC R  1006\t1007\t2\t  515.0\t  387.0\t  516.0\t  388.0\t  0.05\t     40
+EBLINK R 1001\t1001\t1
+END\t1008 \tSAMPLES\tEVENTS\tRES\t 40.00\t 40.00
+'''
+
+
+@pytest.fixture(params=[7, 1 << 20], ids=['small chunks', 'one chunk'])
+def columns(request, tmp_path):
+    filename = tmp_path / 'test.asc'
+    filename.write_bytes(_asc.encode('utf-8'))
+    stats = AscParser.parseAsc(str(filename), str(tmp_path / 'columns'), chunk_bytes=request.param)
+    return stats, AscParser.loadColumns(str(tmp_path / 'columns'))
+
+
+def test_samples(columns):
+    stats, data = columns
+    samples = data['samples']
+    assert sorted(samples) == sorted(AscParser.sampleColumns(AscParser.RIGHT_EYE))
+    assert stats['samples'] == 8 and stats['skipped'] == 0
+    assert np.array_equal(samples['time'], np.arange(1000, 1008))
+    assert np.allclose(samples['gaze_x'], [512.3, np.nan, 512, 513, 514, 515, np.nan, 516], equal_nan=True)
+    assert np.allclose(samples['pupil'], [1000, 0, 1000, 1001, 1002, 1003, 0, 1004])
+
+
+def test_flagged_samples_counted(columns):
+    stats, data = columns
+    assert stats['slow_lines'] == 3 # flags after a space (1003, 1004, 1006) are not cut at a tab
+    assert stats['slow_groups'] == 0
+
+
+def test_events(columns):
+    stats, data = columns
+    fixations, saccades, blinks = data['fixations'], data['saccades'], data['blinks']
+    assert len(fixations['start']) == 1 and fixations['eye'][0] == AscParser.RIGHT_EYE
+    assert (fixations['start'][0], fixations['end'][0], fixations['duration'][0]) == (1000, 1005, 6)
+    assert np.allclose([fixations['gaze_x'][0], fixations['gaze_y'][0], fixations['pupil'][0]], [513.4, 385.2, 1002])
+    assert np.allclose([saccades['end_x'][0], saccades['amplitude'][0], saccades['peak_velocity'][0]], [516, 0.05, 40])
+    assert (blinks['start'][0], blinks['duration'][0]) == (1001, 1)
+    assert list(data['recordings']['eye']) == [AscParser.RIGHT_EYE] and data['recordings']['rate'][0] == 1000
+
+
+def test_messages(columns):
+    stats, data = columns
+    messages = data['messages']
+    assert list(messages['time']) == [900, 1005]
+    assert AscParser.messageText(messages, 0) == 'DISPLAY_COORDS 0 0 1919 1079'
+    assert AscParser.messageText(messages, 1) == 'TRIAL_VAR condition \xe9t\xe9'
@@ -0,0 +1,150 @@
+
+# pytest tests of CalibrationGraphicsShady on PylinkSimulator and HeadlessShady (no tracker, no display)
+
+import numpy as np
+import pytest
+
+import PylinkSimulator
+import HeadlessShady
+PylinkSimulator.install()
+HeadlessShady.install()
+import CalibrationGraphicsShady as cgs
+
+
+def _graphics(**options):
+    win = HeadlessShady.World(size=(1920, 1080))
+    genv = cgs.CalibrationGraphics(PylinkSimulator.EyeLink(), win, audio_backend='null', **options)
+    genv.setup_cal_display()
+    return genv
+
+
+def _sendFrame(genv, frame):
+    for i, row in enumerate(frame):
+        genv.draw_image_line(frame.shape[1], i+1, frame.shape[0], row.tobytes())
+    genv.win.RenderFrame()
+
+
+def _renderShader(stim):
+    ''' what Shady draws from the stim state: the texture seen through its LUT, cropped by the
+    envelope (size and carrierTranslation) and scaled, nearest texel'''
+    crop_w, crop_h = stim.size
+    (tx, ty), (sx, sy) = stim.carrierTranslation, stim.scaling
+    x = (np.arange(int(round(crop_w*sx))) + 0.5)/sx - tx # texel coords of the pixel centers
+    y = (np.arange(int(round(crop_h*sy))) + 0.5)/sy - ty
+    texture = stim.texture
+    cols = np.clip(np.floor(x).astype(int), 0, texture.shape[1]-1)
+    rows = np.clip(np.floor(y).astype(int), 0, texture.shape[0]-1)
+    return np.round(np.asarray(stim.lut)[texture[rows][:, cols]]*255).astype(np.uint8)
+
+
+@pytest.mark.parametrize('width, totlines', [(192, 160), (384, 320), (640, 480), (160, 192)])
+def test_shader_backend_matches_numpy(width, totlines):
+    genv = _graphics()
+    genv.setup_image_display(width, totlines)
+    levels = np.arange(256)
+    genv.set_image_palette(levels, levels[::-1], levels//2)
+    frame = np.random.RandomState(0).randint(0, 256, (totlines, width)).astype(np.uint8)
+    _sendFrame(genv, frame)
+    expected = genv.eye_image.texture[..., :3].copy()
+    assert expected.shape == (480, 640, 3)
+    genv.eye_image_backend = 'shader'
+    _sendFrame(genv, frame)
+    assert genv.eye_image.texture.shape == (totlines, width)
+    assert np.array_equal(_renderShader(genv.eye_image), expected)
+    genv.eye_image_backend = 'numpy' # back to a plain texture
+    _sendFrame(genv, frame)
+    assert genv.eye_image.lut is None and list(genv.eye_image.scaling) == [1., 1.]
+    assert np.array_equal(genv.eye_image.texture[..., :3], expected)
+
+
+def test_uploaded_eye_image_survives_next_frame():
+    genv = _graphics()
+    genv.setup_image_display(192, 160)
+    levels = np.arange(256)
+    genv.set_image_palette(levels, levels, levels)
+    for backend in ('numpy', 'shader'):
+        genv.eye_image_backend = backend
+        _sendFrame(genv, np.full((160, 192), 10, np.uint8))
+        first = genv.eye_image.texture
+        _sendFrame(genv, np.full((160, 192), 20, np.uint8))
+        assert first.flat[0] == 10 and genv.eye_image.texture.flat[0] == 20
+
+
+@pytest.mark.parametrize('key, modifiers, keycode, mod', [
+    ('return', '', PylinkSimulator.ENTER_KEY, 0), ('up', '', PylinkSimulator.CURS_UP, 0),
+    ('f1', '', PylinkSimulator.F1_KEY, 0), ('escape', '', PylinkSimulator.ESC_KEY, 0),
+    ('c', '', ord('c'), 0), ('space', '', ord(' '), 0), ('C', 'shift', ord('C'), 0x0001),
+    ('a', 'ctrl+alt', ord('a'), 0x0140), ('lshift', 'shift', PylinkSimulator.JUNK_KEY, 0x0001)])
+def test_key_translation(key, modifiers, keycode, mod):
+    genv = _graphics()
+    genv.win.HandleEvent('key_press', key=key, modifiers=modifiers)
+    keys = genv.get_input_key()
+    assert [(k.key, k.mod) for k in keys] == [(keycode, mod)]
+    assert genv.get_input_key() is None
+
+
+def test_world_keys():
+    genv = _graphics()
+    genv.win.HandleEvent('key_press', key='a')
+    assert [k.key for k in genv.win.keys] == [ord('a')]
+    genv.win.keys.append(PylinkSimulator.KeyInput(ord('b'))) # as the former scripts did
+    assert [k.key for k in genv.get_input_key()] == [ord('a'), ord('b')]
+    assert genv.win.keys == []
+    for i in range(70): # bounded queue, oldest keys dropped
+        genv.win.HandleEvent('key_press', key='x')
+    assert len(genv.win.keys) == 64 and genv.win.input_queue.dropped == 6
+
+
+def test_palette_lut():
+    palette = cgs.ImagePalette()
+    palette.set_palette([10, 20, 300], [30, 40, -5], [50, 60, 70])
+    assert palette.size == 3 and palette.version == 1
+    frame = np.array([[0, 1], [2, 255]], np.uint8)
+    image = palette.apply(frame)
+    assert image.shape == (2, 2, 4)
+    assert image.tolist() == [[[10, 30, 50, 255], [20, 40, 60, 255]], [[255, 0, 70, 255], [0, 0, 0, 255]]]
+    assert np.allclose(palette.get_rgb_table()[1], [20/255., 40/255., 60/255.])
+
+
+def _fitReference(image, width, height):
+    ''' nearest neighbour crop and resize, as ImageOps.fit()'''
+    left, top, crop_w, crop_h = cgs._fitCrop(image.shape[1], image.shape[0], width, height)
+    cols = np.floor(left + (np.arange(width) + 0.5)*crop_w/width).astype(int)
+    rows = np.floor(top + (np.arange(height) + 0.5)*crop_h/height).astype(int)
+    return image[rows][:, cols]
+
+
+@pytest.mark.parametrize('shape', [(160, 192), (320, 384), (480, 640), (160, 192, 4)])
+def test_resampler_nearest(shape):
+    image = np.random.RandomState(1).randint(0, 256, shape).astype(np.uint8)
+    out = cgs.ImageResampler('nearest').resample(image, (640, 480))
+    assert out.shape == (480, 640) + shape[2:]
+    assert np.array_equal(out, _fitReference(image, 640, 480))
+
+
+def test_resampler_bilinear_and_replicate():
+    resampler = cgs.ImageResampler()
+    ramp = np.tile(np.arange(0, 256, 4, dtype=np.uint8), (48, 1)) # 48 x 64, +4 per column
+    smooth = resampler.resample(ramp, (128, 96), mode='bilinear').astype(int)
+    assert smooth.shape == (96, 128) and (smooth == smooth[0]).all()
+    assert np.all(np.diff(smooth[0]) >= 0) and np.abs(np.diff(smooth[0])).max() <= 2
+    blocks = resampler.resample(ramp, (128, 96), mode='replicate')
+    assert np.array_equal(blocks, np.repeat(np.repeat(ramp, 2, axis=0), 2, axis=1))
+    with pytest.raises(ValueError):
+        resampler.resample(ramp, (100, 100), mode='cubic')
+
+
+def test_frame_commit_drops_aborted_changes():
+    win = HeadlessShady.World(size=(800, 600))
+    commit = cgs._getFrameCommit(win)
+    stim = win.Stimulus(visible=False, x=0)
+    with pytest.raises(RuntimeError):
+        with commit:
+            commit.set(stim, visible=True)
+            raise RuntimeError('callback failed')
+    with commit:
+        commit.set(stim, x=10)
+        assert stim.x != 10 # staged until the next frame
+    win.RenderFrame()
+    assert stim.x == 10 and not stim.visible
+    assert commit.stats['aborted'] == 1
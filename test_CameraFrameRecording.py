@@ -0,0 +1,51 @@
+
+# pytest tests of the camera frame ring file
+
+import numpy as np
+
+import CameraFrameRecording
+
+
+def _frame(i, width=192, height=160):
+    return ((np.arange(width*height) + i) % 256).astype(np.uint8).reshape(height, width)
+
+
+def test_round_trip(tmp_path):
+    filename = str(tmp_path / 'setup.cgsrec')
+    recorder = CameraFrameRecording.CameraFrameRecorder(filename, slots=4, max_frame_size=(384, 320))
+    gray = np.repeat(np.arange(256, dtype=np.uint8)[:, None], 3, axis=1)
+    recorder.set_palette(gray)
+    lines = np.array([[1, 0., 0., 10., 10.], [-5, 20., 30., 40., 50.]], dtype=np.float32)
+    recorder.append_frame(_frame(0), 1.0, lines)
+    recorder.append_frame(_frame(1, 384, 320), 1.5)
+    recorder.close()
+    reader = CameraFrameRecording.CameraFrameReader(filename)
+    assert len(reader) == 2 and list(reader.times) == [1.0, 1.5]
+    assert np.array_equal(reader.frame(0), _frame(0)) and np.array_equal(reader.frame(1), _frame(1, 384, 320))
+    assert np.array_equal(reader.lines(0), lines) and len(reader.lines(1)) == 0
+    assert np.array_equal(reader.image(0), gray[_frame(0)])
+
+
+def test_ring_keeps_the_newest_frames(tmp_path):
+    filename = str(tmp_path / 'setup.cgsrec')
+    recorder = CameraFrameRecording.CameraFrameRecorder(filename, slots=3, max_frame_size=(192, 160), max_palettes=2)
+    for i in range(7):
+        if i in (0, 5):
+            recorder.set_palette(np.full((256, 3), i, np.uint8))
+        recorder.append_frame(_frame(i), float(i))
+    recorder.close()
+    reader = CameraFrameRecording.CameraFrameReader(filename)
+    assert list(reader.times) == [4., 5., 6.] # oldest first
+    for (t, frame, palette, lines), i in zip(reader, (4, 5, 6)):
+        assert np.array_equal(frame, _frame(i))
+        assert palette[0, 0] == (0 if i < 5 else 5)
+
+
+def test_larger_frames_skipped(tmp_path):
+    filename = str(tmp_path / 'setup.cgsrec')
+    recorder = CameraFrameRecording.CameraFrameRecorder(filename, slots=2, max_frame_size=(192, 160))
+    recorder.append_frame(_frame(0, 384, 320), 0.)
+    recorder.append_frame(_frame(1), 1.)
+    recorder.close()
+    assert recorder.skipped == 1
+    assert list(CameraFrameRecording.CameraFrameReader(filename).times) == [1.]
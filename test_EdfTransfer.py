@@ -0,0 +1,51 @@
+
+# pytest tests of EdfTransfer on a PylinkSimulator tracker
+
+import os
+import stat
+
+import pytest
+
+import PylinkSimulator
+import EdfTransfer
+
+
+def _tracker(size=3 << 20, rate=None):
+    tracker = PylinkSimulator.EyeLink(data_file_size=size, transfer_rate=rate)
+    tracker.openDataFile('test.edf')
+    tracker.closeDataFile()
+    return tracker
+
+
+def test_received_then_renamed(tmp_path):
+    dest = str(tmp_path / 'data' / 'test.edf')
+    os.mkdir(os.path.dirname(dest))
+    reports = []
+    transfer = EdfTransfer.EdfTransfer(_tracker(rate=30e6), 'test.edf', dest, progress=reports.append, interval=0.01)
+    assert transfer.start() is transfer
+    assert transfer.wait() == 3 << 20
+    assert os.path.getsize(dest) == 3 << 20
+    assert os.listdir(os.path.dirname(dest)) == ['test.edf'] # no temporary file left
+    assert reports[-1].done and reports[-1].bytes == reports[-1].total == 3 << 20
+    assert all(a.bytes <= b.bytes for a, b in zip(reports, reports[1:]))
+    assert 'received' in transfer.describe()
+
+
+def test_mode_follows_the_umask(tmp_path):
+    dest = str(tmp_path / 'test.edf')
+    umask = os.umask(0o027)
+    try:
+        EdfTransfer.EdfTransfer(_tracker(), 'test.edf', dest).start().wait()
+    finally:
+        os.umask(umask)
+    assert stat.S_IMODE(os.stat(dest).st_mode) == 0o640
+
+
+def test_failure_leaves_nothing(tmp_path):
+    dest = str(tmp_path / 'test.edf')
+    with pytest.raises(RuntimeError):
+        with EdfTransfer.EdfTransfer(_tracker(), 'other.edf', dest) as transfer: # not the data file
+            pass
+    assert transfer.error is not None and transfer.progress().done
+    assert os.listdir(str(tmp_path)) == []
+    assert transfer.describe() == 'other.edf: transfer failed'
@@ -0,0 +1,56 @@
+
+# pytest tests of GazeClassifier on synthetic gaze traces
+
+import numpy as np
+
+import GazeClassifier
+
+
+def _trace():
+    ''' 1000 Hz: fixation at (100, 100) for 200 ms, 20 ms saccade to (500, 100), fixation for 200 ms'''
+    t = np.arange(420.)
+    x = np.where(t < 200, 100., np.where(t < 220, 100. + (t - 199)*20., 500.))
+    return t, x, np.full(t.shape, 100.)
+
+
+def _kinds(events):
+    return [event.kind for event in events]
+
+
+def test_fixation_saccade_fixation():
+    classifier = GazeClassifier.GazeClassifier(sample_rate=1000, pixels_per_degree=40, window=1)
+    events = classifier.update(*_trace())
+    assert _kinds(events) == ['fixation_start', 'fixation_end', 'saccade_start', 'saccade_end', 'fixation_start']
+    start, end, saccade_start, saccade_end, second = events
+    assert start.time == 1 and start.detected == 51 and (start.x, start.y) == (100, 100)
+    assert end.time == 199 and saccade_start.time == 200
+    assert saccade_end.time == 219 and saccade_end.x == 500
+    assert second.time == 220 and second.x == 500
+    assert classifier.fixating and classifier.fixation == (220, 500, 100)
+
+
+def test_chunks_give_the_same_events():
+    t, x, y = _trace()
+    whole = GazeClassifier.GazeClassifier(window=3).update(t, x, y)
+    classifier = GazeClassifier.GazeClassifier(window=3)
+    chunked = []
+    for a in range(0, len(t), 17): # as many samples as arrive between two frames
+        chunked += classifier.update(t[a:a+17], x[a:a+17], y[a:a+17])
+    assert chunked == whole
+
+
+def test_missing_samples_end_the_fixation():
+    t, x, y = _trace()
+    x[100:130] = np.nan # blink
+    classifier = GazeClassifier.GazeClassifier(window=1)
+    events = classifier.update(t[:200], x[:200], y[:200])
+    assert _kinds(events) == ['fixation_start', 'fixation_end', 'fixation_start']
+    assert events[1].time == 99 and events[2].time == 131
+
+
+def test_slow_drift_splits_fixations():
+    t = np.arange(400.)
+    classifier = GazeClassifier.GazeClassifier(pixels_per_degree=40, max_dispersion=1.5)
+    events = classifier.update(t, 100 + t*0.25, np.full(t.shape, 100.)) # 6 deg/s, under the threshold
+    assert _kinds(events) == ['fixation_start', 'fixation_end', 'fixation_start']
+    assert events[1].time < events[2].time